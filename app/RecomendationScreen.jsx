@@ -218,27 +218,20 @@ const RecommendationScreen = () => {
         return;
       }
 
-      // Step 1: Call /predict_pre_therapy with responses to get condition
-      console.log('Sending to /predict_pre_therapy:', parsedResponses);
-      const preTherapyResponse = await axios.post(`${API_URL}/predict_pre_therapy`, {
+      // Predict the condition and fetch the recommendation in one round trip
+      console.log('Sending to /assess:', parsedResponses);
+      const therapyResponse = await axios.post(`${API_URL}/assess`, {
         responses: parsedResponses,
       }, {
         headers: { 'Content-Type': 'application/json' },
       });
 
-      if (preTherapyResponse.status !== 200 || !preTherapyResponse.data.condition) {
+      if (therapyResponse.status !== 200 || !therapyResponse.data.condition) {
         throw new Error('Failed to fetch condition from pre-therapy prediction');
       }
 
-      const condition = preTherapyResponse.data.condition;
+      const condition = therapyResponse.data.condition;
       console.log('Predicted condition:', condition);
-
-      // Step 2: Call /recommend_therapy with condition to get therapy recommendation
-      const therapyResponse = await axios.post(`${API_URL}/recommend_therapy`, {
-        condition,
-      }, {
-        headers: { 'Content-Type': 'application/json' },
-      });
        console.log("Therapy API raw response:", therapyResponse.data);
         if (!therapyResponse.data.environmentId) {
         console.error("environmentId is missing from backend response"); 
@@ -1,27 +1,33 @@
-from flask import Flask, request, jsonify, send_from_directory, make_response
+from flask import Flask, request, jsonify, send_from_directory, make_response, g, redirect
+from werkzeug.wsgi import wrap_file
 from flask_cors import CORS
-import joblib
-from deepface import DeepFace
-from transformers import pipeline
-import cv2
 import numpy as np
 import firebase_admin
-from firebase_admin import credentials, firestore
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-import httplib2
-import ssl
-from googleapiclient.http import HttpRequest
-import requests
-from google.auth.transport.requests import Request as GoogleAuthRequest
-from google_auth_httplib2 import AuthorizedHttp
+from firebase_admin import credentials
 import os
-import json
+import sys
+import hmac
 import logging
-import certifi
-from google.oauth2 import service_account
-from googleapiclient.http import MediaIoBaseDownload
-import io
+import tempfile
+from environment_catalog import EnvironmentCatalog
+from batching import MicroBatcher
+from sentiment_backends import SENTIMENT_MODEL, load_sentiment_classifier
+from result_cache import ResultCache
+from emotion import aggregate_emotions
+from vision_pool import Overloaded, VisionPool
+from image_preprocessing import ImageTooLarge, InvalidImage
+from uploads import LengthRequired, UnsupportedMediaType, read_image_upload, read_image_uploads
+from questionnaire import QuestionnaireEncoder, QuestionnaireError
+from jobs import JobQueueFull, JobRunner, MemoryJobStore, SqliteJobStore
+from model_registry import ModelRegistry
+from model_store import MANIFEST_NAME, ModelStore
+from model_reload import ModelReloader, ModelSet, files_signature
+from instrumentation import Instrumentation
+from drive_media import (DRIVE_ROOT_URL, DriveMediaResolver, DriveUnavailable, MediaNotFound, drive_file_id,
+                         linked_file_ids, load_drive_credentials)
+from media_cache import MediaCache, MediaStalled, MediaTooLarge
+from metrics import MetricFamily, SqliteMetricStore
+from serialization import json_provider_class, parse_fields, select_fields
 
 
 app = Flask(__name__)
@@ -36,157 +42,650 @@ CORS(app, resources={r"/*": {
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Firebase
-cred = credentials.Certificate('../firebase/mental-health-app-68c4b-firebase-adminsdk-fbsvc-18a9b4b239.json')
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Named spans per route stage -> Server-Timing header and /metrics histograms
+instrumentation = Instrumentation(app)
+span = instrumentation.span
 
-# Load models
-pre_therapy_model = joblib.load("models/pre_therapy_model.pkl")
-therapy_model = joblib.load("models/therapy_model (1).pkl")
-sentiment_classifier = pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
+# orjson unless JSON_PROVIDER=stdlib (or orjson is not installed)
+class TimedJSONProvider(json_provider_class(os.environ.get("JSON_PROVIDER", "orjson"))):
+    def response(self, *args, **kwargs):
+        with span("serialize"):
+            return super().response(*args, **kwargs)
 
-# Load label encoder
-label_encoder = joblib.load("models/label_encoder.pkl")
-therapy_label_encoder = joblib.load("models/therapy_label_encoder.pkl")
+app.json = TimedJSONProvider(app)
 
-# Define all possible conditions from label encoder
-ALL_CONDITIONS = list(label_encoder.classes_)
+# Initialize Firebase; the Firestore client is created when the catalog is first needed
+cred = credentials.Certificate('../firebase/mental-health-app-68c4b-firebase-adminsdk-fbsvc-18a9b4b239.json')
+firebase_admin.initialize_app(cred)
 
-# Categorical mappings
-categorical_mappings = {
-    "High": 3, "Medium": 2, "Low": 1, "No": 0, "Yes": 1,
-    "Poor": 1, "Good": 3, "True": 1, "False": 0
-}
+# Models and clients load on first use of a route that needs them.
+# MODEL_WARM_UP=background loads them all once the server is up, =eager before serving.
+models = ModelRegistry()
+
+# Versioned, checksummed artifacts (see migrate_models.py); legacy pickles if there is no manifest
+MODEL_STORE_DIR = os.environ.get("MODEL_STORE_DIR", "models/store")
+LEGACY_MODEL_PATHS = (
+    "models/pre_therapy_model.pkl", "models/label_encoder.pkl",
+    "models/therapy_model (1).pkl", "models/therapy_label_encoder.pkl",
+)
+
+def load_model_set():
+    if ModelStore.exists(MODEL_STORE_DIR):
+        return ModelSet.from_store(MODEL_STORE_DIR, strict_versions=os.environ.get("MODEL_STORE_STRICT") == "1")
+    logger.warning(f"No model store manifest in {MODEL_STORE_DIR}, loading legacy pickles from models/")
+    return ModelSet.from_legacy(*LEGACY_MODEL_PATHS)
+
+def model_files_signature():
+    if ModelStore.exists(MODEL_STORE_DIR):
+        return files_signature([os.path.join(MODEL_STORE_DIR, MANIFEST_NAME)])
+    return files_signature(LEGACY_MODEL_PATHS)
+
+# Questionnaire schema compiled once into lookup tables
+questionnaire_encoder = QuestionnaireEncoder()
+PREDICT_BATCH_MAX_ROWS = int(os.environ.get("PREDICT_BATCH_MAX_ROWS", "10000"))
+# Larger batches are scored by the sklearn forest, which overtakes the compiled one (see bench_forest.py)
+PREDICT_SKLEARN_MIN_ROWS = int(os.environ.get("PREDICT_SKLEARN_MIN_ROWS", "1000"))
+
+# Prediction and recommendation models, swapped atomically on reload. A new set is
+# validated on smoke-test questionnaires first; MODEL_WATCH_INTERVAL=0 disables the file watcher.
+model_reloader = ModelReloader(
+    load_model_set,
+    validate=lambda model_set: model_set.validate(questionnaire_encoder),
+    signature=model_files_signature,
+    poll_interval=float(os.environ.get("MODEL_WATCH_INTERVAL", "10")),
+)
+
+# SENTIMENT_BACKEND=onnx serves the quantized ONNX export without importing torch
+sentiment_backend = os.environ.get("SENTIMENT_BACKEND", "torch")
+
+def load_sentiment():
+    return load_sentiment_classifier(
+        sentiment_backend,
+        onnx_dir=os.environ.get("SENTIMENT_ONNX_DIR", "models/sentiment_onnx"),
+    )
+
+def load_sentiment_cache():
+    # Results keyed by normalised text; SENTIMENT_CACHE_PATH shares them across workers
+    sentiment_model_id = f"{sentiment_backend}:{getattr(models.get('sentiment'), 'model_id', SENTIMENT_MODEL)}"
+    return ResultCache(
+        sentiment_model_id,
+        max_entries=int(os.environ.get("SENTIMENT_CACHE_ENTRIES", "10000")),
+        max_bytes=int(os.environ.get("SENTIMENT_CACHE_BYTES", str(4 * 1024 * 1024))),
+        disk_path=os.environ.get("SENTIMENT_CACHE_PATH"),
+    )
+
+def load_environment_catalog():
+    from firebase_admin import firestore
+
+    # In-memory view of the environments collection, kept current by a snapshot listener
+    catalog = EnvironmentCatalog(
+        firestore.client().collection('environments'),
+        ttl=float(os.environ.get("ENVIRONMENT_CATALOG_TTL", "300")),
+    )
+    catalog.start()
+    return catalog
+
+# Clients may reuse an environment this long before revalidating it with If-None-Match
+ENVIRONMENT_MAX_AGE = int(os.environ.get("ENVIRONMENT_MAX_AGE", "300"))
+
+EMOTION_MAX_IMAGE_BYTES = int(os.environ.get("EMOTION_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+EMOTION_MAX_BATCH_IMAGES = int(os.environ.get("EMOTION_MAX_BATCH_IMAGES", "16"))
+# Label for the inference counter; the DeepFace emotion model has no version of its own
+EMOTION_MODEL_VERSION = "deepface-emotion"
+
+def load_vision_pool():
+    # Emotion analysis runs in a pool of worker processes, each with a preloaded
+    # model and detector; VISION_POOL_WORKERS=0 runs it in the request thread instead
+    pool = VisionPool(
+        workers=int(os.environ.get("VISION_POOL_WORKERS", "2")),
+        max_queue=int(os.environ.get("VISION_POOL_MAX_QUEUE", "8")),
+        route_limits={
+            "analyze_emotion": int(os.environ.get("EMOTION_MAX_IN_FLIGHT", "8")),
+            "analyze_emotion_batch": int(os.environ.get("EMOTION_BATCH_MAX_IN_FLIGHT", "2")),
+        },
+        timeout=float(os.environ.get("VISION_POOL_TIMEOUT", "30")),
+        detector_backend=os.environ.get("EMOTION_DETECTOR", "opencv"),
+        max_image_bytes=EMOTION_MAX_IMAGE_BYTES,
+        max_decode_side=int(os.environ.get("EMOTION_MAX_DECODE_SIDE", "1024")),
+    )
+    pool.warm_up()
+    return pool
+
+MEDIA_URL_BATCH_MAX_IDS = int(os.environ.get("MEDIA_URL_BATCH_MAX_IDS", "100"))
+
+def load_media_resolver():
+    # Drive webContentLink lookups: TTL-cached, single-flight, batched, over pooled keep-alive connections
+    root_url = os.environ.get("DRIVE_API_ROOT", DRIVE_ROOT_URL)
+    return DriveMediaResolver(
+        load_drive_credentials(os.environ.get('GOOGLE_SERVICE_ACCOUNT_KEY'), '../calmiayoutube-0446c67672c9.json',
+                               root_url),
+        ttl=float(os.environ.get("DRIVE_URL_TTL", "3600")),
+        pool_size=int(os.environ.get("DRIVE_HTTP_POOL_SIZE", "4")),
+        timeout=float(os.environ.get("DRIVE_HTTP_TIMEOUT", "10")),
+        root_url=root_url,
+    )
+
+MEDIA_MAX_AGE = int(os.environ.get("MEDIA_MAX_AGE", "86400"))
+# Files /media serves besides those linked from environments (comma-separated Drive IDs)
+MEDIA_EXTRA_FILE_IDS = frozenset(filter(None, os.environ.get("MEDIA_EXTRA_FILE_IDS", "").split(",")))
+
+def load_media_cache():
+    # Drive media proxied through a shared on-disk LRU; every worker on the host uses the same directory
+    max_bytes = int(os.environ.get("MEDIA_CACHE_BYTES", str(2 * 1024 ** 3)))
+    return MediaCache(
+        os.environ.get("MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "mycalmia-media")),
+        origin=models.get("media_resolver"),
+        max_bytes=max_bytes,
+        max_file_bytes=int(os.environ.get("MEDIA_CACHE_MAX_FILE_BYTES", str(max_bytes // 4))),
+        ttl=float(os.environ.get("MEDIA_CACHE_TTL", "86400")),
+        # While Drive is unreachable, expired files are served from the cache and rechecked this often
+        revalidate_retry=float(os.environ.get("MEDIA_CACHE_REVALIDATE_RETRY", "60")),
+    )
+
+models.register("model_set", model_reloader.ensure_loaded)
+# onnxruntime sessions own native thread pools that do not survive fork()
+models.register("sentiment", load_sentiment, fork_safe=sentiment_backend != "onnx")
+# Clients, sockets, threads and process pools belong to the process that made them
+models.register("sentiment_cache", load_sentiment_cache, fork_safe=False)
+models.register("environment_catalog", load_environment_catalog, fork_safe=False)
+models.register("vision_pool", load_vision_pool, fork_safe=False)
+models.register("media_resolver", load_media_resolver, fork_safe=False)
+models.register("media_cache", load_media_cache, fork_safe=False)
+
+# Batch concurrent /sentiment requests into a single forward pass
+def classify_sentiment_batch(texts):
+    return models.get("sentiment")(texts, batch_size=len(texts), truncation=True)
+
+# Per-process threads, created by start_services()
+sentiment_batcher = None
+job_store = None
+job_runner = None
+async_jobs_enabled = False
+
+
+def start_services(worker_processes=None):
+    """Start the per-process threads and kick off model warm-up.
+
+    Background threads do not survive fork().  Normally this runs at import;
+    under the preload profile (gunicorn_preload.py) the master only loads the
+    fork-safe models and each worker calls this after it is forked, passing
+    the configured number of workers.
+    """
+    global sentiment_batcher, job_store, job_runner, async_jobs_enabled
+
+    sentiment_batcher = MicroBatcher(
+        classify_sentiment_batch,
+        max_batch_size=int(os.environ.get("SENTIMENT_MAX_BATCH_SIZE", "32")),
+        max_wait_ms=float(os.environ.get("SENTIMENT_MAX_WAIT_MS", "5")),
+        name="sentiment-batcher",
+    )
+
+    # Opt-in async emotion jobs. A poll can land on any worker, so several workers
+    # share a SQLite store (JOB_STORE_PATH, by default in the temp directory).
+    if worker_processes is None:
+        worker_processes = int(os.environ.get("WEB_CONCURRENCY", "1"))
+    job_store_path = os.environ.get("JOB_STORE_PATH")
+    if not job_store_path and worker_processes > 1:
+        job_store_path = os.path.join(tempfile.gettempdir(), "mycalmia-jobs.sqlite3")
+    # In-process results are only safe when this is the only process: not under a gunicorn
+    # whose worker count we were not told
+    async_jobs_enabled = bool(job_store_path) or (
+        worker_processes == 1 and ("gunicorn" not in sys.modules or "WEB_CONCURRENCY" in os.environ))
+    if job_store_path:
+        job_store = SqliteJobStore(job_store_path, ttl=float(os.environ.get("JOB_TTL", "600")))
+    else:
+        job_store = MemoryJobStore(
+            max_jobs=int(os.environ.get("JOB_MAX_ENTRIES", "1000")), ttl=float(os.environ.get("JOB_TTL", "600"))
+        )
+    job_runner = JobRunner(
+        job_store,
+        workers=int(os.environ.get("JOB_WORKERS", "4")),
+        max_pending=int(os.environ.get("JOB_MAX_PENDING", "64")),
+    )
+
+    # Each worker counts its own requests; several combine them for /metrics in a SQLite
+    # file (METRICS_STORE_PATH, by default in the temp directory)
+    metrics_store_path = os.environ.get("METRICS_STORE_PATH")
+    if not metrics_store_path and (worker_processes > 1 or "gunicorn" in sys.modules):
+        metrics_store_path = os.path.join(tempfile.gettempdir(), "mycalmia-metrics.sqlite3")
+    if metrics_store_path:
+        # Workers of one gunicorn master share its pid as their parent
+        instrumentation.share(SqliteMetricStore(metrics_store_path, group=os.getppid()),
+                              flush_interval=float(os.environ.get("METRICS_FLUSH_INTERVAL", "1")))
+
+    model_reloader.start_watching()
+
+    warm_up = os.environ.get("MODEL_WARM_UP", "lazy")
+    if warm_up == "eager":
+        models.warm_up()
+    elif warm_up == "background":
+        models.warm_up_in_background()
+    logger.info(f"Services started in process {os.getpid()} (model warm-up: {warm_up}, "
+                f"job store: {job_store_path or 'memory'}{'' if async_jobs_enabled else ', async jobs disabled'}, "
+                f"metrics store: {metrics_store_path or 'none'})")
+
+
+# DEFER_SERVICES=1 is set by gunicorn_preload.py, which calls start_services() post-fork
+if os.environ.get("DEFER_SERVICES") != "1":
+    start_services()
 
 @app.route("/", methods=["GET"])
 def home():
     return jsonify({"message": "Welcome to MyCalmia API"})
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    # Only components that have been loaded; reading stats never triggers a load
+    payload = {"models": models.stats(), "sentiment_batcher": sentiment_batcher.stats(), "jobs": job_runner.stats(),
+               "model_set": model_reloader.stats()}
+    for name in ("environment_catalog", "sentiment_cache", "vision_pool", "media_resolver", "media_cache"):
+        component = models.peek(name)
+        if component is not None:
+            payload[name] = component.stats()
+    return jsonify(payload)
+
+def model_metric_families():
+    # The serving model versions as an info-style gauge, summed over workers, and reload outcomes
+    model_info = MetricFamily("mycalmia_model_info", "Worker processes serving each model version.", "gauge",
+                              ("model", "version"))
+    model_set = model_reloader.current
+    if model_set is not None:
+        for name, version in model_set.versions.items():
+            model_info.labels(name, version).set(1)
+    reloads = MetricFamily("mycalmia_model_reloads_total", "Model set reloads by outcome.", "counter", ("outcome",))
+    reload_stats = model_reloader.stats()
+    reloads.labels("success").inc(reload_stats["reloads"])
+    reloads.labels("failure").inc(reload_stats["failed_reloads"])
+    return [model_info, reloads]
+
+instrumentation.add_collector(model_metric_families)
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Prometheus text format, totals over all workers when they share a metrics store
+    return app.response_class(instrumentation.render(), mimetype="text/plain; version=0.0.4")
+
+class RequestError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def current_model_set():
+    # Pinned for the whole request, so a reload mid-request cannot mix model versions
+    if "model_set" not in g:
+        with span("load_models"):
+            g.model_set = models.get("model_set").current
+    return g.model_set
+
+@app.after_request
+def add_model_versions(response):
+    if "model_set" in g:
+        response.headers["X-Model-Versions"] = ", ".join(
+            f"{name}={version}" for name, version in sorted(g.model_set.versions.items())
+        )
+    return response
+
+MODEL_ADMIN_TOKEN = os.environ.get("MODEL_ADMIN_TOKEN")
+
+def admin_authorized():
+    supplied = request.headers.get("Authorization", "")
+    return MODEL_ADMIN_TOKEN and hmac.compare_digest(supplied, f"Bearer {MODEL_ADMIN_TOKEN}")
+
+@app.route("/admin/models", methods=["GET"])
+def admin_models():
+    if not MODEL_ADMIN_TOKEN:
+        return jsonify({"error": "Model admin endpoints are disabled"}), 404
+    if not admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({"pid": os.getpid(), **model_reloader.stats()})
+
+@app.route("/admin/models/reload", methods=["POST"])
+def admin_reload_models():
+    # Reloads this worker in the background; the file watcher brings the other workers along
+    if not MODEL_ADMIN_TOKEN:
+        return jsonify({"error": "Model admin endpoints are disabled"}), 404
+    if not admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    if not model_reloader.reload_in_background("admin request"):
+        return jsonify({"error": "A model reload is already in progress"}), 409
+    return jsonify({"status": "reloading", "statusUrl": "/admin/models"}), 202
+
+def pre_therapy_version(model_set):
+    return model_set.versions.get("pre_therapy_compiled") or model_set.versions.get("pre_therapy_model")
+
+def predict_condition(responses):
+    """Validate the 15 questionnaire answers and return the predicted condition."""
+    logger.info(f"Received responses: {responses}")
+    if isinstance(responses, list) and len(responses) != 15:
+        logger.error(f"Expected 15 responses, got {len(responses)}")
+        raise RequestError(f"Expected 15 responses, got {len(responses)}")
+
+    # Validate and encode with the precompiled questionnaire schema
+    try:
+        with span("encode"):
+            processed_responses = questionnaire_encoder.encode(responses)
+    except QuestionnaireError as e:
+        logger.error(f"Invalid responses {responses}: {str(e)}")
+        raise RequestError(str(e))
+
+    model_set = current_model_set()
+    try:
+        with span("predict"):
+            prediction = model_set.pre_therapy_model.predict(processed_responses)[0]
+        prediction = int(prediction)
+        instrumentation.count_inference("pre_therapy", pre_therapy_version(model_set))
+    except Exception as pred_err:
+        logger.error(f"Model prediction error: {str(pred_err)}")
+        raise RequestError(f"Model prediction error: {str(pred_err)}", 500)
+
+    conditions = model_set.conditions
+    if prediction < 0 or prediction >= len(conditions):
+        logger.error(f"Prediction index {prediction} out of range")
+        raise RequestError("Prediction index out of range", 500)
+
+    condition = conditions[prediction]
+    logger.info(f"Predicted condition: {condition}")
+    return condition
+
+def requested_fields(payload):
+    # ?fields=environmentId,environment.title trims the payload to what the client renders
+    return select_fields(payload, parse_fields(request.args.get("fields")))
+
+def recommend_for_condition(condition, embed_environment=True):
+    """Return the therapy recommendation payload, including the environment document.
+
+    Without ``embed_environment`` only its ETag is sent; the client fetches the
+    document from ``/environments/<id>`` (or reuses its cached copy).
+    """
+    logger.info(f"[Backend] Received condition: {condition}")
+
+    if not condition:
+        raise RequestError("Missing condition in request")
+
+    model_set = current_model_set()
+    if condition not in model_set.conditions:
+        raise RequestError(f"Condition '{condition}' not valid")
+
+    # Look up the environment ID precomputed from therapy_model
+    with span("lookup"):
+        environment_id = model_set.environment_table.get(condition)
+
+    logger.info(f"[Backend] Looked up environmentId: {environment_id}")
+
+    # Fetch environment data from the in-memory catalog
+    with span("catalog"):
+        environment_catalog = models.get("environment_catalog")
+        environment_entry = environment_catalog.entry(environment_id)
+
+        if environment_entry is None:
+            logger.warning(f"[Backend] Environment '{environment_id}' not found. Falling back to 'forest'")
+            environment_id = 'forest'
+            environment_entry = environment_catalog.entry(environment_id)
+
+    if environment_entry is None:
+        logger.error("[Backend] Even fallback environment 'forest' not found.")
+        raise RequestError("No valid environment found", 500)
+
+    environment_data, environment_etag = environment_entry
+    # ✅ FINAL RESPONSE: Make sure environmentId is camelCase and present
+    if not embed_environment:
+        return {
+            "therapy": f"{condition} Therapy",
+            "environmentId": environment_id,
+            "environmentETag": f'"{environment_etag}"'
+        }
+    return {
+        "therapy": f"{condition} Therapy",
+        "environmentId": environment_id,
+        "environment": environment_data
+    }
+
 @app.route("/predict_pre_therapy", methods=["POST"])
 def predict_pre_therapy():
     try:
-        responses = request.json["responses"]
-        logger.info(f"Received responses: {responses}")
-        if not isinstance(responses, list):
-            logger.error(f"'responses' is not a list: {type(responses)}")
-            return jsonify({"error": "'responses' must be a list"}), 400
-        if len(responses) != 15:
-            logger.error(f"Expected 15 responses, got {len(responses)}")
-            return jsonify({"error": f"Expected 15 responses, got {len(responses)}"}), 400
-
-        # Preprocess responses
-        processed_responses = []
-        expected_types = [
-            "scale", "binary", "binary", "binary", "categorical",
-            "categorical", "binary", "binary", "binary", "binary",
-            "binary", "numeric", "binary", "numeric", "numeric"
-        ]
-        
-        for i, (response, exp_type) in enumerate(zip(responses, expected_types)):
-            if exp_type in ["numeric", "scale"]:
-                if not isinstance(response, (int, float)) or response < 1 or response > 10:
-                    logger.error(f"Response at index {i} is not a valid numeric/scale value (1-10): {response}")
-                    return jsonify({"error": f"Response at index {i} must be numeric between 1 and 10"}), 400
-                processed_responses.append(response)
-            elif exp_type == "categorical":
-                if isinstance(response, str):
-                    normalized_response = next(
-                        (key for key in categorical_mappings if key.lower() == response.lower()), None
-                    )
-                    if normalized_response:
-                        processed_responses.append(categorical_mappings[normalized_response])
-                    else:
-                        logger.error(f"Response at index {i} is not a valid categorical value: {response}. Expected one of: {list(categorical_mappings.keys())}")
-                        return jsonify({"error": f"Response at index {i} must be one of {list(categorical_mappings.keys())}"}), 400
-                else:
-                    logger.error(f"Response at index {i} is not a valid categorical value: {response}. Expected one of: {list(categorical_mappings.keys())}")
-                    return jsonify({"error": f"Response at index {i} must be one of {list(categorical_mappings.keys())}"}), 400
-            elif exp_type == "binary":
-                if isinstance(response, str):
-                    normalized_response = response.lower()
-                    if normalized_response in ["yes", "true"]:
-                        processed_responses.append(categorical_mappings["Yes"])
-                    elif normalized_response in ["no", "false"]:
-                        processed_responses.append(categorical_mappings["No"])
-                    else:
-                        logger.error(f"Response at index {i} is not a valid binary value: {response}. Expected 'Yes', 'No', 'True', 'False', 0, or 1.")
-                        return jsonify({"error": f"Response at index {i} must be 'Yes', 'No', 'True', 'False', 0, or 1."}), 400
-                elif isinstance(response, (int, float)) and response in [0, 1]:
-                    processed_responses.append(int(response))
-                else:
-                    logger.error(f"Response at index {i} is not a valid binary value: {response}. Expected 'Yes', 'No', 'True', 'False', 0, or 1.")
-                    return jsonify({"error": f"Response at index {i} must be 'Yes', 'No', 'True', 'False', 0, or 1."}), 400
-
-        try:
-            prediction = pre_therapy_model.predict([processed_responses])[0]
-            prediction = int(prediction)
-        except Exception as pred_err:
-            logger.error(f"Model prediction error: {str(pred_err)}")
-            return jsonify({"error": f"Model prediction error: {str(pred_err)}"}), 500
-
-        if prediction < 0 or prediction >= len(ALL_CONDITIONS):
-            logger.error(f"Prediction index {prediction} out of range")
-            return jsonify({"error": "Prediction index out of range"}), 500
-
-        condition = ALL_CONDITIONS[prediction]
-        logger.info(f"Predicted condition: {condition}")
+        condition = predict_condition(request.json["responses"])
         return jsonify({"condition": condition})
+    except RequestError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except KeyError:
         logger.error("Missing 'responses' key in JSON payload")
         return jsonify({"error": "Missing 'responses' key in JSON payload"}), 400
     except Exception as e:
         logger.error(f"Error in predict_pre_therapy: {str(e)}")
         return jsonify({"error": str(e)}), 500
-@app.route("/recommend_therapy", methods=["POST"])
-def recommend_therapy():
-    try:
-        condition = request.json.get("condition")
-        logger.info(f"[Backend] Received condition: {condition}")
 
-        if not condition:
-            return jsonify({"error": "Missing condition in request"}), 400
-
-        if condition not in ALL_CONDITIONS:
-            return jsonify({"error": f"Condition '{condition}' not valid"}), 400
-
-        # Predict environment index from therapy_model
-        condition_encoded = [1 if c == condition else 0 for c in ALL_CONDITIONS]
-        predicted_env_index = therapy_model.predict([condition_encoded])[0]
-        predicted_env_index = int(predicted_env_index)
-
-        logger.info(f"[Backend] Predicted environment index: {predicted_env_index}")
+@app.route("/predict_pre_therapy/batch", methods=["POST"])
+def predict_pre_therapy_batch():
+    try:
+        rows = request.json["rows"]
+        if not isinstance(rows, list):
+            return jsonify({"error": "'rows' must be a list of response lists"}), 400
+        if len(rows) > PREDICT_BATCH_MAX_ROWS:
+            return jsonify({"error": f"Got {len(rows)} rows, limit is {PREDICT_BATCH_MAX_ROWS}"}), 413
+
+        # Encode every row at once, then a single model call over the valid ones
+        with span("encode"):
+            matrix, errors = questionnaire_encoder.encode_many(rows)
+        valid = np.array([r not in errors for r in range(len(rows))], dtype=bool)
+        conditions = [None] * len(rows)
+        if valid.any():
+            model_set = current_model_set()
+            all_conditions = model_set.conditions
+            with span("predict"):
+                model = model_set.batch_model(int(valid.sum()), PREDICT_SKLEARN_MIN_ROWS)
+                predictions = model.predict(matrix[valid]).astype(int)
+            instrumentation.count_inference("pre_therapy", pre_therapy_version(model_set), len(predictions))
+            for r, prediction in zip(np.flatnonzero(valid), predictions):
+                if 0 <= prediction < len(all_conditions):
+                    conditions[r] = all_conditions[prediction]
+                else:
+                    errors[int(r)] = "Prediction index out of range"
 
-        # Convert index to environment ID string
-        environment_id = therapy_label_encoder.inverse_transform([predicted_env_index])[0]
+        logger.info(f"Scored {len(rows)} questionnaires in batch, {len(errors)} rejected")
+        return jsonify({
+            "conditions": conditions,
+            "errors": [{"index": r, "error": message} for r, message in sorted(errors.items())]
+        })
+    except KeyError:
+        logger.error("Missing 'rows' key in JSON payload")
+        return jsonify({"error": "Missing 'rows' key in JSON payload"}), 400
+    except Exception as e:
+        logger.error(f"Error in predict_pre_therapy_batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        logger.info(f"[Backend] Decoded environmentId: {environment_id}")
+@app.route("/recommend_therapy", methods=["POST"])
+def recommend_therapy():
+    try:
+        response_payload = recommend_for_condition(request.json.get("condition"),
+                                                   request.json.get("embedEnvironment", True) is not False)
+        logger.info(f"[Backend] Sending therapy recommendation: {response_payload['environmentId']}")
+        return jsonify(requested_fields(response_payload))
+    except RequestError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"[Backend] Exception in /recommend_therapy: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Fetch environment data from Firestore
-        env_doc = db.collection('environments').document(environment_id).get()
+@app.route("/assess", methods=["POST"])
+def assess():
+    # Prediction and recommendation in one round trip, same validation and models as above
+    try:
+        condition = predict_condition(request.json["responses"])
+        response_payload = {"condition": condition,
+                            **recommend_for_condition(condition, request.json.get("embedEnvironment", True) is not False)}
+        logger.info(f"[Backend] Sending assessment: {condition} -> {response_payload['environmentId']}")
+        return jsonify(requested_fields(response_payload))
+    except RequestError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except KeyError:
+        logger.error("Missing 'responses' key in JSON payload")
+        return jsonify({"error": "Missing 'responses' key in JSON payload"}), 400
+    except Exception as e:
+        logger.error(f"Error in assess: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        if not env_doc.exists:
-            logger.warning(f"[Backend] Environment '{environment_id}' not found. Falling back to 'forest'")
-            environment_id = 'forest'
-            env_doc = db.collection('environments').document(environment_id).get()
+def environment_response(payload, etag):
+    # Strong validator over the content; a match costs the client a 304 and no body.
+    # ?fields= responses are other URLs, so they can share the document's validator.
+    headers = {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={ENVIRONMENT_MAX_AGE}"}
+    if request.if_none_match.contains_weak(etag):
+        return app.response_class(status=304, headers=headers)
+    response = jsonify(requested_fields(payload))
+    response.headers.update(headers)
+    return response
 
-        if not env_doc.exists:
-            logger.error("[Backend] Even fallback environment 'forest' not found.")
-            return jsonify({"error": "No valid environment found"}), 500
+@app.route("/environments", methods=["GET"])
+def list_environments():
+    try:
+        with span("catalog"):
+            environments, etag = models.get("environment_catalog").listing()
+        return environment_response({"environments": environments}, etag)
+    except Exception as e:
+        logger.error(f"Error in list_environments: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        environment_data = env_doc.to_dict()
+@app.route("/environments/<environment_id>", methods=["GET"])
+def get_environment(environment_id):
+    try:
+        with span("catalog"):
+            entry = models.get("environment_catalog").entry(environment_id)
+        if entry is None:
+            return jsonify({"error": f"Environment '{environment_id}' not found"}), 404
+        environment_data, etag = entry
+        return environment_response({"environmentId": environment_id, "environment": environment_data}, etag)
+    except Exception as e:
+        logger.error(f"Error in get_environment: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # ✅ FINAL RESPONSE: Make sure environmentId is camelCase and present
-        response_payload = {
-            "therapy": f"{condition} Therapy",
-            "environmentId": environment_id,
-            "environment": environment_data
-        }
+def resolve_media_urls(values):
+    """``(urls, errors)`` aligned with ``values``; Drive IDs and links are resolved, other URLs pass through."""
+    file_ids = [drive_file_id(value) for value in values]
+    resolved = {}
+    if any(file_ids):
+        with span("drive"):
+            resolved = models.get("media_resolver").resolve_many([file_id for file_id in file_ids if file_id])
+    urls = [None] * len(values)
+    errors = {}
+    for i, (value, file_id) in enumerate(zip(values, file_ids)):
+        if file_id is None:
+            if isinstance(value, str) and value.startswith(("http://", "https://")):
+                urls[i] = value
+            else:
+                errors[i] = "Expected a Google Drive file ID or a media URL"
+        elif isinstance(resolved[file_id], Exception):
+            errors[i] = resolved[file_id]
+        else:
+            urls[i] = resolved[file_id]
+    return urls, errors
+
+@app.route("/get_media_url", methods=["POST"])
+def get_media_url():
+    try:
+        file_id = request.json["fileId"]
+        urls, errors = resolve_media_urls([file_id])
+        if errors:
+            error = errors[0]
+            status_code = 404 if isinstance(error, MediaNotFound) else 502 if isinstance(error, DriveUnavailable) else 400
+            return jsonify({"error": str(error)}), status_code
+        return jsonify({"mediaUrl": urls[0]})
+    except KeyError:
+        logger.error("Missing 'fileId' key in JSON payload")
+        return jsonify({"error": "Missing 'fileId' key in JSON payload"}), 400
+    except Exception as e:
+        logger.error(f"Error in get_media_url: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        logger.info(f"[Backend] Sending therapy recommendation: {response_payload}")
-        return jsonify(response_payload)
+@app.route("/get_media_urls", methods=["POST"])
+def get_media_urls():
+    # Every uncached Drive ID in one batch request; results and errors are by position
+    try:
+        file_ids = request.json["fileIds"]
+        if not isinstance(file_ids, list):
+            return jsonify({"error": "'fileIds' must be a list"}), 400
+        if len(file_ids) > MEDIA_URL_BATCH_MAX_IDS:
+            return jsonify({"error": f"Got {len(file_ids)} file IDs, limit is {MEDIA_URL_BATCH_MAX_IDS}"}), 413
+        urls, errors = resolve_media_urls(file_ids)
+        return jsonify({
+            "mediaUrls": urls,
+            "errors": [{"index": i, "error": str(error)} for i, error in sorted(errors.items())]
+        })
+    except KeyError:
+        logger.error("Missing 'fileIds' key in JSON payload")
+        return jsonify({"error": "Missing 'fileIds' key in JSON payload"}), 400
+    except Exception as e:
+        logger.error(f"Error in get_media_urls: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
+# (catalog etag, Drive file IDs linked from the environments), rebuilt when the catalog changes
+_catalog_media = (None, frozenset())
+
+def servable_media_ids():
+    global _catalog_media
+    environments, etag = models.get("environment_catalog").listing()
+    if _catalog_media[0] != etag:
+        _catalog_media = (etag, frozenset(linked_file_ids(environments)))
+    return _catalog_media[1] | MEDIA_EXTRA_FILE_IDS
+
+def media_response(entry):
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{entry.etag}"',
+        "Cache-Control": f"public, max-age={MEDIA_MAX_AGE}",
+        "X-Media-Cache": "HIT" if entry.complete else "MISS",
+    }
+    if request.if_none_match.contains_weak(entry.etag):
+        return app.response_class(status=304, headers=headers)
+
+    start, stop, status = 0, entry.size, 200
+    # If-Range with a different validator means the client's partial copy is stale: send it all
+    if request.range is not None and ("If-Range" not in request.headers or request.if_range.etag == entry.etag):
+        byte_range = request.range.range_for_length(entry.size)
+        if byte_range is not None:
+            (start, stop), status = byte_range, 206
+            headers["Content-Range"] = f"bytes {start}-{stop - 1}/{entry.size}"
+        elif len(request.range.ranges) == 1:
+            headers["Content-Range"] = f"bytes */{entry.size}"
+            return app.response_class(status=416, headers=headers)
+        # Multipart byteranges are not supported; the whole file is a valid answer
+    headers["Content-Length"] = str(stop - start)
+
+    if entry.complete and stop == entry.size:
+        # Open file from its offset to the end: gunicorn sends it with sendfile()
+        f = open(entry.path, "rb")
+        f.seek(start)
+        body = wrap_file(request.environ, f)
+    else:
+        body = models.get("media_cache").read(entry, start, stop)
+    return app.response_class(body, status=status, headers=headers, mimetype=entry.content_type,
+                              direct_passthrough=True)
+
+@app.route("/media/<file_id>", methods=["GET"])
+def media(file_id):
+    try:
+        # Only media the environments link to; anything else would let clients proxy any file we can read
+        with span("catalog"):
+            servable = servable_media_ids()
+        if file_id not in servable:
+            return jsonify({"error": f"Unknown media '{file_id}'"}), 404
+        with span("cache"):
+            entry = models.get("media_cache").open(file_id)
+        return media_response(entry)
+    except MediaTooLarge as e:
+        # Not worth evicting the cache for; the client downloads it from Drive directly
+        logger.info(f"Redirecting to Drive: {str(e)}")
+        urls, errors = resolve_media_urls([file_id])
+        if errors:
+            return jsonify({"error": str(errors[0])}), 404 if isinstance(errors[0], MediaNotFound) else 502
+        if not urls[0]:
+            return jsonify({"error": f"Drive file '{file_id}' has no download link"}), 404
+        return redirect(urls[0])
+    except MediaNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except (DriveUnavailable, MediaStalled) as e:
+        logger.error(f"Media '{file_id}' unavailable: {str(e)}")
+        return jsonify({"error": str(e)}), 502
     except Exception as e:
-        logger.error(f"[Backend] Exception in /recommend_therapy: {str(e)}")
+        logger.error(f"Error in media: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
@@ -195,8 +694,18 @@ def recommend_therapy():
 def sentiment():
     try:
         text = request.json["text"]
-        result = sentiment_classifier(text)
-        sentiment = result[0]["label"].lower()
+        if not isinstance(text, str):
+            return jsonify({"error": "'text' must be a string"}), 400
+        sentiment_cache = models.get("sentiment_cache")
+        with span("cache"):
+            cache_key = sentiment_cache.key(text)
+            result = sentiment_cache.get(cache_key)
+        if result is None:
+            with span("inference"):
+                result = sentiment_batcher(text)
+            instrumentation.count_inference("sentiment", sentiment_cache.model_id)
+            sentiment_cache.put(cache_key, result)
+        sentiment = result["label"].lower()
         logger.info(f"Detected sentiment: {sentiment}")
         return jsonify({"result": f"Your tone suggests {sentiment}. Let's try a relaxation technique."})
     except KeyError:
@@ -206,35 +715,125 @@ def sentiment():
         logger.error(f"Error in sentiment: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def record_vision_timings(timings):
+    # Stage timings measured inside the vision worker process
+    for stage, elapsed_ms in timings.items():
+        instrumentation.record(f"vision_{stage}", elapsed_ms)
+
+def analyze_emotion_payload(image_data):
+    # Bounded decode, face crop and emotion model in a vision worker process
+    with span("vision"):
+        dominant_emotion, emotion_scores, timings = models.get("vision_pool").analyze_encoded("analyze_emotion", image_data)
+    record_vision_timings(timings)
+    instrumentation.count_inference("emotion", EMOTION_MODEL_VERSION)
+    logger.info(f"Detected emotion: {dominant_emotion} (stage timings ms: {timings})")
+    return {
+        "result": f"You seem {dominant_emotion}. Let's try a breathing exercise.",
+        "dominant_emotion": dominant_emotion,
+        "emotion_scores": emotion_scores
+    }
+
 @app.route("/analyze_emotion", methods=["POST"])
 def analyze_emotion():
     try:
-        data = request.json
-        if "image" not in data:
-            return jsonify({"error": "Missing 'image' key in JSON payload"}), 400
-
-        # Decode the base64 image
-        import base64
-        import cv2
-        import numpy as np
-
-        image_data = base64.b64decode(data["image"])
-        np_arr = np.frombuffer(image_data, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        # Multipart, raw binary or base64 JSON; the size cap is enforced before buffering
+        with span("upload"):
+            image_data = read_image_upload(request, EMOTION_MAX_IMAGE_BYTES)
+
+        # ?async=1 (or Prefer: respond-async) returns a job ID to poll at /jobs/<id>
+        async_requested = request.args.get("async") in ("1", "true")
+        if async_requested and not async_jobs_enabled:
+            return jsonify({"error": "Async jobs need JOB_STORE_PATH when several workers serve the app"}), 501
+        # Prefer is only a preference: without a shared job store the answer comes back synchronously
+        if async_requested or (async_jobs_enabled and "respond-async" in request.headers.get("Prefer", "")):
+            with span("enqueue"):
+                job = job_runner.submit("analyze_emotion", analyze_emotion_payload, bytes(image_data))
+            response = jsonify({"jobId": job["jobId"], "status": job["status"], "statusUrl": f"/jobs/{job['jobId']}"})
+            response.headers["Location"] = f"/jobs/{job['jobId']}"
+            return response, 202
+
+        return jsonify(analyze_emotion_payload(image_data))
+    except JobQueueFull as e:
+        logger.warning(f"Rejecting async emotion job: {str(e)}")
+        response = jsonify({"error": "Too many pending emotion jobs, try again shortly"})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+    except Overloaded as e:
+        logger.warning(f"Shedding vision request: {str(e)}")
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, e.status_code
+    except TimeoutError:
+        return jsonify({"error": "Emotion analysis timed out"}), 504
+    except ImageTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except UnsupportedMediaType as e:
+        return jsonify({"error": str(e)}), 415
+    except LengthRequired as e:
+        return jsonify({"error": str(e)}), 411
+    except InvalidImage as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in analyze_emotion: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Analyze emotion using DeepFace
-        result = DeepFace.analyze(img, actions=['emotion'], enforce_detection=False)
-        dominant_emotion = result["dominant_emotion"]
-        emotion_scores = result["emotion"]
+@app.route("/analyze_emotion/batch", methods=["POST"])
+def analyze_emotion_batch():
+    try:
+        with span("upload"):
+            buffers = read_image_uploads(request, EMOTION_MAX_IMAGE_BYTES, EMOTION_MAX_BATCH_IMAGES)
+
+        # Decode and crop every frame, then one emotion-model pass over the stacked faces
+        with span("vision"):
+            results, timings = models.get("vision_pool").analyze_encoded_batch("analyze_emotion_batch", buffers)
+        record_vision_timings(timings)
+        logger.info(f"Analyzed {len(buffers)} images (stage timings ms: {timings})")
+
+        images = []
+        for result in results:
+            if isinstance(result, Exception):
+                images.append({"error": str(result)})
+            else:
+                images.append({"dominant_emotion": result[0], "emotion_scores": result[1]})
+
+        analyzed = [result for result in results if not isinstance(result, Exception)]
+        instrumentation.count_inference("emotion", EMOTION_MODEL_VERSION, len(analyzed))
+        if not analyzed:
+            return jsonify({"error": "None of the images could be analyzed", "images": images}), 400
+        dominant_emotion, emotion_scores = aggregate_emotions(analyzed)
 
         return jsonify({
+            "result": f"You seem {dominant_emotion}. Let's try a breathing exercise.",
             "dominant_emotion": dominant_emotion,
-            "emotion_scores": emotion_scores
+            "emotion_scores": emotion_scores,
+            "images": images
         })
+    except Overloaded as e:
+        logger.warning(f"Shedding vision request: {str(e)}")
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, e.status_code
+    except TimeoutError:
+        return jsonify({"error": "Emotion analysis timed out"}), 504
+    except ImageTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except UnsupportedMediaType as e:
+        return jsonify({"error": str(e)}), 415
+    except LengthRequired as e:
+        return jsonify({"error": str(e)}), 411
+    except InvalidImage as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        logger.error(f"Error in analyze_emotion: {str(e)}")
+        logger.error(f"Error in analyze_emotion_batch: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' not found or expired"}), 404
+    return jsonify(requested_fields(job))
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000,debug=True)
 
@@ -0,0 +1,84 @@
+"""Dynamic micro-batching for models that are cheaper to run on batches.
+
+Request threads call ``MicroBatcher.submit`` (or the batcher itself) with a
+single item.  A background thread collects items until either
+``max_batch_size`` is reached or the oldest item has waited ``max_wait_ms``,
+runs ``process_batch`` once on the whole list and hands each result back to
+its caller.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import BATCH_SIZE_BUCKETS, LATENCY_MS_BUCKETS, Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    def __init__(self, process_batch, max_batch_size=32, max_wait_ms=5.0, name="batcher"):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(LATENCY_MS_BUCKETS)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((time.monotonic(), item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][0] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            for enqueued, _, _ in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000)
+            self.batch_sizes.observe(len(batch))
+
+            futures = [future for _, _, future in batch]
+            try:
+                results = self.process_batch([item for _, item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name} returned {len(results)} results for {len(batch)} inputs")
+            except Exception as e:
+                logger.error(f"Error in {self.name} batch of {len(batch)}: {str(e)}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
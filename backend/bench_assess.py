@@ -0,0 +1,54 @@
+import argparse
+import time
+
+import requests
+
+SAMPLE_RESPONSES = [5, "Yes", "No", "Yes", "High", "Medium", "No", "No", "Yes", "No", "No", 6, "Yes", 3, 4]
+
+
+def two_call_flow(session, base_url):
+    condition = session.post(f"{base_url}/predict_pre_therapy", json={"responses": SAMPLE_RESPONSES}).json()["condition"]
+    return session.post(f"{base_url}/recommend_therapy", json={"condition": condition}).json()
+
+
+def assess_flow(session, base_url):
+    return session.post(f"{base_url}/assess", json={"responses": SAMPLE_RESPONSES}).json()
+
+
+def measure(fn, session, base_url, iterations):
+    fn(session, base_url)  # warm-up
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(session, base_url)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare /assess with the predict + recommend two-call flow")
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--new-connection", action="store_true",
+                        help="Open a new connection per request, as a mobile client on a cold network would")
+    args = parser.parse_args()
+
+    def session_factory():
+        session = requests.Session()
+        if args.new_connection:
+            session.headers["Connection"] = "close"
+        return session
+
+    two_call = two_call_flow(session_factory(), args.base_url)
+    combined = assess_flow(session_factory(), args.base_url)
+    if combined.get("environmentId") != two_call.get("environmentId"):
+        raise SystemExit(f"/assess disagrees with the two-call flow: {combined} vs {two_call}")
+
+    for name, fn in (("predict + recommend", two_call_flow), ("assess", assess_flow)):
+        p50, p95 = measure(fn, session_factory(), args.base_url, args.iterations)
+        print(f"{name:20s} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
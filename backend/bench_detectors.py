@@ -0,0 +1,73 @@
+import argparse
+import os
+import time
+
+import cv2
+
+from emotion import EmotionAnalyzer
+
+DEFAULT_DETECTORS = ["opencv", "ssd", "yunet", "mtcnn", "retinaface", "centerface"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def load_images(image_dir):
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            img = cv2.imread(os.path.join(image_dir, name), cv2.IMREAD_COLOR)
+            if img is not None:
+                images.append((name, img))
+    return images
+
+
+def bench_detector(detector, images, repeats):
+    start = time.perf_counter()
+    analyzer = EmotionAnalyzer(detector, warm_up=False)
+    build_s = time.perf_counter() - start
+
+    analyzer.detect_faces(images[0][1])  # first call may still initialise lazily
+    detected = 0
+    latencies = []
+    cpu_start = time.process_time()
+    for _ in range(repeats):
+        for _, img in images:
+            start = time.perf_counter()
+            faces = analyzer.detect_faces(img)
+            latencies.append(time.perf_counter() - start)
+            detected += bool(faces)
+    cpu_s = time.process_time() - cpu_start
+    latencies.sort()
+    calls = len(latencies)
+    return {
+        "build_s": build_s,
+        "p50_ms": latencies[calls // 2] * 1000,
+        "p95_ms": latencies[int(calls * 0.95)] * 1000,
+        "cpu_ms": cpu_s / calls * 1000,
+        "detection_rate": detected / calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare DeepFace face detector backends for /analyze_emotion")
+    parser.add_argument("image_dir", help="Directory of face images to run every detector on")
+    parser.add_argument("--detectors", nargs="+", default=DEFAULT_DETECTORS)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir)
+    if not images:
+        raise SystemExit(f"No images found in {args.image_dir}")
+    print(f"{len(images)} images x {args.repeats} repeats")
+    print(f"{'detector':12s} {'build s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'cpu ms':>8s} {'detected':>9s}")
+    for detector in args.detectors:
+        try:
+            r = bench_detector(detector, images, args.repeats)
+        except Exception as e:
+            print(f"{detector:12s} unavailable: {e}")
+            continue
+        print(f"{detector:12s} {r['build_s']:8.2f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['cpu_ms']:8.1f} "
+              f"{r['detection_rate']:9.1%}")
+
+
+if __name__ == "__main__":
+    main()
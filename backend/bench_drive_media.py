@@ -0,0 +1,204 @@
+"""Time DriveMediaResolver against a local fake Drive API.
+
+The fake server speaks the endpoints the resolver uses,
+``GET /drive/v3/files/<id>`` (metadata, or content with ``alt=media`` and
+``Range``) and the multipart ``POST /batch/drive/v3``.  It adds a fixed
+latency per HTTP request to stand in for the round trip to Google, can cap
+the content bandwidth, and counts requests, TCP connections and content
+bytes sent.  No credentials or network access are needed; bench_media.py
+uses it as the origin for the ``/media`` proxy, and tests/test_drive_media.py
+checks the resolver's caching, single flight, batching and connection reuse
+against it.
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build
+
+from drive_media import DriveMediaResolver
+
+FILE_PATH = re.compile(r"^/drive/v3/files/([\w-]+)")
+BYTE_RANGE = re.compile(r"^bytes=(\d+)-(\d*)$")
+
+
+def web_content_link(file_id):
+    return f"https://drive.google.com/uc?id={file_id}&export=download"
+
+
+class FakeDrive(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, file_ids, latency, media=None, bandwidth=None):
+        super().__init__(("127.0.0.1", 0), FakeDriveHandler)
+        self.media = media or {}
+        self.file_ids = set(file_ids) | set(self.media)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.counts = {"requests": 0, "batch_requests": 0, "file_gets": 0, "connections": 0, "media_bytes": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def root_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def file_response(self, path):
+        """``(status, json_body)`` for one files.get call."""
+        match = FILE_PATH.match(path)
+        self.count("file_gets")
+        if match and match.group(1) in self.file_ids:
+            file_id = match.group(1)
+            payload = {"webContentLink": web_content_link(file_id)}
+            if file_id in self.media:
+                payload.update(size=str(len(self.media[file_id])), mimeType="video/mp4",
+                               md5Checksum=hashlib.md5(self.media[file_id]).hexdigest())
+            return 200, payload
+        return 404, {"error": {"code": 404, "message": "File not found"}}
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.count("requests")
+        time.sleep(self.server.latency)
+        match = FILE_PATH.match(self.path)
+        if "alt=media" in self.path and match and match.group(1) in self.server.media:
+            return self._send_media(self.server.media[match.group(1)])
+        status, payload = self.server.file_response(self.path)
+        self._send(status, json.dumps(payload).encode())
+
+    def _send_media(self, content):
+        start, stop, status = 0, len(content), 200
+        match = BYTE_RANGE.match(self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            stop = min(int(match.group(2)) + 1, len(content)) if match.group(2) else len(content)
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(stop - start))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{stop - 1}/{len(content)}")
+        self.end_headers()
+        chunk_size = 64 * 1024
+        for offset in range(start, stop, chunk_size):
+            chunk = content[offset:min(offset + chunk_size, stop)]
+            if self.server.bandwidth:
+                time.sleep(len(chunk) / self.server.bandwidth)
+            self.wfile.write(chunk)
+            self.server.count("media_bytes", len(chunk))
+
+    def do_POST(self):
+        self.server.count("requests")
+        self.server.count("batch_requests")
+        time.sleep(self.server.latency)
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        message = BytesParser().parsebytes(f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+        boundary = "batch_response_boundary"
+        parts = []
+        for part in message.get_payload():
+            request_line = part.get_payload().split("\n", 1)[0]
+            status, payload = self.server.file_response(request_line.split(" ")[1])
+            content_id = part["Content-ID"].replace("<", "<response-", 1)
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: {content_id}\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(payload)}\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n")
+        self._send(200, "".join(parts).encode(), f"multipart/mixed; boundary={boundary}")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time Drive media URL resolution against a fake Drive API")
+    parser.add_argument("--files", type=int, default=4, help="Drive links per environment screen")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Simulated round trip per HTTP request")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    file_ids = [f"fakeDriveFile{i:04d}" for i in range(max(args.files, 120))]
+    server = FakeDrive(file_ids, args.latency_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    credentials = AnonymousCredentials()
+    screen = file_ids[:args.files]
+
+    # Before: one files.get per link on every call, as the old get_media_url did
+    service = build('drive', 'v3', credentials=credentials,
+                    client_options={"api_endpoint": f"{server.root_url}drive/v3/"}, cache_discovery=False)
+    before = dict(server.counts)
+    _, naive_ms = timed(lambda: {file_id: service.files().get(fileId=file_id, fields='webContentLink')
+                                     .execute()['webContentLink'] for file_id in screen})
+    naive_requests = server.counts["requests"] - before["requests"]
+
+    resolver = DriveMediaResolver(credentials, ttl=60, root_url=server.root_url)
+    before = dict(server.counts)
+    resolver_start = before
+    _, cold_ms = timed(lambda: resolver.resolve_many(screen))
+    cold_requests = server.counts["requests"] - before["requests"]
+    before = dict(server.counts)
+    _, warm_ms = timed(lambda: resolver.resolve_many(screen))
+    warm_requests = server.counts["requests"] - before["requests"]
+
+    print(f"{len(screen)} links: per-call files.get {naive_ms:7.1f} ms ({naive_requests} requests), "
+          f"resolver cold {cold_ms:7.1f} ms ({cold_requests} request), warm {warm_ms:6.3f} ms "
+          f"({warm_requests} requests)")
+
+    # Single flight: concurrent lookups of one uncached ID make one Drive call
+    before = dict(server.counts)
+    threads = [threading.Thread(target=resolver.resolve, args=(file_ids[-1],)) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    single_flight_ms = (time.perf_counter() - started) * 1000
+    single_flight_gets = server.counts["file_gets"] - before["file_gets"]
+    print(f"{args.concurrency} concurrent lookups of one file: {single_flight_gets} Drive call "
+          f"in {single_flight_ms:.1f} ms")
+
+    # More than 100 IDs are split into several batches
+    resolver.invalidate()
+    before = dict(server.counts)
+    _, many_ms = timed(lambda: resolver.resolve_many(file_ids[:110] + ["missingDriveFile"]))
+    print(f"111 IDs (one missing): {server.counts['batch_requests'] - before['batch_requests']} batch requests "
+          f"in {many_ms:.1f} ms")
+
+    print(f"TCP connections opened by the resolver: {server.counts['connections'] - resolver_start['connections']} "
+          f"for {server.counts['requests'] - resolver_start['requests']} requests")
+    print(f"Resolver stats: {resolver.stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
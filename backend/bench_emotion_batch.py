@@ -0,0 +1,51 @@
+import argparse
+import os
+import time
+
+from emotion import EmotionAnalyzer
+from bench_detectors import IMAGE_EXTENSIONS
+
+
+def load_encoded_images(image_dir, count):
+    names = sorted(n for n in os.listdir(image_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+    if not names:
+        raise SystemExit(f"No images found in {image_dir}")
+    buffers = []
+    while len(buffers) < count:
+        with open(os.path.join(image_dir, names[len(buffers) % len(names)]), "rb") as f:
+            buffers.append(f.read())
+    return buffers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare batched and sequential emotion analysis throughput")
+    parser.add_argument("image_dir", help="Directory of face images (frames are reused to reach --frames)")
+    parser.add_argument("--frames", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--detector", default=os.environ.get("EMOTION_DETECTOR", "opencv"))
+    args = parser.parse_args()
+
+    analyzer = EmotionAnalyzer(args.detector)
+    print(f"detector {args.detector}, {args.repeats} repeats per point")
+    print(f"{'frames':>6s} {'sequential ms':>14s} {'batched ms':>11s} {'seq img/s':>10s} {'batch img/s':>12s} {'speedup':>8s}")
+    for frames in args.frames:
+        buffers = load_encoded_images(args.image_dir, frames)
+        analyzer.analyze_encoded_batch(buffers)  # warm-up for this batch shape
+
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            for buf in buffers:
+                analyzer.analyze_encoded(buf)
+        sequential = (time.perf_counter() - start) / args.repeats
+
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            analyzer.analyze_encoded_batch(buffers)
+        batched = (time.perf_counter() - start) / args.repeats
+
+        print(f"{frames:6d} {sequential * 1000:14.1f} {batched * 1000:11.1f} {frames / sequential:10.1f} "
+              f"{frames / batched:12.1f} {sequential / batched:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
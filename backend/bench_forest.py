@@ -0,0 +1,52 @@
+import argparse
+import time
+
+import joblib
+import numpy as np
+
+from forest_compiler import CompiledForest, probe_inputs
+
+
+def time_per_call(fn, iterations):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sklearn and compiled pre-therapy forest latency")
+    parser.add_argument("--model", default="models/pre_therapy_model.pkl")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    start = time.perf_counter()
+    compiled = CompiledForest.from_sklearn(model)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    rows = probe_inputs(compiled.n_features_in_, n_rows=max(args.batch_sizes + [512]))
+    compiled.check_equivalent(model, rows)
+    print(f"Compiled {len(compiled.roots)} trees / {len(compiled.feature)} nodes in {compile_ms:.1f} ms; "
+          f"outputs match sklearn on {len(rows)} probe rows")
+
+    row = rows[0].tolist()
+    sk_single = time_per_call(lambda: model.predict([row]), args.iterations)
+    cf_single = time_per_call(lambda: compiled.predict(row), args.iterations)
+    print(f"single row   sklearn {sk_single * 1e6:9.1f} us   compiled {cf_single * 1e6:9.1f} us   "
+          f"speedup {sk_single / cf_single:5.1f}x")
+
+    for batch_size in args.batch_sizes:
+        batch = rows[:batch_size]
+        batch_iterations = max(args.iterations * 10 // batch_size, 3)
+        sk_batch = time_per_call(lambda: model.predict(batch), batch_iterations)
+        cf_batch = time_per_call(lambda: compiled.predict(batch), batch_iterations)
+        print(f"{len(batch):5d} rows   sklearn {sk_batch * 1e3:9.2f} ms   compiled {cf_batch * 1e3:9.2f} ms   "
+              f"speedup {sk_batch / cf_batch:5.1f}x")
+        assert np.array_equal(model.predict(batch), compiled.predict(batch))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Time the /media proxy against a local stand-in Drive origin.
+
+Starts ``bench_drive_media.FakeDrive`` with a few random "videos" served at
+a capped bandwidth, runs the app under gunicorn pointed at it
+(``DRIVE_API_ROOT``, the fake files allowed through ``MEDIA_EXTRA_FILE_IDS``)
+with an empty cache directory, then measures the first
+view (origin speed), a burst of concurrent cold viewers (one origin
+download between them), repeat views and range reads from the cache, and
+checks every body byte for byte.
+"""
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from urllib.error import HTTPError
+
+from bench_drive_media import FakeDrive
+
+
+def fetch(url, headers=None):
+    """``(status, headers, body, first_byte_ms, total_ms)``."""
+    start = time.perf_counter()
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=120)
+    except HTTPError as e:
+        response = e
+    with response:
+        first = response.read(1)
+        first_byte_ms = (time.perf_counter() - start) * 1000
+        body = first + response.read()
+    return response.status, response.headers, body, first_byte_ms, (time.perf_counter() - start) * 1000
+
+
+def wait_ready(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/", timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f"gunicorn did not become ready within {timeout:.0f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the /media proxy and its disk cache against a fake Drive origin")
+    parser.add_argument("--size-mb", type=float, default=32)
+    parser.add_argument("--origin-mbps", type=float, default=40, help="Origin bandwidth in MB/s")
+    parser.add_argument("--viewers", type=int, default=8, help="Concurrent cold viewers of one file")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    media = {f"fakeVideoFile{i:04d}": os.urandom(size) for i in range(2)}
+    first_id, burst_id = list(media)
+    origin = FakeDrive([], latency=0.02, media=media, bandwidth=args.origin_mbps * 1024 * 1024)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+
+    cache_dir = tempfile.mkdtemp(prefix="media-bench-")
+    env = {**os.environ, "DRIVE_API_ROOT": origin.root_url, "MEDIA_CACHE_DIR": cache_dir,
+           "MEDIA_CACHE_BYTES": str(size * 8), "MODEL_WARM_UP": "lazy",
+           "MEDIA_EXTRA_FILE_IDS": ",".join(media)}
+    server = subprocess.Popen(["gunicorn", "-c", "gunicorn_preload.py", "--workers", str(args.workers),
+                               "--bind", f"127.0.0.1:{args.port}", "app:app"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_ready(base_url, 300)
+
+        status, headers, body, ttfb, total = fetch(f"{base_url}/media/{first_id}")
+        assert status == 200 and body == media[first_id], status
+        print(f"first view ({headers['X-Media-Cache']}): first byte {ttfb:7.1f} ms, {args.size_mb:.0f} MB in "
+              f"{total:8.1f} ms")
+
+        sent_before = origin.counts["media_bytes"]
+        results = []
+
+        def view():
+            results.append(fetch(f"{base_url}/media/{burst_id}"))
+
+        threads = [threading.Thread(target=view) for _ in range(args.viewers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(result[0] == 200 and result[2] == media[burst_id] for result in results)
+        origin_mb = (origin.counts["media_bytes"] - sent_before) / 1024 / 1024
+        print(f"{args.viewers} concurrent cold viewers: slowest {max(r[4] for r in results):8.1f} ms, "
+              f"{origin_mb:.0f} MB from the origin for {args.viewers * args.size_mb:.0f} MB served")
+
+        time.sleep(1)  # let the fill finish its rename
+        timings = []
+        for _ in range(args.repeats):
+            status, headers, body, ttfb, total = fetch(f"{base_url}/media/{first_id}")
+            assert status == 200 and headers["X-Media-Cache"] == "HIT" and body == media[first_id]
+            timings.append(total)
+        print(f"repeat views (HIT):  median {sorted(timings)[len(timings) // 2]:8.1f} ms for {args.size_mb:.0f} MB "
+              f"({args.size_mb / (min(timings) / 1000):.0f} MB/s)")
+
+        checks = [("bytes=1000-1999", 206, media[first_id][1000:2000]),
+                  (f"bytes={size - 500}-", 206, media[first_id][-500:]),
+                  ("bytes=-300", 206, media[first_id][-300:]),
+                  (f"bytes={size}-", 416, None)]
+        for header, expected_status, expected_body in checks:
+            status, headers, body, ttfb, total = fetch(f"{base_url}/media/{first_id}", {"Range": header})
+            assert status == expected_status, (header, status)
+            assert expected_body is None or body == expected_body, header
+            print(f"Range {header:22s} -> {status} {headers.get('Content-Range')} in {total:6.2f} ms")
+
+        etag = headers["ETag"]
+        status = fetch(f"{base_url}/media/{first_id}", {"If-None-Match": etag})[0]
+        assert status == 304, status
+        print(f"If-None-Match {etag} -> {status}")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        origin.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Compare per-worker memory of the default and preload gunicorn profiles.
+
+Both profiles serve the same workload (``PROFILE_ENV``): every model is
+loaded before the first request, and the emotion model lives in the gunicorn
+workers.  Samples are taken once the workers' RSS has settled.  USS is the
+memory a worker would free on exit; PSS splits the pages it shares with the
+master and the other workers between them.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+# Same workload under both profiles: every model loaded before serving, and the emotion
+# model in each worker (VISION_POOL_WORKERS=0) rather than in pool processes, which
+# are grandchildren of the master and would not be counted.
+PROFILE_ENV = {"MODEL_WARM_UP": "eager", "VISION_POOL_WORKERS": "0"}
+
+PROFILES = {
+    # What the Procfile ran before: every worker imports app and loads its own models.
+    "default": lambda workers, port: ["gunicorn", "--workers", str(workers), "--threads", "8",
+                                      "--timeout", "120", "--bind", f"127.0.0.1:{port}", "app:app"],
+    "preload": lambda workers, port: ["gunicorn", "-c", "gunicorn_preload.py", "--workers", str(workers),
+                                      "--bind", f"127.0.0.1:{port}", "app:app"],
+}
+
+
+def smaps_rollup(pid):
+    """Return the memory counters for ``pid`` in MB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": fields.get("Rss", 0.0),
+        "pss": fields.get("Pss", 0.0),
+        "uss": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def wait_ready(port, workers, master_pid, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=2):
+                pass
+            if len(children(master_pid)) >= workers:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"gunicorn did not become ready within {timeout:.0f}s")
+
+
+def wait_loaded(master_pid, settle, timeout):
+    """Wait until no worker's RSS has moved by more than 1 MB for ``settle`` seconds."""
+    deadline = time.monotonic() + timeout
+    previous = None
+    while time.monotonic() < deadline:
+        current = {pid: smaps_rollup(pid)["rss"] for pid in children(master_pid)}
+        if previous is not None and current.keys() == previous.keys() and all(
+                abs(current[pid] - previous[pid]) < 1 for pid in current):
+            return
+        previous = current
+        time.sleep(settle)
+    raise TimeoutError(f"worker memory did not settle within {timeout:.0f}s")
+
+
+def measure(profile, workers, port, timeout, settle):
+    start = time.perf_counter()
+    server = subprocess.Popen(PROFILES[profile](workers, port), env={**os.environ, **PROFILE_ENV},
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        wait_ready(port, workers, server.pid, timeout)
+        # Touch every worker so request-time allocations are included.
+        for _ in range(workers * 4):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=timeout).read()
+        wait_loaded(server.pid, settle, timeout)
+        ready_s = time.perf_counter() - start
+        master = smaps_rollup(server.pid)
+        worker_stats = [smaps_rollup(pid) for pid in children(server.pid)]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return ready_s, master, worker_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-worker memory of the default and preload gunicorn profiles")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=["default", "preload"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--settle", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("bench_memory.py needs Linux /proc/<pid>/smaps_rollup")
+
+    print(f"{'profile':8s} {'ready s':>8s} {'master USS':>11s} {'worker RSS':>11s} {'worker PSS':>11s} "
+          f"{'worker USS':>11s} {'total USS':>10s}")
+    for profile in args.profiles:
+        ready_s, master, worker_stats = measure(profile, args.workers, args.port, args.timeout, args.settle)
+        n = len(worker_stats)
+        mean = {key: sum(w[key] for w in worker_stats) / n for key in ("rss", "pss", "uss")}
+        total_uss = master["uss"] + sum(w["uss"] for w in worker_stats)
+        print(f"{profile:8s} {ready_s:8.1f} {master['uss']:9.1f}MB {mean['rss']:9.1f}MB {mean['pss']:9.1f}MB "
+              f"{mean['uss']:9.1f}MB {total_uss:8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from sentiment_backends import DEFAULT_ONNX_DIR, load_sentiment_classifier
+
+# Fixed parity corpus: short feedback-style texts plus a few longer and
+# ambiguous ones so both labels and the truncation path are exercised.
+CORPUS = [
+    "good",
+    "felt relaxed",
+    "bad",
+    "ok",
+    "I feel much calmer after this session.",
+    "This did not help at all, I am still anxious.",
+    "The forest sounds were lovely and peaceful.",
+    "I couldn't concentrate, the video kept buffering.",
+    "Not sure how I feel.",
+    "It was fine I guess",
+    "I hated the noise in the city environment.",
+    "Best session so far, thank you!",
+    "I'm exhausted and everything feels pointless.",
+    "The breathing exercise made my chest feel lighter.",
+    "meh",
+    "Too long, I got bored halfway through.",
+    "I slept better last night after the beach session.",
+    "Nothing changed.",
+    "I cried a little but I feel better now.",
+    "The voice was annoying but the visuals were beautiful.",
+    "I am proud of myself for finishing this.",
+    "Why does this keep crashing",
+    "calm",
+    "stressed",
+    "I feel safe here. " * 200,
+]
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(backend, onnx_dir, iterations):
+    start = time.perf_counter()
+    classifier = load_sentiment_classifier(backend, onnx_dir)
+    load_s = time.perf_counter() - start
+    results = classifier(CORPUS, batch_size=len(CORPUS), truncation=True)
+
+    single = []
+    for _ in range(iterations):
+        for text in CORPUS[:-1]:
+            start = time.perf_counter()
+            classifier([text], batch_size=1, truncation=True)
+            single.append(time.perf_counter() - start)
+    single.sort()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        classifier(CORPUS, batch_size=len(CORPUS), truncation=True)
+    batch_s = (time.perf_counter() - start) / iterations
+
+    print(json.dumps({
+        "backend": backend,
+        "load_s": load_s,
+        "single_p50_ms": single[len(single) // 2] * 1000,
+        "single_p95_ms": single[int(len(single) * 0.95)] * 1000,
+        "batch_ms": batch_s * 1000,
+        "max_rss_mb": rss_mb(),
+        "torch_imported": "torch" in sys.modules,
+        "results": results,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare torch and ONNX sentiment backends")
+    parser.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    parser.add_argument("--worker", choices=["torch", "onnx"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.onnx_dir, args.iterations)
+        return
+
+    # Each backend runs in its own process so RSS and import side effects
+    # are measured independently.
+    reports = {}
+    for backend in ("torch", "onnx"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", backend, "--onnx-dir", args.onnx_dir,
+             "--iterations", str(args.iterations)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        reports[backend] = json.loads(output.strip().splitlines()[-1])
+
+    for backend, report in reports.items():
+        print(f"{backend:5s} load {report['load_s']:6.2f} s   single p50 {report['single_p50_ms']:7.2f} ms   "
+              f"p95 {report['single_p95_ms']:7.2f} ms   batch({len(CORPUS)}) {report['batch_ms']:8.2f} ms   "
+              f"max RSS {report['max_rss_mb']:7.1f} MB   torch imported: {report['torch_imported']}")
+
+    reference = reports["torch"]["results"]
+    candidate = reports["onnx"]["results"]
+    agree = sum(r["label"] == c["label"] for r, c in zip(reference, candidate))
+    max_score_diff = max(abs(r["score"] - c["score"]) for r, c in zip(reference, candidate))
+    agreement = agree / len(CORPUS)
+    print(f"label agreement {agree}/{len(CORPUS)} ({agreement:.1%}), max score difference {max_score_diff:.4f}")
+    for text, r, c in zip(CORPUS, reference, candidate):
+        if r["label"] != c["label"]:
+            print(f"  mismatch: {text[:60]!r} torch={r} onnx={c}")
+    if agreement < args.min_agreement:
+        sys.exit(f"ONNX backend agreement {agreement:.1%} is below the required {args.min_agreement:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Time JSON response encoding with the stdlib and orjson providers.
+
+Payloads are built from the real environment documents in
+firebase/seed_environment.py, with an ``updatedAt`` Firestore timestamp added
+as documents read back from Firestore would have, plus an emotion result with
+NumPy scores.  Each provider's ``response()`` is timed in a bare Flask app, the
+decoded bodies are checked to be equal, and the sizes of ``?fields=`` trimmed
+recommendations are printed next to the full ones.
+"""
+import argparse
+import datetime
+import math
+import os
+import sys
+import time
+
+import numpy as np
+from flask import Flask
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+from serialization import OrjsonProvider, StdlibJSONProvider, orjson, parse_fields, select_fields
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "firebase"))
+from seed_environment import env_data  # noqa: E402
+
+EMOTIONS = ["angry", "disgust", "fear", "happy", "neutral", "sad", "surprise"]
+
+
+def firestore_documents():
+    # Firestore stores microseconds
+    updated_at = DatetimeWithNanoseconds(2025, 6, 15, 9, 30, 0, 123456, tzinfo=datetime.timezone.utc)
+    return {env_id: {**details, "updatedAt": updated_at} for env_id, details in env_data.items()}
+
+
+def payloads():
+    docs = firestore_documents()
+    env_id = next(iter(docs))
+    scores = np.random.default_rng(0).dirichlet(np.ones(len(EMOTIONS))).astype(np.float32) * 100
+    return {
+        "recommend_therapy": {"therapy": "Anxiety Therapy", "environmentId": env_id, "environment": docs[env_id]},
+        "environments": {"environments": docs},
+        "analyze_emotion": {"dominant_emotion": EMOTIONS[int(np.argmax(scores))],
+                            "emotion_scores": dict(zip(EMOTIONS, scores)), "result": "You seem calm.",
+                            "face_box": np.array([12, 40, 128, 128], dtype=np.int32)},
+    }
+
+
+def time_us(fn, iterations):
+    result = fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6, result
+
+
+def same_json(a, b):
+    # float32 scores: orjson writes the shortest float32 repr, the stdlib the widened float64
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-6)
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(same_json(a[key], b[key]) for key in a)
+    if isinstance(a, list):
+        return isinstance(b, list) and len(a) == len(b) and all(map(same_json, a, b))
+    return a == b
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time JSON response encoding with the stdlib and orjson providers")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--fields", default="environmentId,environment.title,environment.imageUrl,environment.videoUrl",
+                        help="?fields= spec applied to the recommendation payload")
+    args = parser.parse_args()
+
+    if orjson is None:
+        sys.exit("orjson is not installed (pip install orjson)")
+    app = Flask(__name__)
+    providers = {"stdlib": StdlibJSONProvider(app), "orjson": OrjsonProvider(app)}
+
+    with app.app_context():
+        for name, payload in payloads().items():
+            encode, respond, bodies = {}, {}, {}
+            for provider_name, provider in providers.items():
+                encode[provider_name], _ = time_us(lambda: provider.dumps(payload, separators=(",", ":")),
+                                                   args.iterations)
+                respond[provider_name], response = time_us(lambda: provider.response(payload), args.iterations)
+                bodies[provider_name] = response.get_data()
+            assert same_json(orjson.loads(bodies["stdlib"]), orjson.loads(bodies["orjson"])), name
+            print(f"{name:18s} {len(bodies['orjson']):6d} bytes | encode: stdlib {encode['stdlib']:6.1f} us, "
+                  f"orjson {encode['orjson']:5.1f} us ({encode['stdlib'] / encode['orjson']:4.1f}x) | "
+                  f"response: stdlib {respond['stdlib']:6.1f} us, orjson {respond['orjson']:5.1f} us")
+
+        full = payloads()["recommend_therapy"]
+        trimmed = select_fields(full, parse_fields(args.fields))
+        full_us, full_response = time_us(lambda: providers["orjson"].response(full), args.iterations)
+        trimmed_us, trimmed_response = time_us(lambda: providers["orjson"].response(trimmed), args.iterations)
+        print(f"recommend_therapy?fields={args.fields}: {len(trimmed_response.get_data())} bytes vs "
+              f"{len(full_response.get_data())} ({trimmed_us:.1f} us vs {full_us:.1f} us)")
+
+
+if __name__ == "__main__":
+    main()
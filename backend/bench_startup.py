@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SAMPLE_RESPONSES = [5, "Yes", "No", "Yes", "High", "Medium", "No", "No", "Yes", "No", "No", 6, "Yes", 3, 4]
+
+# Runs in a fresh interpreter: import the app, then time the first request to one route.
+FIRST_REQUEST = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.post(sys.argv[1], json=json.loads(sys.argv[2]))
+finished = time.perf_counter()
+print(json.dumps({"status": response.status_code, "import_ms": (imported - started) * 1000,
+                  "first_request_ms": (finished - imported) * 1000}))
+"""
+
+ROUTES = {
+    "/predict_pre_therapy": {"responses": SAMPLE_RESPONSES},
+    "/assess": {"responses": SAMPLE_RESPONSES},
+    "/sentiment": {"text": "I feel calmer today"},
+}
+
+
+def import_times():
+    """Parse ``-X importtime`` output for ``import app``.
+
+    Returns ``{module: (self_us, cumulative_us, depth)}`` for app and every
+    module first imported underneath it, depth 1 being app's direct imports.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            capture_output=True, text=True, env={**os.environ, "MODEL_WARM_UP": "lazy"})
+    if result.returncode != 0:
+        sys.exit(result.stderr[-2000:])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        if name.strip() == "app" and depth == 0:
+            break
+    # Children are logged before their parent: walk back from app to the previous top-level import.
+    modules = {}
+    for name, self_us, cumulative_us, depth in reversed(rows):
+        if modules and depth == 0:
+            break
+        modules[name] = (self_us, cumulative_us, depth)
+    return modules
+
+
+def first_request(route):
+    result = subprocess.run([sys.executable, "-c", FIRST_REQUEST, route, json.dumps(ROUTES[route])],
+                            capture_output=True, text=True, env={**os.environ, "MODEL_WARM_UP": "lazy"})
+    if result.returncode != 0:
+        sys.exit(result.stderr[-2000:])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time and cold first-request report for app.py")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    parser.add_argument("--routes", nargs="*", choices=sorted(ROUTES), default=["/predict_pre_therapy"])
+    parser.add_argument("--save", help="Write the measurements to this JSON file")
+    parser.add_argument("--baseline", help="Fail if import time regresses against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown over the baseline")
+    args = parser.parse_args()
+
+    modules = import_times()
+    total_ms = modules["app"][1] / 1000
+    print(f"import app: {total_ms:.0f} ms cumulative (-X importtime)")
+    print(f"{'cumulative ms':>14s} {'self ms':>8s}  module")
+    # Direct imports of app, slowest first
+    slowest = sorted(((cumulative, own, name) for name, (own, cumulative, depth) in modules.items()
+                      if depth == 1), reverse=True)
+    for cumulative, own, name in slowest[:args.top]:
+        print(f"{cumulative / 1000:14.1f} {own / 1000:8.1f}  {name}")
+
+    report = {"import_ms": total_ms, "first_request": {}}
+    for route in args.routes:
+        timing = first_request(route)
+        report["first_request"][route] = timing
+        print(f"cold {route}: import {timing['import_ms']:.0f} ms + first request "
+              f"{timing['first_request_ms']:.0f} ms (status {timing['status']})")
+
+    heavy_modules = ("torch", "transformers", "tensorflow", "deepface", "cv2", "google.cloud.firestore")
+    heavy = [name for name in heavy_modules if name in modules]
+    report["heavy_modules_at_import"] = heavy
+    if heavy:
+        print(f"heavy modules imported by 'import app': {', '.join(heavy)}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        limit = baseline["import_ms"] * (1 + args.tolerance)
+        if total_ms > limit or len(heavy) > len(baseline.get("heavy_modules_at_import", [])):
+            sys.exit(f"Startup regression: import took {total_ms:.0f} ms (limit {limit:.0f} ms), "
+                     f"heavy modules {heavy}")
+        print(f"within {args.tolerance:.0%} of baseline import time {baseline['import_ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""Resolve Google Drive file IDs to ``webContentLink`` download URLs.
+
+Links change only when a file is replaced, so results are cached per file ID
+for ``ttl`` seconds.  Concurrent lookups of the same uncached ID share one
+Drive call (single flight), and ``resolve_many`` fetches every ID that is
+neither cached nor already in flight through one Drive batch request (up to
+``BATCH_LIMIT`` calls per HTTP round trip).
+
+``httplib2.Http`` keeps its connections alive but is not thread-safe, so the
+resolver holds a small pool of authorized ``Http`` objects and each call
+checks one out; the Drive service object itself is built once from the
+bundled discovery document.  The Google client libraries are imported when
+the resolver is built, not when the app starts.
+
+The resolver is also the origin for the ``/media`` proxy (see
+``media_cache.py``): ``stat_media`` reads a file's size, type and checksum and
+``download_media`` copies its content in ranged chunks.
+
+Environments store links rather than bare IDs, so ``drive_file_id`` pulls
+the ID out of Drive share links, and ``linked_file_ids`` lists the files an
+environment links to.  Anything that is not a Drive link (the
+YouTube embeds) is returned unchanged by the routes.
+"""
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+DRIVE_ROOT_URL = "https://www.googleapis.com/"
+# Drive rejects batches of more than 100 calls
+BATCH_LIMIT = 100
+DOWNLOAD_CHUNK_BYTES = 4 * 1024 * 1024
+
+_DRIVE_LINK_PATTERNS = (
+    re.compile(r"drive\.google\.com/file/d/([\w-]+)"),
+    re.compile(r"drive\.google\.com/.*[?&]id=([\w-]+)"),
+)
+_FILE_ID = re.compile(r"^[\w-]{10,}$")
+
+
+class MediaNotFound(Exception):
+    pass
+
+
+class DriveUnavailable(Exception):
+    pass
+
+
+def drive_file_id(value):
+    """File ID for a bare ID or a Drive share/download link, else None."""
+    if not isinstance(value, str):
+        return None
+    for pattern in _DRIVE_LINK_PATTERNS:
+        match = pattern.search(value)
+        if match:
+            return match.group(1)
+    return value if _FILE_ID.match(value) else None
+
+
+def linked_file_ids(value):
+    """Every Drive file ID linked from the strings in a nested document (bare IDs are not counted)."""
+    if isinstance(value, str):
+        for pattern in _DRIVE_LINK_PATTERNS:
+            match = pattern.search(value)
+            if match:
+                yield match.group(1)
+                break
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from linked_file_ids(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from linked_file_ids(item)
+
+
+def _as_error(file_id, error):
+    from googleapiclient.errors import HttpError
+
+    if isinstance(error, HttpError) and error.resp.status == 404:
+        return MediaNotFound(f"Drive file '{file_id}' not found")
+    return DriveUnavailable(f"Drive lookup for '{file_id}' failed: {str(error)}")
+
+
+class DriveMediaResolver:
+    def __init__(self, credentials, ttl=3600.0, pool_size=4, timeout=10.0, root_url=DRIVE_ROOT_URL):
+        self.credentials = credentials
+        self.ttl = ttl
+        self.timeout = timeout
+        self.batch_uri = f"{root_url}batch/drive/v3"
+        self._pool = queue.LifoQueue()
+        self._pool_slots = threading.Semaphore(pool_size)
+        self._cache = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "drive_calls": 0, "batches": 0, "errors": 0,
+                          "stale_served": 0}
+        from googleapiclient.discovery import build
+
+        self.service = build('drive', 'v3', http=self._new_http(),
+                             client_options={"api_endpoint": f"{root_url}drive/v3/"}, cache_discovery=False)
+
+    def _new_http(self):
+        import certifi
+        import httplib2
+        from google_auth_httplib2 import AuthorizedHttp
+
+        return AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self.timeout, ca_certs=certifi.where()))
+
+    @contextmanager
+    def _http(self):
+        # At most pool_size checked out; idle ones keep their keep-alive connections
+        with self._pool_slots:
+            try:
+                http = self._pool.get_nowait()
+            except queue.Empty:
+                http = self._new_http()
+            try:
+                yield http
+            finally:
+                self._pool.put(http)
+
+    def _file_request(self, file_id):
+        return self.service.files().get(fileId=file_id, fields='webContentLink', supportsAllDrives=True)
+
+    def resolve(self, file_id):
+        """``webContentLink`` for one file ID; raises ``MediaNotFound`` or ``DriveUnavailable``."""
+        result = self.resolve_many([file_id])[file_id]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def resolve_many(self, file_ids):
+        """Map each file ID to its ``webContentLink`` (None if the file has none) or to the exception for it."""
+        now = time.monotonic()
+        results = {}
+        waiting = {}
+        owned = {}
+        with self._lock:
+            for file_id in dict.fromkeys(file_ids):
+                cached = self._cache.get(file_id)
+                if cached is not None and cached[1] > now:
+                    self._counters["hits"] += 1
+                    results[file_id] = cached[0]
+                elif file_id in self._inflight:
+                    self._counters["coalesced"] += 1
+                    waiting[file_id] = self._inflight[file_id]
+                else:
+                    self._counters["misses"] += 1
+                    owned[file_id] = self._inflight[file_id] = Future()
+
+        if owned:
+            self._fetch(owned)
+        for file_id, future in {**owned, **waiting}.items():
+            error = future.exception()
+            results[file_id] = error if error is not None else future.result()
+        return results
+
+    def _fetch(self, futures):
+        # Every future must be completed, or later callers for the same ID would wait forever
+        error = "no response for this file in the Drive batch"
+        try:
+            file_ids = list(futures)
+            for start in range(0, len(file_ids), BATCH_LIMIT):
+                chunk = file_ids[start:start + BATCH_LIMIT]
+                fetched = self._fetch_one(chunk[0]) if len(chunk) == 1 else self._fetch_batch(chunk)
+                self._complete(futures, fetched)
+        except Exception as e:
+            logger.error(f"Drive lookup failed for {len(futures)} files: {str(e)}")
+            error = str(e)
+        finally:
+            self._complete(futures, {file_id: DriveUnavailable(f"Drive lookup for '{file_id}' failed: {error}")
+                                     for file_id, future in futures.items() if not future.done()})
+
+    def _fetch_one(self, file_id):
+        from googleapiclient.errors import HttpError
+
+        with self._lock:
+            self._counters["drive_calls"] += 1
+        with self._http() as http:
+            try:
+                file = self._file_request(file_id).execute(http=http, num_retries=2)
+            except HttpError as e:
+                return {file_id: _as_error(file_id, e)}
+        return {file_id: file.get('webContentLink')}
+
+    def _fetch_batch(self, file_ids):
+        from googleapiclient.http import BatchHttpRequest
+
+        fetched = {}
+
+        def on_response(request_id, response, exception):
+            fetched[request_id] = _as_error(request_id, exception) if exception else response.get('webContentLink')
+
+        batch = BatchHttpRequest(callback=on_response, batch_uri=self.batch_uri)
+        for file_id in file_ids:
+            batch.add(self._file_request(file_id), request_id=file_id)
+        with self._lock:
+            self._counters["drive_calls"] += len(file_ids)
+            self._counters["batches"] += 1
+        with self._http() as http:
+            batch.execute(http=http)
+        return fetched
+
+    def _complete(self, futures, fetched):
+        expires_at = time.monotonic() + self.ttl
+        fetched = {file_id: result for file_id, result in fetched.items() if file_id in futures}
+        with self._lock:
+            for file_id, result in fetched.items():
+                if isinstance(result, Exception):
+                    self._counters["errors"] += 1
+                    # An expired link is still better than none while Drive is unreachable
+                    stale = self._cache.get(file_id)
+                    if isinstance(result, DriveUnavailable) and stale is not None:
+                        self._counters["stale_served"] += 1
+                        fetched[file_id] = stale[0]
+                else:
+                    self._cache[file_id] = (result, expires_at)
+                self._inflight.pop(file_id, None)
+        for file_id, result in fetched.items():
+            if isinstance(result, Exception):
+                futures[file_id].set_exception(result)
+            else:
+                futures[file_id].set_result(result)
+
+    def stat_media(self, file_id):
+        """``{"size", "content_type", "checksum"}`` for a file; raises ``MediaNotFound`` or ``DriveUnavailable``."""
+        from googleapiclient.errors import HttpError
+
+        with self._http() as http:
+            try:
+                file = self.service.files().get(fileId=file_id, fields='size,mimeType,md5Checksum',
+                                                supportsAllDrives=True).execute(http=http, num_retries=2)
+            except HttpError as e:
+                raise _as_error(file_id, e)
+        if 'size' not in file:
+            # Google Docs and other native files have no downloadable content
+            raise MediaNotFound(f"Drive file '{file_id}' has no binary content")
+        return {"size": int(file['size']), "content_type": file.get('mimeType') or "application/octet-stream",
+                "checksum": file.get('md5Checksum')}
+
+    def download_media(self, file_id, fileobj, chunk_size=DOWNLOAD_CHUNK_BYTES):
+        """Write a file's content to ``fileobj`` in ranged requests, flushing after every chunk."""
+        from googleapiclient.errors import HttpError
+        from googleapiclient.http import MediaIoBaseDownload
+
+        request = self.service.files().get_media(fileId=file_id, supportsAllDrives=True)
+        # Its own connection: a long download must not hold one of the lookup pool's
+        request.http = self._new_http()
+        downloader = MediaIoBaseDownload(fileobj, request, chunksize=chunk_size)
+        done = False
+        try:
+            while not done:
+                _, done = downloader.next_chunk(num_retries=2)
+                fileobj.flush()
+        except HttpError as e:
+            raise _as_error(file_id, e)
+        finally:
+            request.http.close()
+
+    def invalidate(self, file_id=None):
+        with self._lock:
+            if file_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(file_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {"cached": len(self._cache), "in_flight": len(self._inflight),
+                    "idle_connections": self._pool.qsize(), **self._counters}
+
+
+def load_drive_credentials(service_account_key, default_path, root_url=DRIVE_ROOT_URL):
+    """Service-account credentials from a key file path or inline JSON, falling back to ``default_path``.
+
+    A stand-in Drive API (``root_url`` other than Google's, as in the benchmarks)
+    gets anonymous credentials.
+    """
+    if root_url != DRIVE_ROOT_URL:
+        from google.auth.credentials import AnonymousCredentials
+
+        return AnonymousCredentials()
+    from google.oauth2.service_account import Credentials
+
+    if service_account_key:
+        if os.path.exists(service_account_key):
+            return Credentials.from_service_account_file(service_account_key, scopes=DRIVE_SCOPES)
+        try:
+            return Credentials.from_service_account_info(json.loads(service_account_key), scopes=DRIVE_SCOPES)
+        except json.JSONDecodeError:
+            logger.warning("GOOGLE_SERVICE_ACCOUNT_KEY is neither a file nor valid JSON, trying the default key file")
+    if os.path.exists(default_path):
+        return Credentials.from_service_account_file(default_path, scopes=DRIVE_SCOPES)
+    raise EnvironmentError(f"Google service account credentials not found at default path: {default_path}")
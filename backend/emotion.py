@@ -0,0 +1,155 @@
+"""Boot-time DeepFace emotion model and face detector.
+
+DeepFace builds models lazily on the first ``analyze`` call, so without this
+the first request in every worker pays the full TensorFlow model build.
+``EmotionAnalyzer`` builds the emotion model and the configured detector
+backend once and runs a warm-up inference before the service takes traffic.
+
+Rather than handing full frames to ``DeepFace.analyze``, requests go through
+an explicit pipeline: bounded decode (see ``image_preprocessing``), face
+detection, crop of the largest face, and a pre-normalised 48x48 grayscale
+tensor fed straight to the emotion network.  Each stage's latency is
+recorded per request and in histograms.
+
+Supported detectors are DeepFace's: ``opencv`` (Haar cascade, the default),
+``ssd``, ``yunet``, ``mtcnn``, ``retinaface``, ``mediapipe``, ``yolov8``,
+``centerface`` and ``skip`` (treat the whole frame as the face).
+"""
+import logging
+import time
+
+import numpy as np
+
+from image_preprocessing import DEFAULT_MAX_DECODE_SIDE, DEFAULT_MAX_IMAGE_BYTES, decode_image
+from metrics import LATENCY_MS_BUCKETS, Histogram
+
+logger = logging.getLogger(__name__)
+
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+EMOTION_INPUT_SIZE = (48, 48)
+PIPELINE_STAGES = ("decode", "detect", "crop", "predict")
+
+
+def aggregate_emotions(results):
+    """Average per-image emotion scores and return ``(dominant_emotion, mean_scores)``."""
+    mean_scores = {
+        label: sum(scores[label] for _, scores in results) / len(results) for label in EMOTION_LABELS
+    }
+    return max(mean_scores, key=mean_scores.get), mean_scores
+
+
+class EmotionAnalyzer:
+    def __init__(self, detector_backend="opencv", warm_up=True, max_image_bytes=DEFAULT_MAX_IMAGE_BYTES,
+                 max_decode_side=DEFAULT_MAX_DECODE_SIDE):
+        from deepface import DeepFace
+
+        self.detector_backend = detector_backend
+        self.max_image_bytes = max_image_bytes
+        self.max_decode_side = max_decode_side
+        self.stage_ms = {stage: Histogram(LATENCY_MS_BUCKETS) for stage in PIPELINE_STAGES}
+
+        start = time.perf_counter()
+        self.emotion_model = DeepFace.build_model(model_name="Emotion", task="facial_attribute")
+        self.detector = None
+        if detector_backend != "skip":
+            self.detector = DeepFace.build_model(model_name=detector_backend, task="face_detector")
+        if warm_up:
+            self.analyze(np.zeros((224, 224, 3), dtype=np.uint8))
+        logger.info(f"Emotion model and '{detector_backend}' detector ready in {time.perf_counter() - start:.2f}s")
+
+    def _record(self, timings, stage, started):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stage_ms[stage].observe(elapsed_ms)
+        if timings is not None:
+            # Batches run a stage several times; report the total.
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed_ms, 3)
+
+    def detect_faces(self, img):
+        """Return the detector's facial areas for a BGR image (empty for ``skip``)."""
+        if self.detector is None:
+            return []
+        return self.detector.detect_faces(img)
+
+    def face_tensor(self, img, timings=None):
+        """Crop the largest detected face and return it as a (48, 48, 1) float32 array in [0, 1].
+
+        Falls back to the whole frame when no face is found, matching
+        ``enforce_detection=False``.
+        """
+        import cv2
+
+        started = time.perf_counter()
+        faces = self.detect_faces(img)
+        self._record(timings, "detect", started)
+
+        started = time.perf_counter()
+        face = img
+        if faces:
+            area = max(faces, key=lambda f: f.w * f.h)
+            height, width = img.shape[:2]
+            x, y = max(int(area.x), 0), max(int(area.y), 0)
+            x2, y2 = min(x + int(area.w), width), min(y + int(area.h), height)
+            if x2 > x and y2 > y:
+                face = img[y:y2, x:x2]
+        gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+        gray = cv2.resize(gray, EMOTION_INPUT_SIZE, interpolation=cv2.INTER_AREA)
+        tensor = (gray.astype(np.float32) / 255.0)[:, :, np.newaxis]
+        self._record(timings, "crop", started)
+        return tensor
+
+    def predict_tensors(self, tensors, timings=None):
+        """Run the emotion network once over stacked face tensors.
+
+        Returns one ``(dominant_emotion, emotion_scores)`` pair per tensor,
+        with scores as percentages like ``DeepFace.analyze``.
+        """
+        started = time.perf_counter()
+        batch = np.stack(tensors).astype(np.float32, copy=False)
+        predictions = np.asarray(self.emotion_model.model.predict(batch, verbose=0), dtype=np.float64)
+        self._record(timings, "predict", started)
+
+        results = []
+        for row in predictions:
+            total = row.sum() or 1.0
+            scores = {label: float(100 * value / total) for label, value in zip(EMOTION_LABELS, row)}
+            results.append((EMOTION_LABELS[int(np.argmax(row))], scores))
+        return results
+
+    def decode(self, buf, timings=None):
+        started = time.perf_counter()
+        img = decode_image(buf, max_bytes=self.max_image_bytes, max_side=self.max_decode_side)
+        self._record(timings, "decode", started)
+        return img
+
+    def analyze(self, img, timings=None):
+        """Return ``(dominant_emotion, emotion_scores)`` for the most prominent face in a BGR image."""
+        return self.predict_tensors([self.face_tensor(img, timings)], timings)[0]
+
+    def analyze_encoded(self, buf, timings=None):
+        """Decode an encoded image buffer and analyze it; raises ``ImageTooLarge``/``InvalidImage``."""
+        return self.analyze(self.decode(buf, timings), timings)
+
+    def analyze_encoded_batch(self, buffers, timings=None):
+        """Analyze several encoded images with a single emotion-model forward pass.
+
+        Returns one entry per input, in order: either ``(dominant_emotion,
+        emotion_scores)`` or the exception that made that image unusable.
+        """
+        results = [None] * len(buffers)
+        tensors, positions = [], []
+        for position, buf in enumerate(buffers):
+            try:
+                tensors.append(self.face_tensor(self.decode(buf, timings), timings))
+                positions.append(position)
+            except ValueError as e:
+                results[position] = e
+        if tensors:
+            for position, result in zip(positions, self.predict_tensors(tensors, timings)):
+                results[position] = result
+        return results
+
+    def stats(self):
+        return {
+            "detector_backend": self.detector_backend,
+            "stage_ms": {stage: histogram.snapshot() for stage, histogram in self.stage_ms.items()},
+        }
@@ -0,0 +1,220 @@
+"""Process-wide in-memory cache of the Firestore ``environments`` collection.
+
+The collection is small and almost static, so the whole thing is loaded at
+boot and kept current by an ``on_snapshot`` listener.  If no listener event
+has been seen for ``ttl`` seconds the catalog is reloaded in the background
+and the listener restarted; requests keep being served from the last known
+state in the meantime.  Firestore only calls the listener when something
+changes and does not report a stream that has died, so a listener counts as
+alive only while it has delivered a snapshot within ``ttl`` and has not
+failed.
+
+While the catalog is fresh and the listener is alive, an ID that is not in it
+does not exist.  Otherwise an unknown ID is read from Firestore once, and a
+miss is remembered until the next listener event or reload.
+
+Every document carries a strong ETag, the SHA-256 of its canonical JSON (the
+same hash the seeder stores in ``_contentHash``, which is dropped from the
+served document), and the whole collection has one derived from the sorted
+per-document ETags.  Every worker computes the same values from the same
+content, so a validator from one worker is good at any other.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Written by firebase/seed_environment.py; bookkeeping, not content
+HASH_FIELD = "_contentHash"
+
+
+def _canonical_default(value):
+    # Firestore references, timestamps and geo points are not JSON types
+    return getattr(value, "path", None) or str(value)
+
+
+def content_etag(doc):
+    canonical = json.dumps(doc, sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+                           default=_canonical_default)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _entry(doc):
+    """``(document, etag)`` for a raw Firestore document dict."""
+    doc = {key: value for key, value in (doc or {}).items() if key != HASH_FIELD}
+    return doc, content_etag(doc)
+
+
+class EnvironmentCatalog:
+    def __init__(self, collection_ref, ttl=300.0):
+        self.collection_ref = collection_ref
+        self.ttl = ttl
+        self._entries = {}
+        self._listing = None
+        self._missing = frozenset()
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._watch = None
+        self._last_sync = 0.0
+        # time.monotonic() of the current listener's last snapshot, None until its first
+        self._listener_event = None
+        self._listener_failed = False
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "firestore_reads": 0,
+            "stale_reads": 0,
+            "reloads": 0,
+            "listener_events": 0,
+            "listener_restarts": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def start(self):
+        """Load the full collection and subscribe to changes."""
+        self.reload()
+        self._subscribe()
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def reload(self):
+        entries = {doc.id: _entry(doc.to_dict()) for doc in self.collection_ref.stream()}
+        with self._lock:
+            self._entries = entries
+            self._missing = frozenset()
+            self._last_sync = time.monotonic()
+            self._counters["reloads"] += 1
+        logger.info(f"Loaded {len(entries)} environments into catalog")
+
+    def _subscribe(self):
+        with self._lock:
+            self._listener_event = None
+            self._listener_failed = False
+        try:
+            self._watch = self.collection_ref.on_snapshot(self._on_snapshot)
+        except Exception as e:
+            self._watch = None
+            with self._lock:
+                self._listener_failed = True
+            logger.error(f"Failed to start environments listener: {str(e)}")
+
+    def _on_snapshot(self, col_snapshot, changes, read_time):
+        try:
+            with self._lock:
+                entries = dict(self._entries)
+                for change in changes:
+                    if change.type.name == "REMOVED":
+                        entries.pop(change.document.id, None)
+                    else:
+                        entries[change.document.id] = _entry(change.document.to_dict())
+                self._entries = entries
+                self._missing = frozenset()
+                self._last_sync = self._listener_event = time.monotonic()
+                self._counters["listener_events"] += 1
+        except Exception as e:
+            # Changes were lost: stop trusting the listener until it is restarted
+            with self._lock:
+                self._listener_failed = True
+            logger.error(f"Applying environments listener changes failed: {str(e)}")
+
+    def _listener_alive(self):
+        with self._lock:
+            if self._watch is None or self._listener_failed or self._listener_event is None:
+                return False
+            return time.monotonic() - self._listener_event <= self.ttl
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+
+        def refresh():
+            try:
+                self.reload()
+                if not self._listener_alive():
+                    # Dead, failed, or just quiet: a new listener's first snapshot proves it is streaming
+                    logger.info("No recent environments listener snapshot, restarting the listener")
+                    self.stop()
+                    self._subscribe()
+                    self._count("listener_restarts")
+            except Exception as e:
+                logger.error(f"Background environment catalog reload failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._reloading = False
+
+        threading.Thread(target=refresh, name="environment-catalog-refresh", daemon=True).start()
+
+    def get(self, environment_id):
+        """Return the cached document dict (do not mutate it), or ``None`` if it does not exist."""
+        entry = self.entry(environment_id)
+        return entry[0] if entry is not None else None
+
+    def entry(self, environment_id):
+        """Return ``(document, etag)`` for one environment, or ``None`` if it does not exist.
+
+        Unknown IDs fall through to a direct Firestore read only when the
+        catalog may be behind (stale or no listener), and at most once until
+        the next sync.
+        """
+        stale = time.monotonic() - self._last_sync > self.ttl
+        if stale:
+            self._count("stale_reads")
+            self._refresh_in_background()
+
+        entry = self._entries.get(environment_id)
+        if entry is not None:
+            self._count("hits")
+            return entry
+
+        self._count("misses")
+        if (not stale and self._listener_alive()) or environment_id in self._missing:
+            return None
+
+        self._count("firestore_reads")
+        snapshot = self.collection_ref.document(environment_id).get()
+        with self._lock:
+            if not snapshot.exists:
+                self._missing = self._missing | {environment_id}
+                return None
+            entry = _entry(snapshot.to_dict())
+            entries = dict(self._entries)
+            entries[environment_id] = entry
+            self._entries = entries
+        return entry
+
+    def all(self):
+        return {environment_id: doc for environment_id, (doc, _) in self._entries.items()}
+
+    def listing(self):
+        """Return ``(documents by ID, collection etag)``, computed once per catalog change."""
+        entries = self._entries
+        listing = self._listing
+        if listing is None or listing[0] is not entries:
+            digest = hashlib.sha256()
+            for environment_id in sorted(entries):
+                digest.update(f"{environment_id}:{entries[environment_id][1]}\n".encode("utf-8"))
+            docs = {environment_id: entries[environment_id][0] for environment_id in sorted(entries)}
+            listing = self._listing = (entries, docs, digest.hexdigest())
+        return listing[1], listing[2]
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "size": len(self._entries),
+            "known_missing": len(self._missing),
+            "seconds_since_sync": round(time.monotonic() - self._last_sync, 3),
+            "listener_active": self._listener_alive(),
+        }
@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+
+import torch
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from sentiment_backends import DEFAULT_ONNX_DIR, SENTIMENT_MODEL
+
+
+def export(model_id, output_dir, opset):
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = AutoModelForSequenceClassification.from_pretrained(model_id)
+    model.eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=opset,
+        )
+
+    quant_path = os.path.join(output_dir, "model.quant.onnx")
+    quantize_dynamic(fp32_path, quant_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    # Only tokenizer.json is needed at runtime; it is loaded with the
+    # standalone tokenizers package.
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, "labels.json"), "w") as f:
+        json.dump({
+            "model_id": model_id,
+            "id2label": {str(k): v for k, v in model.config.id2label.items()},
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+        }, f, indent=2)
+
+    print(f"Wrote {quant_path} ({os.path.getsize(quant_path) / 1e6:.1f} MB) and tokenizer to {output_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the sentiment model to int8-quantized ONNX")
+    parser.add_argument("--model", default=SENTIMENT_MODEL)
+    parser.add_argument("--output-dir", default=DEFAULT_ONNX_DIR)
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+    export(args.model, args.output_dir, args.opset)
+
+
+if __name__ == "__main__":
+    main()
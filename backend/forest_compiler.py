@@ -0,0 +1,144 @@
+"""Flattened, array-backed evaluator for fitted RandomForestClassifier models.
+
+The per-request cost of ``RandomForestClassifier.predict`` on a single row is
+dominated by input validation and per-tree dispatch rather than by the trees
+themselves.  ``CompiledForest`` copies every tree into one set of contiguous
+node arrays at load time and walks all trees for all rows at once with NumPy
+indexing, so one prediction is a handful of vector operations.
+"""
+import numpy as np
+
+
+class CompiledForest:
+    def __init__(self, feature, threshold, left, right, value, roots, classes, n_features, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.n_features_in_ = n_features
+        self.max_depth = max_depth
+        # Interleaved (left, right) pairs so one gather picks the next node.
+        self.children = np.ascontiguousarray(np.stack([left, right], axis=1).ravel())
+        self.chunk_size = 256
+
+    def __setstate__(self, state):
+        # Loaded with mmap_mode the arrays arrive as np.memmap; plain ndarray
+        # views of the same pages skip the subclass overhead on every gather.
+        self.__dict__.update({
+            key: np.asarray(value) if isinstance(value, np.ndarray) else value
+            for key, value in state.items()
+        })
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Compile a fitted scikit-learn ``RandomForestClassifier``."""
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests can be compiled")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes, dtype=np.intp)
+            is_leaf = tree.children_left == -1
+
+            # Leaves point at themselves so every row can take the same number
+            # of steps regardless of the depth at which its tree terminates.
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.intp))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold).astype(np.float64))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+            # Same normalisation as DecisionTreeClassifier.predict_proba.
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features)),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds)),
+            left=np.ascontiguousarray(np.concatenate(lefts).astype(np.intp)),
+            right=np.ascontiguousarray(np.concatenate(rights).astype(np.intp)),
+            value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.intp),
+            classes=np.asarray(model.classes_),
+            n_features=int(model.n_features_in_),
+            max_depth=int(max_depth),
+        )
+
+    def _as_matrix(self, X):
+        # sklearn evaluates splits on float32 copies of the input; do the same
+        # so thresholds compare identically.
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected input with {self.n_features_in_} features, got shape {X.shape}")
+        if np.isnan(X).any():
+            raise ValueError("Input contains NaN")
+        return X
+
+    def apply(self, X):
+        """Return the global leaf index reached in every tree, shape (n_rows, n_trees)."""
+        X = self._as_matrix(X)
+        if len(X) <= self.chunk_size:
+            return self._apply(X)
+        return np.concatenate([self._apply(X[i:i + self.chunk_size]) for i in range(0, len(X), self.chunk_size)])
+
+    def _apply(self, X):
+        # Compare in float64 against the float64 thresholds, as sklearn does.
+        flat = X.astype(np.float64).ravel()
+        row_offsets = (np.arange(len(X), dtype=np.intp) * X.shape[1])[:, np.newaxis]
+        nodes = np.repeat(self.roots[np.newaxis, :], len(X), axis=0)
+        for _ in range(self.max_depth):
+            offsets = self.feature.take(nodes)
+            offsets += row_offsets
+            go_right = flat.take(offsets) > self.threshold.take(nodes)
+            nodes *= 2
+            nodes += go_right
+            nodes = self.children.take(nodes)
+        return nodes
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        if len(leaves) < 32:
+            # cumsum accumulates trees strictly in order, matching the
+            # sequential sum in RandomForestClassifier.predict_proba bit for bit.
+            total = np.cumsum(self.value[leaves], axis=1)[:, -1, :]
+        else:
+            # Same order of additions, without materialising every tree's votes.
+            total = np.zeros((len(leaves), self.value.shape[1]))
+            for tree in range(leaves.shape[1]):
+                total += self.value.take(leaves[:, tree], axis=0)
+        return total / len(self.roots)
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def check_equivalent(self, model, X):
+        """Raise ``ValueError`` if ``model`` and this evaluator disagree on ``X``."""
+        X = self._as_matrix(X)
+        expected = model.predict(X)
+        actual = self.predict(X)
+        mismatches = np.flatnonzero(expected != actual)
+        if mismatches.size:
+            raise ValueError(
+                f"Compiled forest disagrees with the source model on {mismatches.size} of {len(X)} rows "
+                f"(first mismatch at row {int(mismatches[0])})"
+            )
+
+
+def probe_inputs(n_features, n_rows=512, low=0, high=10, seed=0):
+    """Deterministic integer-valued rows spanning the questionnaire value range."""
+    rng = np.random.default_rng(seed)
+    return rng.integers(low, high + 1, size=(n_rows, n_features)).astype(np.float32)
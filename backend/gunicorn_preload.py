@@ -0,0 +1,56 @@
+"""Production gunicorn profile: load models once in the master and fork workers.
+
+    gunicorn -c gunicorn_preload.py app:app
+
+With ``preload_app`` the master imports ``app`` and loads every fork-safe
+model in the registry before forking, so workers share those pages
+copy-on-write instead of each holding a private copy.  The garbage collector is kept off while the models
+load and everything is frozen into the permanent generation just before
+fork, so collections in the workers never write to the shared objects.
+
+Anything that does not survive fork() (the Firestore gRPC channel, snapshot
+listener, batcher threads, SQLite handles and the vision process pool) is
+registered as not fork-safe and loaded in each worker, in the background
+after ``app.start_services()`` runs from ``post_fork``.  Workers combine
+their ``/metrics`` through a shared store and flush it once more on exit.
+"""
+import gc
+import os
+
+# Read by app.py at import: leave per-process services to post_fork.
+os.environ["DEFER_SERVICES"] = "1"
+os.environ.setdefault("MODEL_WARM_UP", "background")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+preload_app = True
+# Leaves room for MODEL_WARM_UP=eager, which builds the vision pool inside post_fork.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+
+# Avoid freeing objects between model loads: the holes it leaves get reused
+# by workers and copy the surrounding pages.
+gc.disable()
+
+
+def when_ready(server):
+    import app
+
+    app.models.warm_up(fork_safe_only=True)
+    gc.freeze()
+    server.log.info(f"Froze {gc.get_freeze_count()} objects before forking workers")
+
+
+def post_fork(server, worker):
+    gc.enable()
+    import app
+
+    # Passed explicitly: --workers on the command line overrides the value above
+    app.start_services(worker_processes=server.cfg.workers)
+
+
+def worker_exit(server, worker):
+    import app
+
+    # Counts since the last periodic flush would otherwise be lost from /metrics
+    app.instrumentation.flush()
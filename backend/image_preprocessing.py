@@ -0,0 +1,96 @@
+"""Size-bounded image decoding for the vision endpoints.
+
+Phone uploads are often 12+ megapixels while face detection works fine on a
+~1000 px frame.  ``decode_image`` rejects oversized payloads before decoding,
+reads the JPEG/PNG header to learn the dimensions and, when the image is
+large, asks OpenCV for a 1/2, 1/4 or 1/8 scale decode (``IMREAD_REDUCED_*``)
+so the full-resolution bitmap is never materialised.
+
+OpenCV is imported on the first decode, not when the module loads, so the
+API process does not pay for it until a vision route needs it.
+"""
+import struct
+
+import numpy as np
+
+DEFAULT_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+DEFAULT_MAX_DECODE_SIDE = 1024
+
+# Scale -> name of the cv2 imread flag that decodes at that fraction of the size
+_REDUCED_FLAGS = (
+    (8, "IMREAD_REDUCED_COLOR_8"),
+    (4, "IMREAD_REDUCED_COLOR_4"),
+    (2, "IMREAD_REDUCED_COLOR_2"),
+)
+
+# JPEG start-of-frame markers; C4 (DHT), C8 (JPG) and CC (DAC) share the range.
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+class ImageTooLarge(ValueError):
+    status_code = 413
+
+
+class InvalidImage(ValueError):
+    status_code = 400
+
+
+def image_dimensions(buf):
+    """Return ``(width, height)`` from a JPEG or PNG header, or ``None`` if unknown."""
+    data = memoryview(buf)
+    if len(data) >= 24 and data[:8] == b"\x89PNG\r\n\x1a\n":
+        width, height = struct.unpack(">II", data[16:24])
+        return width, height
+    if len(data) >= 4 and data[:2] == b"\xff\xd8":
+        offset = 2
+        while offset + 9 <= len(data):
+            if data[offset] != 0xFF:
+                return None
+            marker = data[offset + 1]
+            if marker == 0xFF:
+                offset += 1
+                continue
+            if marker in _JPEG_SOF_MARKERS:
+                height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+                return width, height
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                offset += 2
+                continue
+            segment_length = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+            offset += 2 + segment_length
+    return None
+
+
+def reduced_decode_flag(width, height, max_side=DEFAULT_MAX_DECODE_SIDE):
+    import cv2
+
+    factor = max(width, height) / max_side
+    for scale, flag in _REDUCED_FLAGS:
+        if factor >= scale:
+            return getattr(cv2, flag)
+    return cv2.IMREAD_COLOR
+
+
+def decode_image(buf, max_bytes=DEFAULT_MAX_IMAGE_BYTES, max_side=DEFAULT_MAX_DECODE_SIDE):
+    """Decode an encoded image buffer to a BGR array whose longest side is about ``max_side``."""
+    import cv2
+
+    if len(buf) > max_bytes:
+        raise ImageTooLarge(f"Image is {len(buf)} bytes, limit is {max_bytes}")
+    if len(buf) == 0:
+        raise InvalidImage("Image payload is empty")
+
+    np_arr = np.frombuffer(buf, np.uint8)
+    dimensions = image_dimensions(buf)
+    flag = reduced_decode_flag(*dimensions, max_side=max_side) if dimensions else cv2.IMREAD_COLOR
+    img = cv2.imdecode(np_arr, flag)
+    if img is None:
+        raise InvalidImage("Could not decode image")
+
+    # Formats without a parsed header (or a header that lies) are still
+    # bounded, just with a full decode followed by a resize.
+    longest = max(img.shape[:2])
+    if longest > max_side * 2:
+        scale = max_side / longest
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return img
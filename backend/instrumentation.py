@@ -0,0 +1,129 @@
+"""Named per-request spans, Server-Timing headers and Prometheus metrics.
+
+Routes wrap each stage in ``with instrumentation.span("predict"):``.  Spans
+are kept on ``flask.g`` for the current request only; ``after_request`` sums
+them per name, writes a ``Server-Timing`` header and records every span in
+a per-route, per-stage latency histogram.  Durations measured elsewhere
+(the vision worker processes report their own stage timings) are added with
+``record``.  Outside a request, for example in a background job, spans are
+not recorded.
+
+The cost is two ``perf_counter`` calls and a list append per span plus one
+histogram update per stage at the end of the request, so it stays on in
+production.
+
+Every gunicorn worker counts its own requests.  After ``share`` is given a
+``SqliteMetricStore``, a background thread writes this process's metrics to
+it every ``flush_interval`` seconds, and ``render`` returns the totals of all
+workers: the one answering the scrape flushes first, the others are at most
+one interval behind.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+from metrics import MetricFamily, render_prometheus
+
+logger = logging.getLogger(__name__)
+
+
+class Instrumentation:
+    def __init__(self, app=None):
+        self.requests = MetricFamily(
+            "mycalmia_requests_total", "Requests by route and status code.", "counter", ("route", "status"))
+        self.errors = MetricFamily(
+            "mycalmia_request_errors_total", "Responses with status >= 400 by route and status code.", "counter",
+            ("route", "status"))
+        self.request_ms = MetricFamily(
+            "mycalmia_request_duration_ms", "End-to-end request latency in milliseconds.", "histogram", ("route",))
+        self.stage_ms = MetricFamily(
+            "mycalmia_stage_duration_ms", "Latency of named stages within a request in milliseconds.", "histogram",
+            ("route", "stage"))
+        self.inferences = MetricFamily(
+            "mycalmia_model_inferences_total", "Inputs scored by each model version.", "counter", ("model", "version"))
+        self.families = [self.requests, self.errors, self.request_ms, self.stage_ms, self.inferences]
+        self.store = None
+        self._collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        g._spans = []
+        g._request_started = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        if not has_request_context() or "_spans" not in g:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            g._spans.append((name, (time.perf_counter() - started) * 1000))
+
+    def record(self, name, duration_ms):
+        if has_request_context() and "_spans" in g:
+            g._spans.append((name, duration_ms))
+
+    def count_inference(self, model, version, count=1):
+        self.inferences.labels(model, version).inc(count)
+
+    def _finish(self, response):
+        if "_spans" not in g:
+            return response
+        total_ms = (time.perf_counter() - g._request_started) * 1000
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+        stages = {}
+        for name, duration_ms in g._spans:
+            stages[name] = stages.get(name, 0.0) + duration_ms
+        for name, duration_ms in stages.items():
+            self.stage_ms.labels(route, name).observe(duration_ms)
+        self.request_ms.labels(route).observe(total_ms)
+        self.requests.labels(route, response.status_code).inc()
+        if response.status_code >= 400:
+            self.errors.labels(route, response.status_code).inc()
+
+        timing = [f"{name};dur={duration_ms:.2f}" for name, duration_ms in stages.items()]
+        timing.append(f"total;dur={total_ms:.2f}")
+        response.headers["Server-Timing"] = ", ".join(timing)
+        return response
+
+    def add_collector(self, collect):
+        """Also export the families returned by ``collect()``, called on every flush and scrape."""
+        self._collectors.append(collect)
+
+    def _collect(self):
+        return list(self.families) + [family for collect in self._collectors for family in collect()]
+
+    def share(self, store, flush_interval=1.0):
+        """Combine metrics with the other processes writing to ``store``."""
+        self.store = store
+        threading.Thread(target=self._flush_loop, args=(flush_interval,), name="metrics-flush", daemon=True).start()
+
+    def _flush_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Writing metrics to the shared store failed: {str(e)}")
+
+    def flush(self):
+        if self.store is not None:
+            self.store.write(self._collect())
+
+    def render(self):
+        families = self._collect()
+        if self.store is None:
+            return render_prometheus(families)
+        self.store.write(families)
+        return self.store.render(families)
@@ -0,0 +1,130 @@
+"""Background jobs with pollable results.
+
+``JobRunner`` accepts work, returns a job ID immediately and runs the work on
+a bounded thread pool.  Status and results go to a job store:
+
+* ``MemoryJobStore`` - bounded in-process dict with TTL, only visible to the
+  worker that accepted the job;
+* ``SqliteJobStore`` - a local SQLite file, so whichever gunicorn worker
+  receives ``GET /jobs/<id>`` can answer it.
+
+Job records are plain dicts: ``jobId``, ``status`` (``queued``, ``running``,
+``done`` or ``failed``), and ``result`` or ``error``/``statusCode``.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class MemoryJobStore:
+    def __init__(self, max_jobs=1000, ttl=600.0):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        while self._jobs:
+            job_id, (expires, _) = next(iter(self._jobs.items()))
+            if expires > now and len(self._jobs) <= self.max_jobs:
+                break
+            self._jobs.pop(job_id)
+
+    def put(self, job):
+        now = time.time()
+        with self._lock:
+            self._jobs.pop(job["jobId"], None)
+            self._jobs[job["jobId"]] = (now + self.ttl, dict(job))
+            self._purge(now)
+
+    def get(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None or entry[0] <= time.time():
+                return None
+            return dict(entry[1])
+
+
+class SqliteJobStore:
+    def __init__(self, path, ttl=600.0):
+        self.ttl = ttl
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, expires REAL, body TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires)")
+        self._lock = threading.Lock()
+
+    def put(self, job):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, expires, body) VALUES (?, ?, ?)",
+                (job["jobId"], now + self.ttl, json.dumps(job)),
+            )
+            self._db.execute("DELETE FROM jobs WHERE expires <= ?", (now,))
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body FROM jobs WHERE id = ? AND expires > ?", (job_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+class JobRunner:
+    def __init__(self, store, workers=4, max_pending=64):
+        self.store = store
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args):
+        """Queue ``fn(*args)`` and return the new job record.
+
+        ``fn`` must return a JSON-serialisable result.  Exceptions with a
+        ``status_code`` attribute keep it in the failed job record.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"{self._pending} jobs already pending")
+            self._pending += 1
+        job = {"jobId": uuid.uuid4().hex, "kind": kind, "status": "queued", "createdAt": time.time()}
+        self.store.put(job)
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        try:
+            self.store.put({**job, "status": "running"})
+            result = fn(*args)
+            self.store.put({**job, "status": "done", "result": result, "finishedAt": time.time()})
+        except Exception as e:
+            logger.error(f"Job {job['jobId']} ({job['kind']}) failed: {str(e)}")
+            self.store.put({
+                **job,
+                "status": "failed",
+                "error": str(e),
+                "statusCode": getattr(e, "status_code", 500),
+                "finishedAt": time.time(),
+            })
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def stats(self):
+        return {"pending": self._pending, "max_pending": self.max_pending}
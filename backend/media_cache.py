@@ -0,0 +1,338 @@
+"""Size-bounded on-disk LRU cache of media files fetched from an origin.
+
+The origin is anything with ``stat_media`` and ``download_media``, in
+production the ``DriveMediaResolver``.
+
+Each cached file is stored as ``<root>/<file_id>`` plus a ``<file_id>.json``
+record of its size, content type and checksum.  A miss starts a fill: the
+origin's metadata is written first, then the content is downloaded into
+``<file_id>.part`` by a background thread and renamed into place once its
+size (and checksum, if the origin has one) is verified.
+
+Readers never wait for a fill to finish.  ``read`` streams any byte range
+from the part file as it grows, so the first viewer plays at origin speed and
+every concurrent viewer shares the same single download.  Only one fill per
+file runs on the host: the filler holds an ``flock`` on ``<file_id>.lock``,
+and other gunicorn workers that find it held read the same part file.  The
+lock file is deleted by whoever holds the lock when the fill ends.
+
+Once a file is complete, the ``/media`` route hands an open file object to
+the server's ``wsgi.file_wrapper``, which gunicorn sends with ``sendfile``.
+
+Recency is the data file's mtime, touched on every hit.  After each fill,
+the least recently used complete files are deleted until the cache is within
+``max_bytes`` again (part files in progress are not counted).  Entries older
+than ``ttl`` are checked against the origin's checksum and fetched again if
+the file has changed.  If the origin cannot be reached, the cached copy is
+served as it is and checked again after ``revalidate_retry`` seconds.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+MediaEntry = namedtuple("MediaEntry", ["file_id", "size", "content_type", "etag", "path", "complete"])
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+class MediaStalled(Exception):
+    pass
+
+
+class MediaCache:
+    def __init__(self, root, origin, max_bytes=2 * 1024 ** 3, max_file_bytes=None, ttl=86400.0,
+                 stall_timeout=30.0, chunk_size=256 * 1024, revalidate_retry=60.0):
+        self.root = root
+        self.origin = origin
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes or max_bytes // 4
+        self.ttl = ttl
+        self.stall_timeout = stall_timeout
+        self.chunk_size = chunk_size
+        self.revalidate_retry = revalidate_retry
+        self._filling = set()
+        # file_id -> time.time() before which a failed revalidation is not retried
+        self._revalidate_after = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "fills": 0, "failed_fills": 0, "shared_fills": 0,
+                          "revalidations": 0, "failed_revalidations": 0, "evictions": 0,
+                          "bytes_filled": 0}
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, file_id, suffix=""):
+        return os.path.join(self.root, file_id + suffix)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _read_meta(self, file_id):
+        try:
+            with open(self._path(file_id, ".json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_meta(self, file_id, meta):
+        tmp_path = self._path(file_id, f".json.{os.getpid()}.{threading.get_ident()}")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path(file_id, ".json"))
+
+    def _remove(self, file_id):
+        for suffix in ("", ".json"):
+            try:
+                os.remove(self._path(file_id, suffix))
+            except FileNotFoundError:
+                pass
+        self._remove_lock(file_id)
+
+    def _remove_lock(self, file_id):
+        """Delete a lock file left behind (e.g. by a killed worker), unless a fill holds it."""
+        try:
+            lock_file = open(self._path(file_id, ".lock"), "rb")
+        except FileNotFoundError:
+            return
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            self._release_fill_lock(file_id, lock_file)
+
+    def _acquire_fill_lock(self, file_id):
+        """The locked ``<file_id>.lock`` file, or None if another fill holds it."""
+        path = self._path(file_id, ".lock")
+        while True:
+            lock_file = open(path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return None
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(path).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            # Deleted by its holder between our open and flock: lock the current file instead
+            lock_file.close()
+
+    def _release_fill_lock(self, file_id, lock_file):
+        # Deleted while still held, so nobody can lock the old file and think it is current
+        try:
+            os.remove(self._path(file_id, ".lock"))
+        except FileNotFoundError:
+            pass
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+    @staticmethod
+    def _entry(file_id, meta, path, complete):
+        etag = meta.get("checksum") or f"{file_id}-{meta['size']}-{int(meta['fetched_at'])}"
+        return MediaEntry(file_id, meta["size"], meta["content_type"], etag, path, complete)
+
+    def open(self, file_id):
+        """A ``MediaEntry`` for the file, starting a fill on a miss.
+
+        Raises ``MediaTooLarge`` for files above ``max_file_bytes``, and the
+        origin's exceptions if it cannot describe the file.
+        """
+        meta = self._read_meta(file_id)
+        data_path = self._path(file_id)
+        if meta is not None and os.path.exists(data_path):
+            now = time.time()
+            if now - meta["fetched_at"] > self.ttl and now >= self._revalidate_after.get(file_id, 0):
+                meta = self._revalidate(file_id, meta)
+            if meta is not None:
+                try:
+                    os.utime(data_path)
+                    self._count("hits")
+                    return self._entry(file_id, meta, data_path, complete=True)
+                except FileNotFoundError:
+                    pass  # evicted just now
+        self._count("misses")
+        meta = self._ensure_fill(file_id)
+        return self._entry(file_id, meta, self._path(file_id, ".part"), complete=False)
+
+    def _revalidate(self, file_id, meta):
+        self._count("revalidations")
+        try:
+            current = self.origin.stat_media(file_id)
+        except Exception as e:
+            # A complete copy is on disk: serve it rather than fail while the origin is down
+            self._count("failed_revalidations")
+            with self._lock:
+                self._revalidate_after[file_id] = time.time() + self.revalidate_retry
+            logger.warning(f"Revalidating media '{file_id}' failed, serving the cached copy: {str(e)}")
+            return meta
+        with self._lock:
+            self._revalidate_after.pop(file_id, None)
+        if current["size"] == meta["size"] and current["checksum"] == meta["checksum"]:
+            meta = {**meta, "fetched_at": time.time()}
+            self._write_meta(file_id, meta)
+            return meta
+        logger.info(f"Media '{file_id}' changed at the origin, fetching it again")
+        self._remove(file_id)
+        return None
+
+    def _ensure_fill(self, file_id):
+        with self._lock:
+            filling = file_id in self._filling
+            if not filling:
+                self._filling.add(file_id)
+        if filling:
+            self._count("shared_fills")
+            return self._wait_for_meta(file_id)
+        try:
+            meta = self._start_fill(file_id)
+        except Exception:
+            with self._lock:
+                self._filling.discard(file_id)
+            raise
+        if meta is None:
+            # Another worker process holds the fill lock
+            with self._lock:
+                self._filling.discard(file_id)
+            self._count("shared_fills")
+            return self._wait_for_meta(file_id)
+        return meta
+
+    def _wait_for_meta(self, file_id):
+        deadline = time.monotonic() + self.stall_timeout
+        while time.monotonic() < deadline:
+            meta = self._read_meta(file_id)
+            if meta is not None:
+                return meta
+            time.sleep(0.02)
+        raise MediaStalled(f"Timed out waiting for another fill of '{file_id}' to start")
+
+    def _start_fill(self, file_id):
+        """Lock, describe and truncate the part file, then download in a thread; None if the lock is taken."""
+        lock_file = self._acquire_fill_lock(file_id)
+        if lock_file is None:
+            return None
+        try:
+            meta = self._read_meta(file_id)
+            if meta is not None and os.path.exists(self._path(file_id)):
+                # Completed by another process between our miss and the lock
+                self._release_fill_lock(file_id, lock_file)
+                with self._lock:
+                    self._filling.discard(file_id)
+                return meta
+            stat = self.origin.stat_media(file_id)
+            if stat["size"] > self.max_file_bytes:
+                raise MediaTooLarge(f"'{file_id}' is {stat['size']} bytes, the cache limit is {self.max_file_bytes}")
+            part_file = open(self._path(file_id, ".part"), "wb")
+            meta = {**stat, "fetched_at": time.time()}
+            self._write_meta(file_id, meta)
+        except Exception:
+            self._release_fill_lock(file_id, lock_file)
+            raise
+        threading.Thread(target=self._fill, args=(file_id, meta, lock_file, part_file),
+                         name=f"media-fill-{file_id}", daemon=True).start()
+        return meta
+
+    def _fill(self, file_id, meta, lock_file, part_file):
+        started = time.perf_counter()
+        part_path = self._path(file_id, ".part")
+        try:
+            with part_file:
+                self.origin.download_media(file_id, part_file)
+            size = os.path.getsize(part_path)
+            if size != meta["size"]:
+                raise IOError(f"Downloaded {size} bytes, origin reported {meta['size']}")
+            if meta["checksum"] and file_md5(part_path) != meta["checksum"]:
+                raise IOError("Checksum mismatch")
+            os.replace(part_path, self._path(file_id))
+            self._count("fills")
+            self._count("bytes_filled", size)
+            logger.info(f"Cached media '{file_id}' ({size} bytes) in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            self._count("failed_fills")
+            logger.error(f"Filling media '{file_id}' failed: {str(e)}")
+            self._remove(file_id)
+            try:
+                os.remove(part_path)
+            except FileNotFoundError:
+                pass
+        finally:
+            self._release_fill_lock(file_id, lock_file)
+            with self._lock:
+                self._filling.discard(file_id)
+        self.evict()
+
+    def read(self, entry, start, stop):
+        """Yield bytes ``[start, stop)`` of an entry, following its part file while the fill is running."""
+        try:
+            f = open(entry.path, "rb")
+        except FileNotFoundError:
+            # Fill finished and renamed the part file in the meantime
+            f = open(self._path(entry.file_id), "rb")
+        with f:
+            offset = start
+            last_progress = time.monotonic()
+            last_size = -1
+            while offset < stop:
+                available = os.fstat(f.fileno()).st_size
+                if available != last_size:
+                    # The fill is still moving, even if it has not reached this reader's range yet
+                    last_size = available
+                    last_progress = time.monotonic()
+                if available > offset:
+                    f.seek(offset)
+                    chunk = f.read(min(self.chunk_size, stop - offset, available - offset))
+                    offset += len(chunk)
+                    last_progress = time.monotonic()
+                    yield chunk
+                elif time.monotonic() - last_progress > self.stall_timeout:
+                    raise MediaStalled(f"No progress filling '{entry.file_id}' for {self.stall_timeout}s")
+                else:
+                    time.sleep(0.02)
+
+    def _complete_files(self):
+        files = []
+        with os.scandir(self.root) as it:
+            for item in it:
+                if "." not in item.name and item.is_file():
+                    stat = item.stat()
+                    files.append((stat.st_mtime, stat.st_size, item.name))
+        return files
+
+    def evict(self):
+        files = self._complete_files()
+        total = sum(size for _, size, _ in files)
+        for _, size, file_id in sorted(files):
+            if total <= self.max_bytes:
+                break
+            with self._lock:
+                if file_id in self._filling:
+                    continue
+            # Open readers keep their file descriptors; the next request fills again
+            self._remove(file_id)
+            total -= size
+            self._count("evictions")
+            logger.info(f"Evicted media '{file_id}' ({size} bytes)")
+
+    def stats(self):
+        files = self._complete_files()
+        with self._lock:
+            return {"files": len(files), "bytes": sum(size for _, size, _ in files), "max_bytes": self.max_bytes,
+                    "filling": len(self._filling), **self._counters}
+
+
+def file_md5(path, chunk_size=1024 * 1024):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
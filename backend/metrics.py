@@ -0,0 +1,203 @@
+"""Small thread-safe metric primitives shared by the service components.
+
+``SqliteMetricStore`` combines metric families across gunicorn workers: each
+process writes snapshots of its own families to a SQLite file, and a scrape
+sums them.  Counters and histograms of workers that have exited are kept, so
+the totals never go backwards; gauges only count processes that wrote
+recently.
+"""
+import bisect
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+LATENCY_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """Cumulative bucket counts keyed by upper bound, Prometheus-style."""
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+            total_count = self._count
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets, counts):
+            running += count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = total_count
+        return {"buckets": cumulative, "count": total_count, "sum": round(total_sum, 3)}
+
+
+class Counter:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def snapshot(self):
+        return self._value
+
+
+class Gauge(Counter):
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def histogram_lines(name, labels, snapshot):
+    """Prometheus text lines for one ``Histogram.snapshot()``; ``labels`` is a preformatted ``{...}`` or ''."""
+    inner = labels[1:-1] + "," if labels else ""
+    lines = [f'{name}_bucket{{{inner}le="{bound}"}} {count}' for bound, count in snapshot["buckets"].items()]
+    lines.append(f"{name}_sum{labels} {snapshot['sum']}")
+    lines.append(f"{name}_count{labels} {snapshot['count']}")
+    return lines
+
+
+class MetricFamily:
+    """A named metric whose labelled children are created on first use."""
+
+    KINDS = {"counter": Counter, "gauge": Gauge}
+
+    def __init__(self, name, help, kind, labelnames=(), buckets=LATENCY_MS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    if self.kind == "histogram":
+                        child = Histogram(self.buckets)
+                    else:
+                        child = self.KINDS[self.kind]()
+                    self._children[values] = child
+        return child
+
+    def clear(self):
+        with self._lock:
+            self._children = {}
+
+    def samples(self):
+        """``(label values, snapshot)`` for every child, sorted by label values."""
+        with self._lock:
+            children = sorted(self._children.items())
+        return [(values, child.snapshot()) for values, child in children]
+
+    def render(self, samples=None):
+        """Prometheus text lines for this family, or for ``samples`` in the format of ``samples()``."""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, snapshot in (self.samples() if samples is None else samples):
+            labels = format_labels(self.labelnames, values)
+            if self.kind == "histogram":
+                lines.extend(histogram_lines(self.name, labels, snapshot))
+            else:
+                lines.append(f"{self.name}{labels} {snapshot:g}")
+        return lines
+
+
+def render_prometheus(families):
+    return "\n".join(line for family in families for line in family.render()) + "\n"
+
+
+def _add_snapshots(total, snapshot):
+    if total is None:
+        return snapshot
+    if isinstance(snapshot, dict):
+        buckets = {bound: total["buckets"].get(bound, 0) + count for bound, count in snapshot["buckets"].items()}
+        return {"buckets": buckets, "count": total["count"] + snapshot["count"],
+                "sum": round(total["sum"] + snapshot["sum"], 3)}
+    return total + snapshot
+
+
+class SqliteMetricStore:
+    """Metric family snapshots of every worker of one server, in a SQLite file.
+
+    ``group`` identifies the server (under gunicorn, the master's pid): rows
+    left by earlier servers are deleted when the store is opened.  Each
+    process writes under its own random ID, so a restarted worker that gets
+    a reused pid does not overwrite the totals of the one it replaces.
+    """
+
+    def __init__(self, path, group, gauge_max_age=10.0):
+        self.group = str(group)
+        self.process = uuid.uuid4().hex
+        self.gauge_max_age = gauge_max_age
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS samples (grp TEXT, process TEXT, family TEXT, labels TEXT, "
+                         "value TEXT, updated REAL, PRIMARY KEY (grp, process, family, labels))")
+        self._db.execute("DELETE FROM samples WHERE grp != ?", (self.group,))
+        self._lock = threading.Lock()
+
+    def write(self, families):
+        """Replace this process's snapshot of ``families``."""
+        now = time.time()
+        rows = [(self.group, self.process, family.name, json.dumps(values), json.dumps(snapshot), now)
+                for family in families for values, snapshot in family.samples()]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def read(self, families):
+        """Samples of each of ``families`` summed over all processes, keyed by family name."""
+        kinds = {family.name: family.kind for family in families}
+        gauge_since = time.time() - self.gauge_max_age
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT family, labels, value, updated FROM samples WHERE grp = ?", (self.group,)).fetchall()
+        totals = {name: {} for name in kinds}
+        for name, labels, value, updated in rows:
+            if name not in kinds or (kinds[name] == "gauge" and updated < gauge_since):
+                continue
+            values = tuple(json.loads(labels))
+            totals[name][values] = _add_snapshots(totals[name].get(values), json.loads(value))
+        return {name: sorted(samples.items()) for name, samples in totals.items()}
+
+    def render(self, families):
+        samples = self.read(families)
+        return "\n".join(line for family in families for line in family.render(samples[family.name])) + "\n"
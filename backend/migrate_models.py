@@ -0,0 +1,73 @@
+import argparse
+import os
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+from forest_compiler import probe_inputs
+from model_reload import ModelSet, save_model_set
+from model_store import file_sha256
+from questionnaire import QuestionnaireEncoder
+
+# Legacy pickles that exist twice under models/; the first of each pair is what
+# backend/app.py has been serving.
+DUPLICATES = {
+    "pre_therapy_model": ("pre_therapy_model.pkl", "pre_therapy_model (1).pkl"),
+    "therapy_model": ("therapy_model (1).pkl", "therapy_model.pkl"),
+}
+
+
+def report_duplicates(source, conditions):
+    for name, (chosen, other) in DUPLICATES.items():
+        chosen_path, other_path = os.path.join(source, chosen), os.path.join(source, other)
+        if not os.path.exists(other_path):
+            continue
+        a, b = joblib.load(chosen_path), joblib.load(other_path)
+        if a.n_features_in_ != b.n_features_in_:
+            print(f"{name}: using '{chosen}' ({a.n_features_in_} features), ignoring '{other}' "
+                  f"({b.n_features_in_} features, not compatible with the service's inputs)")
+            continue
+        if name == "pre_therapy_model":
+            X = probe_inputs(a.n_features_in_)
+        else:
+            X = np.eye(len(conditions), dtype=np.int64)
+        agreement = float(np.mean(a.predict(X) == b.predict(X)))
+        print(f"{name}: using '{chosen}' ({file_sha256(chosen_path)[:12]}), ignoring '{other}' "
+              f"({file_sha256(other_path)[:12]}); predictions agree on {agreement:.1%} of {len(X)} probe rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the legacy model pickles into a versioned model store")
+    parser.add_argument("--source", default="models")
+    parser.add_argument("--store", default="models/store")
+    parser.add_argument("--version", default=time.strftime("%Y.%m.%d"))
+    parser.add_argument("--pre-therapy-model", default=DUPLICATES["pre_therapy_model"][0])
+    parser.add_argument("--therapy-model", default=DUPLICATES["therapy_model"][0])
+    args = parser.parse_args()
+    # The legacy models were fitted on DataFrames; the service has always passed plain arrays.
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    label_encoder = joblib.load(os.path.join(args.source, "label_encoder.pkl"))
+    conditions = list(label_encoder.classes_)
+    report_duplicates(args.source, conditions)
+
+    entries = save_model_set(
+        args.store,
+        args.version,
+        pre_therapy_model=joblib.load(os.path.join(args.source, args.pre_therapy_model)),
+        label_encoder=label_encoder,
+        therapy_model=joblib.load(os.path.join(args.source, args.therapy_model)),
+        therapy_label_encoder=joblib.load(os.path.join(args.source, "therapy_label_encoder.pkl")),
+    )
+
+    # Load and validate the new set exactly as the service will.
+    ModelSet.from_store(args.store, strict_versions=True).validate(QuestionnaireEncoder())
+    for name, entry in sorted(entries.items()):
+        print(f"{name:24s} {entry['version']:12s} {entry['size_bytes'] / 1024:9.1f} KB  "
+              f"sha256 {entry['sha256'][:12]}  mmap={entry['mmap']}")
+    print(f"Wrote manifest for {len(entries)} models to {args.store}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Named, lazily loaded models and clients.
+
+Each entry is a loader that runs the first time the entry is needed, so a
+cold process only pays for the models its first requests actually use:
+``/predict_pre_therapy`` never waits for torch, TensorFlow or Firestore.
+Concurrent first requests for the same entry share a single load.
+
+``warm_up`` loads entries ahead of time, either in the calling thread or
+in the background once the server is accepting connections.  Entries that
+hold threads, sockets or native thread pools are registered with
+``fork_safe=False`` so the preload profile can load everything else in the
+gunicorn master and leave those to each worker.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelEntry:
+    def __init__(self, name, loader, fork_safe=True):
+        self.name = name
+        self.loader = loader
+        self.fork_safe = fork_safe
+        self.value = None
+        self.loaded = False
+        self.load_seconds = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self.loaded:
+            return self.value
+        with self._lock:
+            if not self.loaded:
+                started = time.perf_counter()
+                try:
+                    self.value = self.loader()
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.load_seconds = time.perf_counter() - started
+                self.error = None
+                self.loaded = True
+                logger.info(f"Loaded '{self.name}' in {self.load_seconds:.2f}s")
+        return self.value
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._warm_thread = None
+
+    def register(self, name, loader, fork_safe=True):
+        self._entries[name] = ModelEntry(name, loader, fork_safe)
+
+    def get(self, name):
+        return self._entries[name].get()
+
+    __getitem__ = get
+
+    def peek(self, name):
+        """Return the entry's value if it is already loaded, else ``None``; never loads."""
+        entry = self._entries[name]
+        return entry.value if entry.loaded else None
+
+    def warm_up(self, names=None, fork_safe_only=False):
+        for name in names or list(self._entries):
+            entry = self._entries[name]
+            if fork_safe_only and not entry.fork_safe:
+                continue
+            try:
+                entry.get()
+            except Exception as e:
+                logger.error(f"Warm-up of '{name}' failed: {str(e)}")
+
+    def warm_up_in_background(self, names=None):
+        if self._warm_thread is None or not self._warm_thread.is_alive():
+            self._warm_thread = threading.Thread(
+                target=self.warm_up, args=(names,), name="model-warm-up", daemon=True
+            )
+            self._warm_thread.start()
+        return self._warm_thread
+
+    def stats(self):
+        return {
+            name: {
+                "loaded": entry.loaded,
+                "load_seconds": round(entry.load_seconds, 3) if entry.load_seconds is not None else None,
+                "fork_safe": entry.fork_safe,
+                "error": entry.error,
+            }
+            for name, entry in self._entries.items()
+        }
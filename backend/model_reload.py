@@ -0,0 +1,268 @@
+"""Hot-swappable set of the questionnaire and therapy models.
+
+``ModelSet`` bundles everything the prediction and recommendation routes
+read: the compiled pre-therapy forest, the condition labels and the
+condition -> environment table built from the therapy model.  A set is never
+modified after it is built, except that the sklearn forest it was compiled
+from is loaded on the first batch big enough to need it: the compiled forest
+wins up to about a thousand rows, sklearn's vectorised trees beyond that.
+
+``ModelReloader`` holds the current set.  A reload loads a complete new set
+in the calling (or a background) thread, runs it through ``validate`` and
+only then replaces the ``current`` reference.  Requests that already picked
+up the old set finish on it; later ones see the new one.  A set that fails
+to load or validate is discarded and the old one keeps serving.
+
+The reloader can poll a file signature (the store manifest, or the legacy
+pickles) so every worker process picks up new artifacts on its own, which an
+admin endpoint hitting a single worker cannot do.
+"""
+import logging
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+
+from forest_compiler import CompiledForest, probe_inputs
+from model_store import ModelStore, file_sha256
+from therapy_lookup import build_environment_table, verify_environment_table
+
+logger = logging.getLogger(__name__)
+
+# Answers every candidate model set must score before it is swapped in.
+SMOKE_RESPONSES = [
+    [5, "Yes", "No", "Yes", "High", "Medium", "No", "No", "Yes", "No", "No", 6, "Yes", 3, 4],
+    [1, "No", "No", "No", "Low", "Low", "No", "No", "No", "No", "No", 1, "No", 1, 1],
+    [10, "Yes", "Yes", "Yes", "High", "High", "Yes", "Yes", "Yes", "Yes", "Yes", 10, "Yes", 10, 10],
+    [7, "True", "False", 1, "Medium", "Poor", 0, "no", "yes", "False", "True", 3, "No", 8, 2],
+]
+
+
+class ModelSetInvalid(Exception):
+    pass
+
+
+def files_signature(paths):
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class ModelSet:
+    def __init__(self, pre_therapy_model, conditions, environment_table, versions, source, load_sklearn_model=None):
+        self.pre_therapy_model = pre_therapy_model
+        self.conditions = conditions
+        self.environment_table = environment_table
+        self.versions = versions
+        self.source = source
+        self._load_sklearn_model = load_sklearn_model
+        self._sklearn_model = None
+        self._sklearn_lock = threading.Lock()
+
+    def batch_model(self, n_rows, sklearn_min_rows):
+        """The forest to score ``n_rows`` rows with: sklearn's above ``sklearn_min_rows`` if the set has it."""
+        if n_rows <= sklearn_min_rows or self._load_sklearn_model is None:
+            return self.pre_therapy_model
+        with self._sklearn_lock:
+            if self._sklearn_model is None:
+                model = self._load_sklearn_model()
+                # Rows arrive as plain arrays in questionnaire order; skip sklearn's per-call name check warning
+                if hasattr(model, "feature_names_in_"):
+                    del model.feature_names_in_
+                self._sklearn_model = model
+        return self._sklearn_model
+
+    @classmethod
+    def from_store(cls, store_dir, strict_versions=False):
+        store = ModelStore(store_dir, strict_versions=strict_versions)
+        # Forest arrays are memory-mapped, so every worker shares one copy through the page cache
+        compiled = store.load("pre_therapy_compiled")
+        store.check_predictions("pre_therapy_compiled", compiled.predict(probe_inputs(compiled.n_features_in_)))
+        conditions = list(store.load("label_encoder").classes_)
+        therapy_model = store.load("therapy_model")
+        therapy_label_encoder = store.load("therapy_label_encoder")
+        table = build_environment_table(therapy_model, therapy_label_encoder, conditions)
+        verify_environment_table(table, therapy_model, therapy_label_encoder, conditions)
+        versions = {
+            name: store.entry(name)["version"]
+            for name in ("pre_therapy_compiled", "label_encoder", "therapy_model", "therapy_label_encoder")
+        }
+        load_sklearn_model = None
+        if "pre_therapy_model" in store.manifest["models"]:
+            load_sklearn_model = lambda: store.load("pre_therapy_model")  # noqa: E731
+        return cls(compiled, conditions, table, versions, source=store_dir, load_sklearn_model=load_sklearn_model)
+
+    @classmethod
+    def from_legacy(cls, model_path, label_encoder_path, therapy_model_path, therapy_encoder_path):
+        pre_therapy_model = joblib.load(model_path)
+        compiled = CompiledForest.from_sklearn(pre_therapy_model)
+        compiled.check_equivalent(pre_therapy_model, probe_inputs(compiled.n_features_in_))
+        conditions = list(joblib.load(label_encoder_path).classes_)
+        therapy_model = joblib.load(therapy_model_path)
+        therapy_label_encoder = joblib.load(therapy_encoder_path)
+        table = build_environment_table(therapy_model, therapy_label_encoder, conditions)
+        verify_environment_table(table, therapy_model, therapy_label_encoder, conditions)
+        # Legacy pickles have no version; label them by content.
+        versions = {
+            name: f"sha256:{file_sha256(path)[:12]}"
+            for name, path in (("pre_therapy_model", model_path), ("label_encoder", label_encoder_path),
+                               ("therapy_model", therapy_model_path), ("therapy_label_encoder", therapy_encoder_path))
+        }
+        return cls(compiled, conditions, table, versions, source="legacy",
+                   load_sklearn_model=lambda: joblib.load(model_path))
+
+    def validate(self, encoder, smoke_responses=SMOKE_RESPONSES):
+        """Raise ``ModelSetInvalid`` unless the set serves the smoke-test questionnaires end to end."""
+        n_features = self.pre_therapy_model.n_features_in_
+        if n_features != encoder.n_questions:
+            raise ModelSetInvalid(f"Model expects {n_features} features, questionnaire has {encoder.n_questions}")
+
+        matrix, errors = encoder.encode_many(smoke_responses)
+        if errors:
+            raise ModelSetInvalid(f"Smoke-test questionnaires do not encode: {errors}")
+        rows = np.concatenate([matrix, probe_inputs(n_features)])
+        indices = self.pre_therapy_model.predict(rows).astype(int)
+        if indices.min() < 0 or indices.max() >= len(self.conditions):
+            raise ModelSetInvalid(f"Predictions outside the {len(self.conditions)} known conditions")
+
+        missing = [c for c in self.conditions if not self.environment_table.get(c)]
+        if missing:
+            raise ModelSetInvalid(f"No environment for conditions {missing}")
+
+
+def save_model_set(store_dir, version, pre_therapy_model, label_encoder, therapy_model, therapy_label_encoder):
+    """Publish fitted models as ``version`` in the store and return the manifest entries written.
+
+    The forest is compiled and checked against sklearn first, and the result
+    is read back through ``ModelSet.from_store`` exactly as the service will.
+    """
+    compiled = CompiledForest.from_sklearn(pre_therapy_model)
+    probe = probe_inputs(compiled.n_features_in_)
+    compiled.check_equivalent(pre_therapy_model, probe)
+
+    store = ModelStore(store_dir)
+    entries = {
+        "pre_therapy_model": store.save("pre_therapy_model", pre_therapy_model, version),
+        "pre_therapy_compiled": store.save("pre_therapy_compiled", compiled, version, mmap=True,
+                                           probe_predictions=compiled.predict(probe)),
+        "label_encoder": store.save("label_encoder", label_encoder, version),
+        "therapy_model": store.save("therapy_model", therapy_model, version),
+        "therapy_label_encoder": store.save("therapy_label_encoder", therapy_label_encoder, version),
+    }
+    store.write_manifest()
+    return entries
+
+
+class ModelReloader:
+    def __init__(self, load, validate, signature, poll_interval=10.0):
+        self._load = load
+        self._validate = validate
+        self._signature = signature
+        self.poll_interval = poll_interval
+        self.current = None
+        self._current_signature = None
+        self._failed_signature = None
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._reloading = False
+        self._watch_thread = None
+        self.last_error = None
+        self.last_reload_at = None
+        self._counters = {"reloads": 0, "failed_reloads": 0}
+
+    def _build(self):
+        model_set = self._load()
+        self._validate(model_set)
+        return model_set
+
+    def ensure_loaded(self):
+        """Load the first model set if none is serving yet; returns the reloader."""
+        if self.current is None:
+            with self._lock:
+                if self.current is None:
+                    signature = self._signature()
+                    model_set = self._build()
+                    self._current_signature = signature
+                    self.current = model_set
+                    logger.info(f"Serving model set {self.current.versions} from {self.current.source}")
+        return self
+
+    def reload(self, reason="manual"):
+        """Build, validate and swap in a new model set; returns True if it was swapped in."""
+        with self._lock:
+            started = time.perf_counter()
+            signature = None
+            try:
+                # Read the signature first: files changing mid-load trigger another reload.
+                signature = self._signature()
+                model_set = self._build()
+            except Exception as e:
+                self._counters["failed_reloads"] += 1
+                self.last_error = f"{type(e).__name__}: {str(e)}"
+                # Not retried until the files change again
+                self._failed_signature = signature
+                logger.error(f"Model reload ({reason}) failed, keeping current models: {self.last_error}")
+                return False
+            previous = self.current
+            self.current = model_set
+            self._current_signature = signature
+            self._failed_signature = None
+            self.last_error = None
+            self.last_reload_at = time.time()
+            self._counters["reloads"] += 1
+        logger.info(f"Model reload ({reason}) swapped {previous.versions if previous else None} -> "
+                    f"{model_set.versions} in {time.perf_counter() - started:.2f}s")
+        return True
+
+    def reload_in_background(self, reason="manual"):
+        """Start a reload thread; returns False if a reload is already running."""
+        with self._state_lock:
+            if self._reloading:
+                return False
+            self._reloading = True
+
+        def run():
+            try:
+                self.reload(reason)
+            finally:
+                self._reloading = False
+
+        threading.Thread(target=run, name="model-reload", daemon=True).start()
+        return True
+
+    def _changed_on_disk(self):
+        if self.current is None:
+            return False
+        try:
+            signature = self._signature()
+        except OSError as e:
+            logger.warning(f"Cannot read model files: {str(e)}")
+            return False
+        return signature != self._current_signature and signature != self._failed_signature
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if self._changed_on_disk():
+                self.reload("files changed")
+
+    def start_watching(self):
+        if self.poll_interval > 0 and (self._watch_thread is None or not self._watch_thread.is_alive()):
+            self._watch_thread = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+            self._watch_thread.start()
+
+    def stats(self):
+        current = self.current
+        return {
+            "versions": current.versions if current else None,
+            "source": current.source if current else None,
+            "reloading": self._reloading,
+            "last_reload_at": self.last_reload_at,
+            "last_error": self.last_error,
+            "watching": self._watch_thread is not None and self._watch_thread.is_alive(),
+            **self._counters,
+        }
@@ -0,0 +1,184 @@
+"""Versioned model artifacts described by a manifest.
+
+A store is a directory holding ``manifest.json`` and one uncompressed joblib
+file per model version::
+
+    {
+      "format": 1,
+      "models": {
+        "pre_therapy_compiled": {
+          "version": "2025.06.15",
+          "file": "pre_therapy_compiled-2025.06.15.joblib",
+          "sha256": "...",
+          "class": "forest_compiler.CompiledForest",
+          "sklearn_version": "1.6.1",
+          "mmap": true,
+          "probe_sha256": "..."
+        },
+        ...
+      }
+    }
+
+Every load re-hashes the file and refuses one whose checksum does not match
+the manifest.  Entries saved with ``mmap`` are loaded with
+``mmap_mode='r'``: their NumPy arrays stay in the page cache and every worker
+maps the same physical pages instead of unpickling a private copy.  That only
+helps plain arrays (such as ``CompiledForest``); scikit-learn trees copy
+their node arrays into Cython buffers on unpickle and are loaded normally.
+
+The manifest is replaced atomically, and older version files are kept, so a
+running process can never observe a manifest that points at a half-written
+artifact.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_FORMAT = 1
+
+
+class ModelStoreError(RuntimeError):
+    pass
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def predictions_sha256(predictions):
+    """Stable fingerprint of a prediction array, used to check a model still behaves as recorded."""
+    predictions = np.ascontiguousarray(predictions)
+    digest = hashlib.sha256(predictions.dtype.str.encode())
+    digest.update(predictions.tobytes())
+    return digest.hexdigest()
+
+
+def installed_sklearn_version():
+    try:
+        import sklearn
+    except ImportError:
+        return None
+    return sklearn.__version__
+
+
+class ModelStore:
+    def __init__(self, root, strict_versions=False):
+        self.root = root
+        self.strict_versions = strict_versions
+        self.manifest = self._read_manifest()
+
+    @staticmethod
+    def exists(root):
+        return os.path.isfile(os.path.join(root, MANIFEST_NAME))
+
+    def _read_manifest(self):
+        path = os.path.join(self.root, MANIFEST_NAME)
+        if not os.path.isfile(path):
+            return {"format": MANIFEST_FORMAT, "models": {}}
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != MANIFEST_FORMAT:
+            raise ModelStoreError(f"Unsupported model store format {manifest.get('format')!r} in {path}")
+        return manifest
+
+    def reload_manifest(self):
+        self.manifest = self._read_manifest()
+
+    def entry(self, name):
+        try:
+            return self.manifest["models"][name]
+        except KeyError:
+            raise ModelStoreError(f"Model '{name}' is not in the manifest at {self.root}")
+
+    def path(self, name):
+        return os.path.join(self.root, self.entry(name)["file"])
+
+    def versions(self):
+        return {name: entry["version"] for name, entry in self.manifest["models"].items()}
+
+    def load(self, name):
+        """Load one model, verifying its checksum and recorded sklearn version."""
+        entry = self.entry(name)
+        path = os.path.join(self.root, entry["file"])
+        actual = file_sha256(path)
+        if actual != entry["sha256"]:
+            raise ModelStoreError(
+                f"Checksum mismatch for '{name}' {entry['version']}: manifest {entry['sha256'][:12]}, "
+                f"file {actual[:12]}"
+            )
+
+        if entry["class"].startswith("sklearn."):
+            installed = installed_sklearn_version()
+            if installed != entry["sklearn_version"]:
+                message = (f"'{name}' was saved with scikit-learn {entry['sklearn_version']}, "
+                           f"running {installed}")
+                if self.strict_versions:
+                    raise ModelStoreError(message)
+                logger.warning(message)
+
+        started = time.perf_counter()
+        model = joblib.load(path, mmap_mode="r" if entry.get("mmap") else None)
+        logger.info(f"Loaded '{name}' {entry['version']} from {entry['file']} "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return model
+
+    def load_file(self, path):
+        """``load`` for the entry whose artifact is ``path``; lets path-based loaders go through the store."""
+        filename = os.path.basename(path)
+        for name, entry in self.manifest["models"].items():
+            if entry["file"] == filename:
+                return self.load(name)
+        raise ModelStoreError(f"{path} is not an artifact listed in the manifest at {self.root}")
+
+    def check_predictions(self, name, predictions):
+        """Raise unless ``predictions`` match the probe fingerprint recorded for ``name``."""
+        expected = self.entry(name).get("probe_sha256")
+        if expected is None:
+            return
+        if predictions_sha256(predictions) != expected:
+            raise ModelStoreError(f"'{name}' predictions on the probe inputs differ from the manifest")
+
+    def save(self, name, model, version, mmap=False, probe_predictions=None):
+        """Write ``model`` as a new version of ``name``; ``write_manifest`` publishes it."""
+        os.makedirs(self.root, exist_ok=True)
+        filename = f"{name}-{version}.joblib"
+        path = os.path.join(self.root, filename)
+        tmp_path = f"{path}.tmp"
+        # compress=0 keeps arrays as raw, aligned bytes that mmap_mode can map.
+        joblib.dump(model, tmp_path, compress=0)
+        os.replace(tmp_path, path)
+
+        entry = {
+            "version": version,
+            "file": filename,
+            "sha256": file_sha256(path),
+            "class": f"{type(model).__module__}.{type(model).__qualname__}",
+            "sklearn_version": installed_sklearn_version(),
+            "mmap": mmap,
+            "size_bytes": os.path.getsize(path),
+        }
+        if probe_predictions is not None:
+            entry["probe_sha256"] = predictions_sha256(probe_predictions)
+        self.manifest["models"][name] = entry
+        return entry
+
+    def write_manifest(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".manifest-", suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, os.path.join(self.root, MANIFEST_NAME))
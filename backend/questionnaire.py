@@ -0,0 +1,135 @@
+"""Schema-driven encoder for the 15-answer pre-therapy questionnaire.
+
+``QuestionnaireEncoder`` is compiled once from the per-question types.  It
+groups the columns by type, precomputes lowercase lookup tables for the
+categorical and binary answers, and encodes one questionnaire or many at
+once into a float matrix.  Validation happens column-wise, with NumPy
+range checks on the numeric columns.  Error messages match the ones the
+service has always returned.
+"""
+import numpy as np
+
+EXPECTED_TYPES = [
+    "scale", "binary", "binary", "binary", "categorical",
+    "categorical", "binary", "binary", "binary", "binary",
+    "binary", "numeric", "binary", "numeric", "numeric"
+]
+
+CATEGORICAL_MAPPINGS = {
+    "High": 3, "Medium": 2, "Low": 1, "No": 0, "Yes": 1,
+    "Poor": 1, "Good": 3, "True": 1, "False": 0
+}
+
+BINARY_MAPPINGS = {"yes": 1, "true": 1, "no": 0, "false": 0}
+
+NUMERIC_RANGE = (1, 10)
+
+
+class QuestionnaireError(ValueError):
+    pass
+
+
+class QuestionnaireEncoder:
+    def __init__(self, expected_types=EXPECTED_TYPES, categorical_mappings=CATEGORICAL_MAPPINGS):
+        self.expected_types = list(expected_types)
+        self.n_questions = len(self.expected_types)
+        self.categorical_lookup = {key.lower(): value for key, value in categorical_mappings.items()}
+        self.columns = {
+            kind: [i for i, t in enumerate(self.expected_types) if t in kinds]
+            for kind, kinds in (("numeric", ("numeric", "scale")), ("categorical", ("categorical",)),
+                                ("binary", ("binary",)))
+        }
+        self.messages = {
+            "numeric": "Response at index {i} must be numeric between 1 and 10",
+            "categorical": f"Response at index {{i}} must be one of {list(categorical_mappings.keys())}",
+            "binary": "Response at index {i} must be 'Yes', 'No', 'True', 'False', 0, or 1.",
+        }
+
+    @staticmethod
+    def _numeric(value):
+        return value if isinstance(value, (int, float)) else np.nan
+
+    def _categorical(self, value):
+        return self.categorical_lookup.get(value.lower(), np.nan) if isinstance(value, str) else np.nan
+
+    @staticmethod
+    def _binary(value):
+        if isinstance(value, str):
+            return BINARY_MAPPINGS.get(value.lower(), np.nan)
+        if isinstance(value, (int, float)) and value in (0, 1):
+            return int(value)
+        return np.nan
+
+    def encode_many(self, rows):
+        """Encode a list of questionnaires.
+
+        Returns ``(matrix, errors)`` where ``matrix`` has one float32 row per
+        input and ``errors`` maps row index to the first validation message
+        for that row.  Invalid rows are left as NaN in the matrix.
+        """
+        errors = {}
+        shaped = []
+        for r, row in enumerate(rows):
+            if not isinstance(row, list):
+                errors[r] = "'responses' must be a list"
+                shaped.append([None] * self.n_questions)
+            elif len(row) != self.n_questions:
+                errors[r] = f"Expected {self.n_questions} responses, got {len(row)}"
+                shaped.append([None] * self.n_questions)
+            else:
+                shaped.append(row)
+
+        matrix = np.full((len(shaped), self.n_questions), np.nan, dtype=np.float64)
+        invalid = np.zeros((len(shaped), self.n_questions), dtype=bool)
+        converters = {"numeric": self._numeric, "categorical": self._categorical, "binary": self._binary}
+        for kind, columns in self.columns.items():
+            convert = converters[kind]
+            for i in columns:
+                matrix[:, i] = [convert(row[i]) for row in shaped]
+            block = matrix[:, columns]
+            bad = np.isnan(block)
+            if kind == "numeric":
+                low, high = NUMERIC_RANGE
+                with np.errstate(invalid="ignore"):
+                    bad |= (block < low) | (block > high)
+            invalid[:, columns] = bad
+
+        for r in np.flatnonzero(invalid.any(axis=1)):
+            if r in errors:
+                continue
+            i = int(np.argmax(invalid[r]))
+            kind = next(k for k, cols in self.columns.items() if i in cols)
+            errors[int(r)] = self.messages[kind].format(i=i)
+        return matrix.astype(np.float32), errors
+
+    def domain_violations(self, matrix):
+        """Count, per column, values in an encoded ``matrix`` that ``encode`` can never produce.
+
+        Used to check that training data lives in the same feature space the
+        service predicts on.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        allowed = {
+            "categorical": np.array(sorted(set(self.categorical_lookup.values())), dtype=np.float64),
+            "binary": np.array([0.0, 1.0]),
+        }
+        violations = {}
+        for kind, columns in self.columns.items():
+            for i in columns:
+                if kind == "numeric":
+                    low, high = NUMERIC_RANGE
+                    bad = (matrix[:, i] < low) | (matrix[:, i] > high)
+                else:
+                    bad = ~np.isin(matrix[:, i], allowed[kind])
+                if bad.any():
+                    violations[i] = int(bad.sum())
+        return violations
+
+    def encode(self, responses):
+        """Encode one questionnaire to a float32 vector, raising ``QuestionnaireError``."""
+        if not isinstance(responses, list):
+            raise QuestionnaireError("'responses' must be a list")
+        matrix, errors = self.encode_many([responses])
+        if errors:
+            raise QuestionnaireError(errors[0])
+        return matrix[0]
@@ -0,0 +1,126 @@
+"""Content-addressed LRU cache for model results keyed on normalised text.
+
+Keys are a SHA-256 of the model identifier plus the text after Unicode
+(NFKC) normalisation, case folding and whitespace collapsing, so trivially
+different spellings of the same feedback share an entry.  The in-memory tier
+is bounded both in entries and in (approximate) bytes.  An optional SQLite
+file acts as a second tier shared by every gunicorn worker on the host; it is
+wiped whenever it was written by a different model identifier.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class ResultCache:
+    def __init__(self, model_id, max_entries=10000, max_bytes=4 * 1024 * 1024, disk_path=None,
+                 max_disk_entries=200000):
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._disk = None
+        self._disk_writes = 0
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def _open_disk(self, path):
+        self._disk = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._disk.execute("PRAGMA journal_mode=WAL")
+        self._disk.execute("PRAGMA synchronous=NORMAL")
+        self._disk.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._disk.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT)")
+        row = self._disk.execute("SELECT value FROM meta WHERE name = 'model_id'").fetchone()
+        if row is None or row[0] != self.model_id:
+            logger.info(f"Result cache at {path} was built for {row[0] if row else None}, clearing for {self.model_id}")
+            self._disk.execute("BEGIN IMMEDIATE")
+            self._disk.execute("DELETE FROM results")
+            self._disk.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('model_id', ?)", (self.model_id,))
+            self._disk.execute("COMMIT")
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_id}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry[0]
+            if self._disk is not None:
+                row = self._disk.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._counters["disk_hits"] += 1
+                    value = json.loads(row[0])
+                    self._store(key, value, len(row[0]))
+                    return value
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        encoded = json.dumps(value)
+        with self._lock:
+            self._store(key, value, len(encoded))
+            if self._disk is not None:
+                self._disk.execute("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)", (key, encoded))
+                self._disk_writes += 1
+                if self._disk_writes % 1000 == 0:
+                    self._trim_disk()
+
+    def _store(self, key, value, value_size):
+        size = len(key) + value_size
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[1]
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._counters["evictions"] += 1
+
+    def _trim_disk(self):
+        # Oldest rows by insertion order go first; good enough for a shared
+        # second tier whose hot set also lives in every worker's memory.
+        self._disk.execute(
+            "DELETE FROM results WHERE rowid IN "
+            "(SELECT rowid FROM results ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM results")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+            size = self._bytes
+        lookups = counters["hits"] + counters["disk_hits"] + counters["misses"]
+        return {
+            **counters,
+            "model_id": self.model_id,
+            "entries": entries,
+            "bytes": size,
+            "hit_rate": round((counters["hits"] + counters["disk_hits"]) / lookups, 4) if lookups else 0.0,
+            "disk": self._disk is not None,
+        }
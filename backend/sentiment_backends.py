@@ -0,0 +1,72 @@
+"""Selectable inference backends for the sentiment classifier.
+
+``torch`` wraps the transformers pipeline the service has always used.
+``onnx`` serves a dynamically int8-quantized export of the same model (see
+``export_sentiment_onnx.py``) through ONNX Runtime and the standalone
+``tokenizers`` package, so neither torch nor transformers is imported.
+
+Both backends take a list of texts and return one ``{"label", "score"}`` dict
+per text, in order.
+"""
+import json
+import os
+
+import numpy as np
+
+SENTIMENT_MODEL = "distilbert-base-uncased-finetuned-sst-2-english"
+DEFAULT_ONNX_DIR = "models/sentiment_onnx"
+MAX_SEQUENCE_LENGTH = 512
+
+
+class OnnxSentimentClassifier:
+    def __init__(self, model_dir=DEFAULT_ONNX_DIR, intra_op_threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, "labels.json")) as f:
+            metadata = json.load(f)
+        self.id2label = {int(k): v for k, v in metadata["id2label"].items()}
+        self.model_id = metadata.get("model_id", SENTIMENT_MODEL)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQUENCE_LENGTH)
+        self.tokenizer.enable_padding(pad_id=metadata.get("pad_token_id", 0), pad_token=metadata.get("pad_token", "[PAD]"))
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model.quant.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def __call__(self, texts, batch_size=None, truncation=True):
+        if isinstance(texts, str):
+            texts = [texts]
+        encodings = self.tokenizer.encode_batch(list(texts))
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+        logits = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+        return [
+            {"label": self.id2label[int(label_id)], "score": float(probs[row, label_id])}
+            for row, label_id in enumerate(best)
+        ]
+
+
+def load_sentiment_classifier(backend="torch", onnx_dir=DEFAULT_ONNX_DIR):
+    if backend == "onnx":
+        return OnnxSentimentClassifier(onnx_dir)
+    if backend == "torch":
+        from transformers import pipeline
+        return pipeline("sentiment-analysis", model=SENTIMENT_MODEL)
+    raise ValueError(f"Unknown sentiment backend '{backend}', expected 'torch' or 'onnx'")
@@ -0,0 +1,132 @@
+"""JSON response encoding and ``?fields=`` response trimming.
+
+``OrjsonProvider`` is a Flask JSON provider backed by orjson, which encodes
+straight to bytes in native code.  NumPy arrays and scalars from the models are
+encoded natively, and Firestore values (timestamps with nanoseconds, geo
+points, document references) go through ``json_default``.  That function is
+shared with ``StdlibJSONProvider``, which is used when orjson is not
+installed, so both providers accept the same payloads.  Like Flask's provider,
+both sort keys, but datetimes are written as RFC 3339 rather than HTTP dates.
+
+``select_fields`` trims a payload to the comma-separated dotted paths a client
+asks for, e.g. ``environmentId,environment.title``.  A list applies the rest of
+the path to each of its items, and ``*`` matches every key of a mapping.
+"""
+import dataclasses
+import datetime
+import decimal
+import uuid
+
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(o):
+    """Encode the values neither encoder handles itself; raises ``TypeError`` for anything else."""
+    if isinstance(o, np.ndarray):
+        # orjson only takes contiguous arrays of plain dtypes natively
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, datetime.datetime):
+        if type(o) is datetime.datetime:
+            return o.isoformat()
+        # Firestore's DatetimeWithNanoseconds: its rfc3339() is pure Python, so only when the nanoseconds
+        # matter; otherwise a plain datetime, which orjson formats natively
+        if getattr(o, "nanosecond", 0) % 1000:
+            return o.rfc3339()
+        return datetime.datetime(o.year, o.month, o.day, o.hour, o.minute, o.second, o.microsecond, o.tzinfo,
+                                 fold=o.fold)
+    if isinstance(o, datetime.date):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "latitude") and hasattr(o, "longitude"):
+        # firestore GeoPoint
+        return {"latitude": o.latitude, "longitude": o.longitude}
+    if isinstance(getattr(o, "path", None), str):
+        # firestore DocumentReference
+        return o.path
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    default = staticmethod(json_default)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    default = staticmethod(json_default)
+
+    def _options(self, indent=False):
+        options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options("indent" in kwargs)).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def json_provider_class(name):
+    """``"orjson"`` (falling back to the stdlib provider if it is not installed) or ``"stdlib"``."""
+    if name == "orjson" and orjson is not None:
+        return OrjsonProvider
+    if name not in ("orjson", "stdlib"):
+        raise ValueError(f"Unknown JSON provider '{name}', expected 'orjson' or 'stdlib'")
+    return StdlibJSONProvider
+
+
+def parse_fields(spec):
+    """Field tree for a ``fields`` spec; ``None`` marks a field kept whole.  Empty or missing spec -> ``None``."""
+    if not spec:
+        return None
+    tree = {}
+    for path in spec.split(","):
+        keys = [key for key in path.strip().split(".") if key]
+        if not keys:
+            continue
+        node = tree
+        for key in keys[:-1]:
+            if key in node and node[key] is None:
+                break  # an ancestor is already kept whole
+            node = node.setdefault(key, {})
+        else:
+            node[keys[-1]] = None
+    return tree or None
+
+
+def select_fields(value, tree):
+    """``value`` restricted to the fields in ``tree`` (from ``parse_fields``)."""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [select_fields(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    selected = {}
+    for key, item in value.items():
+        if key in tree:
+            selected[key] = select_fields(item, tree[key])
+        elif "*" in tree:
+            selected[key] = select_fields(item, tree["*"])
+    return selected
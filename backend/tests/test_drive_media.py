@@ -0,0 +1,89 @@
+"""DriveMediaResolver against the local fake Drive API from bench_drive_media.py."""
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from google.auth.credentials import AnonymousCredentials  # noqa: E402
+
+from bench_drive_media import FakeDrive, web_content_link  # noqa: E402
+from drive_media import DriveMediaResolver, MediaNotFound  # noqa: E402
+
+FILE_IDS = [f"fakeDriveFile{i:04d}" for i in range(120)]
+
+
+@pytest.fixture
+def drive():
+    server = FakeDrive(FILE_IDS, latency=0.02)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def resolver_for(drive, **options):
+    return DriveMediaResolver(AnonymousCredentials(), root_url=drive.root_url, **options)
+
+
+def test_links_are_cached_until_the_ttl_expires(drive):
+    resolver = resolver_for(drive, ttl=0.5)
+    assert resolver.resolve(FILE_IDS[0]) == web_content_link(FILE_IDS[0])
+    assert resolver.resolve(FILE_IDS[0]) == web_content_link(FILE_IDS[0])
+    assert drive.counts["file_gets"] == 1
+
+    time.sleep(0.6)
+    assert resolver.resolve(FILE_IDS[0]) == web_content_link(FILE_IDS[0])
+    assert drive.counts["file_gets"] == 2
+
+
+def test_concurrent_lookups_of_one_file_make_one_drive_call(drive):
+    resolver = resolver_for(drive)
+    barrier = threading.Barrier(16)
+    results = []
+
+    def lookup():
+        barrier.wait()
+        results.append(resolver.resolve(FILE_IDS[-1]))
+
+    threads = [threading.Thread(target=lookup) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [web_content_link(FILE_IDS[-1])] * 16
+    assert drive.counts["file_gets"] == 1
+    assert resolver.stats()["coalesced"] == 15
+
+
+def test_a_list_of_ids_is_one_batch_request(drive):
+    resolver = resolver_for(drive)
+    links = resolver.resolve_many(FILE_IDS[:4])
+    assert links == {file_id: web_content_link(file_id) for file_id in FILE_IDS[:4]}
+    assert drive.counts["requests"] == 1
+    assert drive.counts["batch_requests"] == 1
+
+    # Only the uncached IDs are fetched; a missing file fails on its own
+    links = resolver.resolve_many(FILE_IDS[:8] + ["missingDriveFile"])
+    assert isinstance(links["missingDriveFile"], MediaNotFound)
+    assert all(links[file_id] == web_content_link(file_id) for file_id in FILE_IDS[:8])
+    assert drive.counts["batch_requests"] == 2
+    assert drive.counts["file_gets"] == 9
+
+
+def test_more_than_100_ids_are_split_into_batches(drive):
+    resolver = resolver_for(drive)
+    links = resolver.resolve_many(FILE_IDS[:110])
+    assert all(links[file_id] == web_content_link(file_id) for file_id in FILE_IDS[:110])
+    assert drive.counts["batch_requests"] == 2
+
+
+def test_sequential_lookups_reuse_one_pooled_connection(drive):
+    resolver = resolver_for(drive)
+    for file_id in FILE_IDS[:5]:
+        resolver.resolve(file_id)
+    resolver.resolve_many(FILE_IDS[5:10])
+    assert drive.counts["requests"] == 6
+    assert drive.counts["connections"] == 1
+    assert resolver.stats()["idle_connections"] == 1
@@ -0,0 +1,240 @@
+"""EnvironmentCatalog against an in-memory stand-in for a Firestore collection."""
+import hashlib
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from environment_catalog import HASH_FIELD, EnvironmentCatalog
+
+ENVIRONMENTS = {
+    "forest": {"title": "Peaceful Forest", "benefits": ["Reduces stress"], "duration": "20min"},
+    "ocean": {"title": "Ocean Waves", "benefits": ["Improves sleep"], "duration": "15min"},
+}
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeWatch:
+    def __init__(self):
+        self.closed = False
+
+    def unsubscribe(self):
+        self.closed = True
+
+
+class FakeCollection:
+    """The parts of a CollectionReference the catalog uses, counting reads."""
+
+    def __init__(self, docs, listen=True):
+        self.docs = {doc_id: dict(data) for doc_id, data in docs.items()}
+        self.listen = listen
+        self.callback = None
+        self.watch = None
+        self.streams = 0
+        self.gets = 0
+
+    def stream(self):
+        self.streams += 1
+        return [FakeSnapshot(doc_id, data) for doc_id, data in self.docs.items()]
+
+    def document(self, doc_id):
+        def get():
+            self.gets += 1
+            return FakeSnapshot(doc_id, self.docs.get(doc_id))
+        return SimpleNamespace(get=get)
+
+    def on_snapshot(self, callback):
+        if not self.listen:
+            raise RuntimeError("listener unavailable")
+        self.callback = callback
+        self.watch = FakeWatch()
+        # Like Firestore, the first snapshot has every document as ADDED
+        callback(None, [self._change("ADDED", doc_id, data) for doc_id, data in self.docs.items()], None)
+        return self.watch
+
+    @staticmethod
+    def _change(change_type, doc_id, data):
+        return SimpleNamespace(type=SimpleNamespace(name=change_type), document=FakeSnapshot(doc_id, data))
+
+    def write(self, doc_id, data):
+        """Change a document and deliver the change to the listener, if any."""
+        change_type = "MODIFIED" if doc_id in self.docs else "ADDED"
+        if data is None:
+            change_type = "REMOVED"
+            self.docs.pop(doc_id, None)
+        else:
+            self.docs[doc_id] = dict(data)
+        if self.callback is not None and not self.watch.closed:
+            self.callback(None, [self._change(change_type, doc_id, data)], None)
+
+
+def seeded_hash(details):
+    # Same canonical form as firebase/seed_environment.py's content_hash
+    canonical = json.dumps(details, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+@pytest.fixture
+def collection():
+    return FakeCollection(ENVIRONMENTS)
+
+
+@pytest.fixture
+def catalog(collection):
+    catalog = EnvironmentCatalog(collection, ttl=300)
+    catalog.start()
+    yield catalog
+    catalog.stop()
+
+
+def test_reads_are_served_from_memory(catalog, collection):
+    for _ in range(3):
+        assert catalog.get("forest")["title"] == "Peaceful Forest"
+    assert collection.streams == 1
+    assert collection.gets == 0
+    assert catalog.stats()["hits"] == 3
+
+
+def test_unknown_id_is_final_while_synced(catalog, collection):
+    for _ in range(3):
+        assert catalog.get("Mood Elevation") is None
+    assert collection.gets == 0
+    assert catalog.stats()["misses"] == 3
+
+
+def test_miss_is_read_once_without_listener():
+    collection = FakeCollection(ENVIRONMENTS, listen=False)
+    catalog = EnvironmentCatalog(collection, ttl=300)
+    catalog.start()
+    for _ in range(3):
+        assert catalog.get("Mood Elevation") is None
+    assert collection.gets == 1
+
+    # A reload forgets remembered misses, so documents created since are found
+    collection.docs["Mood Elevation"] = {"title": "Sunrise"}
+    catalog.reload()
+    assert catalog.get("Mood Elevation")["title"] == "Sunrise"
+    assert collection.gets == 1
+
+
+def test_document_added_while_listener_is_down_is_read_through():
+    collection = FakeCollection(ENVIRONMENTS, listen=False)
+    catalog = EnvironmentCatalog(collection, ttl=300)
+    catalog.start()
+    collection.docs["meadow"] = {"title": "Meadow"}
+    assert catalog.get("meadow")["title"] == "Meadow"
+    assert catalog.get("meadow")["title"] == "Meadow"
+    assert collection.gets == 1
+
+
+def test_listener_changes_update_documents_and_etags(catalog, collection):
+    _, forest_etag = catalog.entry("forest")
+    _, listing_etag = catalog.listing()
+
+    collection.write("forest", {**ENVIRONMENTS["forest"], "duration": "30min"})
+    doc, etag = catalog.entry("forest")
+    assert doc["duration"] == "30min"
+    assert etag != forest_etag
+    assert catalog.listing()[1] != listing_etag
+
+    collection.write("ocean", None)
+    assert catalog.get("ocean") is None
+    assert "ocean" not in catalog.listing()[0]
+
+    collection.write("meadow", {"title": "Meadow"})
+    assert catalog.get("meadow")["title"] == "Meadow"
+    assert collection.gets == 0
+
+
+def test_listener_event_clears_remembered_misses():
+    collection = FakeCollection(ENVIRONMENTS, listen=False)
+    catalog = EnvironmentCatalog(collection, ttl=300)
+    catalog.start()
+    assert catalog.get("meadow") is None
+    assert catalog.get("meadow") is None
+    assert collection.gets == 1
+    # A listener that comes back delivers the new document
+    collection.listen = True
+    catalog._subscribe()
+    collection.write("meadow", {"title": "Meadow"})
+    assert catalog.get("meadow")["title"] == "Meadow"
+    assert collection.gets == 1
+
+
+def test_content_hash_is_stripped_and_matches_etag(collection):
+    details = ENVIRONMENTS["forest"]
+    collection.docs["forest"] = {**details, HASH_FIELD: seeded_hash(details)}
+    catalog = EnvironmentCatalog(collection)
+    catalog.start()
+    doc, etag = catalog.entry("forest")
+    assert HASH_FIELD not in doc
+    assert etag == seeded_hash(details)
+
+
+def test_stale_catalog_reloads_in_background(catalog, collection):
+    collection.docs["forest"] = {"title": "Renamed Forest"}
+    catalog._last_sync -= catalog.ttl + 1
+    catalog.get("forest")  # served from the stale state, triggers the reload
+    deadline = time.monotonic() + 5
+    while collection.streams < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    while catalog.get("forest")["title"] != "Renamed Forest" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert catalog.get("forest")["title"] == "Renamed Forest"
+    assert catalog.stats()["stale_reads"] >= 1
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_quiet_listener_is_restarted_with_the_reload(catalog, collection):
+    first_watch = collection.watch
+    # No snapshot for longer than the TTL: it may have died without telling us
+    catalog._last_sync -= catalog.ttl + 1
+    catalog._listener_event -= catalog.ttl + 1
+    catalog.get("forest")
+    assert wait_for(lambda: catalog.stats()["listener_restarts"] == 1)
+    assert first_watch.closed
+    assert catalog.stats()["listener_active"]
+    assert catalog.get("Mood Elevation") is None
+    assert collection.gets == 0
+
+
+def test_failed_listener_update_makes_unknown_ids_read_through(catalog, collection):
+    broken = SimpleNamespace(id="meadow", to_dict=lambda: 1 / 0)
+    catalog._on_snapshot(None, [SimpleNamespace(type=SimpleNamespace(name="ADDED"), document=broken)], None)
+    assert not catalog.stats()["listener_active"]
+    collection.docs["meadow"] = {"title": "Meadow"}
+    assert catalog.get("meadow")["title"] == "Meadow"
+    assert collection.gets == 1
+
+
+def test_counters_are_exact_under_concurrent_reads(catalog):
+    def read():
+        for _ in range(2000):
+            catalog.get("forest")
+            catalog.get("Mood Elevation")
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = catalog.stats()
+    assert stats["hits"] == 16000
+    assert stats["misses"] == 16000
@@ -0,0 +1,104 @@
+"""MediaCache fills from a slow or failing origin, revalidation and lock file cleanup."""
+import hashlib
+import os
+import time
+
+import pytest
+
+from media_cache import MediaCache, MediaStalled
+
+CONTENT = bytes(range(256)) * 4096  # 1 MB
+
+
+class SlowOrigin:
+    """Writes ``CONTENT`` in 16 chunks over ``seconds``, or stops halfway if ``stall``."""
+
+    def __init__(self, seconds, stall=False):
+        self.seconds = seconds
+        self.stall = stall
+
+    def stat_media(self, file_id):
+        return {"size": len(CONTENT), "content_type": "video/mp4", "checksum": hashlib.md5(CONTENT).hexdigest()}
+
+    def download_media(self, file_id, fileobj):
+        chunk = len(CONTENT) // 16
+        for offset in range(0, len(CONTENT), chunk):
+            if self.stall and offset >= len(CONTENT) // 2:
+                time.sleep(self.seconds * 2)
+                raise IOError("origin went away")
+            time.sleep(self.seconds / 16)
+            fileobj.write(CONTENT[offset:offset + chunk])
+            fileobj.flush()
+
+
+def test_range_ahead_of_a_slow_fill_waits_for_it(tmp_path):
+    cache = MediaCache(str(tmp_path), SlowOrigin(seconds=3), max_bytes=8 * len(CONTENT), stall_timeout=1)
+    entry = cache.open("fakeVideoFile0001")
+    assert not entry.complete
+    body = b"".join(cache.read(entry, len(CONTENT) - 1000, len(CONTENT)))
+    assert body == CONTENT[-1000:]
+
+
+def test_fill_that_stops_growing_stalls(tmp_path):
+    cache = MediaCache(str(tmp_path), SlowOrigin(seconds=1, stall=True), max_bytes=8 * len(CONTENT),
+                       stall_timeout=0.5)
+    entry = cache.open("fakeVideoFile0002")
+    with pytest.raises(MediaStalled):
+        b"".join(cache.read(entry, len(CONTENT) - 1000, len(CONTENT)))
+
+
+class FlakyOrigin(SlowOrigin):
+    """Fills at once; ``stat_media`` fails while ``down`` is set."""
+
+    def __init__(self):
+        super().__init__(seconds=0)
+        self.down = False
+        self.stats = 0
+
+    def stat_media(self, file_id):
+        self.stats += 1
+        if self.down:
+            raise IOError("Drive lookup failed: 503")
+        return super().stat_media(file_id)
+
+
+def wait_complete(cache, file_id):
+    deadline = time.monotonic() + 10
+    while not os.path.exists(cache._path(file_id)) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    entry = cache.open(file_id)
+    assert entry.complete
+    return entry
+
+
+def test_expired_entry_is_served_while_the_origin_is_down(tmp_path):
+    origin = FlakyOrigin()
+    cache = MediaCache(str(tmp_path), origin, max_bytes=8 * len(CONTENT), ttl=0, revalidate_retry=60)
+    cache.open("fakeVideoFile0003")
+    wait_complete(cache, "fakeVideoFile0003")
+    fetched_at = cache._read_meta("fakeVideoFile0003")["fetched_at"]
+
+    origin.down = True
+    stats_before = origin.stats
+    entry = cache.open("fakeVideoFile0003")
+    assert entry.complete
+    assert b"".join(cache.read(entry, 0, len(CONTENT))) == CONTENT
+    assert cache._read_meta("fakeVideoFile0003")["fetched_at"] == fetched_at
+    # Not retried on every request until revalidate_retry has passed
+    cache.open("fakeVideoFile0003")
+    assert origin.stats == stats_before + 1
+    assert cache.stats()["failed_revalidations"] == 1
+
+
+def test_lock_files_are_removed(tmp_path):
+    cache = MediaCache(str(tmp_path), FlakyOrigin(), max_bytes=len(CONTENT), max_file_bytes=len(CONTENT))
+    cache.open("fakeVideoFile0004")
+    wait_complete(cache, "fakeVideoFile0004")
+    assert not os.path.exists(cache._path("fakeVideoFile0004", ".lock"))
+
+    # A second file pushes the first out; a lock file left by a killed worker goes with it
+    open(cache._path("fakeVideoFile0004", ".lock"), "w").close()
+    os.utime(cache._path("fakeVideoFile0004"), (0, 0))
+    cache.open("fakeVideoFile0005")
+    wait_complete(cache, "fakeVideoFile0005")
+    assert sorted(os.listdir(tmp_path)) == ["fakeVideoFile0005", "fakeVideoFile0005.json"]
@@ -0,0 +1,77 @@
+"""/metrics totals when several worker processes share a SqliteMetricStore."""
+import multiprocessing
+import re
+
+from flask import Flask
+
+from instrumentation import Instrumentation
+from metrics import MetricFamily, SqliteMetricStore
+
+
+def make_app(store_path):
+    app = Flask(__name__)
+    instrumentation = Instrumentation(app)
+    instrumentation.share(SqliteMetricStore(store_path, group="test-server"), flush_interval=60)
+
+    @app.route("/ping")
+    def ping():
+        with instrumentation.span("work"):
+            return "pong"
+
+    return app, instrumentation
+
+
+def worker(store_path, requests):
+    app, instrumentation = make_app(store_path)
+    client = app.test_client()
+    for _ in range(requests):
+        client.get("/ping")
+    client.get("/missing")
+    instrumentation.flush()
+
+
+def metric(text, line_start):
+    match = re.search("^" + re.escape(line_start) + r" (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def test_two_workers_counts_are_summed(tmp_path):
+    store_path = str(tmp_path / "metrics.sqlite3")
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=worker, args=(store_path, requests)) for requests in (3, 5)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=30)
+        assert process.exitcode == 0
+
+    # The scraping worker adds its own requests to the exited workers' totals
+    app, instrumentation = make_app(store_path)
+    app.test_client().get("/ping")
+    text = instrumentation.render()
+    assert metric(text, 'mycalmia_requests_total{route="/ping",status="200"}') == 9
+    assert metric(text, 'mycalmia_request_errors_total{route="unmatched",status="404"}') == 2
+    assert metric(text, 'mycalmia_stage_duration_ms_count{route="/ping",stage="work"}') == 9
+    assert metric(text, 'mycalmia_request_duration_ms_bucket{route="/ping",le="+Inf"}') == 9
+
+
+def test_gauges_only_count_processes_that_wrote_recently(tmp_path):
+    store_path = str(tmp_path / "metrics.sqlite3")
+    serving = MetricFamily("mycalmia_model_info", "Serving versions.", "gauge", ("model", "version"))
+    serving.labels("pre_therapy", "1").set(1)
+    SqliteMetricStore(store_path, group="test-server").write([serving])
+    store = SqliteMetricStore(store_path, group="test-server")
+    store.write([serving])
+    assert metric(store.render([serving]), 'mycalmia_model_info{model="pre_therapy",version="1"}') == 2
+
+    store.gauge_max_age = -1
+    assert metric(store.render([serving]), 'mycalmia_model_info{model="pre_therapy",version="1"}') is None
+
+
+def test_rows_of_an_earlier_server_are_dropped(tmp_path):
+    store_path = str(tmp_path / "metrics.sqlite3")
+    requests = MetricFamily("mycalmia_requests_total", "Requests.", "counter", ("route", "status"))
+    requests.labels("/ping", 200).inc(4)
+    SqliteMetricStore(store_path, group="old-master").write([requests])
+    store = SqliteMetricStore(store_path, group="new-master")
+    assert metric(store.render([requests]), 'mycalmia_requests_total{route="/ping",status="200"}') is None
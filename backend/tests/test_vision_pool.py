@@ -0,0 +1,71 @@
+"""VisionPool recovery from a worker process that dies mid-task."""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from vision_pool import Overloaded, VisionPool
+
+
+def record_start(started_dir):
+    # Stands in for building the emotion model: one file per worker process that ran its initializer
+    open(os.path.join(started_dir, str(os.getpid())), "w").close()
+
+
+class BareVisionPool(VisionPool):
+    """Worker processes without the emotion model, so plain functions can be run in them."""
+
+    def __init__(self, started_dir, **options):
+        self.started_dir = started_dir
+        super().__init__(**options)
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=record_start, initargs=(self.started_dir,))
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = BareVisionPool(str(tmp_path), workers=1, max_queue=2, route_limits={"analyze_emotion": 2})
+    yield pool
+    pool.shutdown()
+
+
+def test_crashed_worker_restarts_the_pool(pool):
+    assert pool._run("analyze_emotion", abs, -3) == 3
+
+    with pytest.raises(Overloaded) as excinfo:
+        pool._run("analyze_emotion", os._exit, 1)
+    assert excinfo.value.status_code == 503
+
+    assert pool._run("analyze_emotion", abs, -4) == 4
+    stats = pool.stats()
+    assert stats["pool_restarts"] == 1
+    assert stats["pending"] == 0
+    assert stats["in_flight"] == {"analyze_emotion": 0}
+
+
+def wait_for_started(started_dir, count, timeout=30):
+    deadline = time.monotonic() + timeout
+    while len(os.listdir(started_dir)) < count and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return set(os.listdir(started_dir))
+
+
+def test_restarted_pool_is_warmed_up(tmp_path):
+    pool = BareVisionPool(str(tmp_path), workers=2, max_queue=2)
+    try:
+        pool.warm_up()
+        first_workers = wait_for_started(tmp_path, 2)
+        assert len(first_workers) == 2
+
+        with pytest.raises(Overloaded):
+            pool._run("analyze_emotion", os._exit, 1)
+
+        # Both replacement workers run their initializer without waiting for a request
+        assert len(wait_for_started(tmp_path, 4) - first_workers) == 2
+        assert pool.stats()["pool_restarts"] == 1
+    finally:
+        pool.shutdown()
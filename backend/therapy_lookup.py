@@ -0,0 +1,34 @@
+"""Precomputed condition -> environment table for the therapy DecisionTree.
+
+The therapy model only ever sees one-hot vectors over the known conditions, so
+its whole input domain can be enumerated once: the model and label encoder
+are run over every condition when a model set is loaded and the result is
+frozen into a read-only mapping (see ``model_reload.ModelSet``).
+"""
+from types import MappingProxyType
+
+import numpy as np
+
+
+def build_environment_table(therapy_model, therapy_label_encoder, conditions):
+    """Return a read-only mapping of condition to environment ID."""
+    one_hot = np.eye(len(conditions), dtype=np.int64)
+    env_indices = np.asarray(therapy_model.predict(one_hot)).astype(int)
+    environment_ids = therapy_label_encoder.inverse_transform(env_indices)
+    return MappingProxyType({
+        condition: str(environment_id)
+        for condition, environment_id in zip(conditions, environment_ids)
+    })
+
+
+def verify_environment_table(table, therapy_model, therapy_label_encoder, conditions):
+    """Re-run the per-request inference path for every condition and raise on any disagreement."""
+    mismatches = []
+    for condition in conditions:
+        condition_encoded = [1 if c == condition else 0 for c in conditions]
+        env_index = int(therapy_model.predict([condition_encoded])[0])
+        expected = str(therapy_label_encoder.inverse_transform([env_index])[0])
+        if table.get(condition) != expected:
+            mismatches.append(f"{condition!r}: table={table.get(condition)!r} model={expected!r}")
+    if mismatches:
+        raise RuntimeError("Environment lookup table disagrees with therapy model: " + "; ".join(mismatches))
@@ -0,0 +1,199 @@
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import GridSearchCV, KFold, StratifiedKFold, cross_val_score
+from sklearn.preprocessing import LabelEncoder
+from sklearn.tree import DecisionTreeClassifier
+
+from forest_compiler import CompiledForest, probe_inputs
+from model_reload import ModelSet, save_model_set
+from questionnaire import EXPECTED_TYPES, QuestionnaireEncoder
+
+LABEL_COLUMN = "Mental_Health_Issue"
+THERAPY_COLUMN = "Therapy_Type"
+
+
+def read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def load_questionnaire(path, encoder):
+    """Return ``(X, labels, feature_names)``; columns are taken in CSV order, which is the questionnaire order."""
+    rows = read_csv(path)
+    feature_names = [name for name in rows[0] if name != LABEL_COLUMN]
+    if len(feature_names) != encoder.n_questions:
+        raise SystemExit(f"{path} has {len(feature_names)} answer columns, the questionnaire has {encoder.n_questions}")
+    # Same dtype the service predicts on (QuestionnaireEncoder output)
+    X = np.array([[float(row[name]) for name in feature_names] for row in rows], dtype=np.float32)
+    labels = np.array([row[LABEL_COLUMN] for row in rows])
+    return X, labels, feature_names
+
+
+def load_therapy(path, label_encoder):
+    """One-hot conditions (in label-encoder order, as the service builds them) -> therapy labels."""
+    rows = read_csv(path)
+    conditions = list(label_encoder.classes_)
+    unknown = sorted({row[LABEL_COLUMN] for row in rows} - set(conditions))
+    if unknown:
+        raise SystemExit(f"{path} has conditions the questionnaire data does not: {unknown}")
+    X = np.zeros((len(rows), len(conditions)), dtype=np.int64)
+    for r, row in enumerate(rows):
+        X[r, conditions.index(row[LABEL_COLUMN])] = 1
+    return X, np.array([row[THERAPY_COLUMN] for row in rows])
+
+
+def cv_splitter(y, n_splits, seed):
+    # Several conditions have a single example, which StratifiedKFold cannot split.
+    if np.bincount(y).min() >= n_splits:
+        return StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed)
+    return KFold(n_splits=n_splits, shuffle=True, random_state=seed)
+
+
+def time_per_call(fn, iterations):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def fit_forest(params, X, y, seed):
+    return RandomForestClassifier(class_weight="balanced", random_state=seed, n_jobs=1, **params).fit(X, y)
+
+
+def size_latency_report(search, X, y, seed, n_jobs, iterations):
+    """Best CV candidate per (n_estimators, max_depth), refitted and measured on the compiled serving path."""
+    best = {}
+    for params, score, std in zip(search.cv_results_["params"], search.cv_results_["mean_test_score"],
+                                  search.cv_results_["std_test_score"]):
+        key = (params["n_estimators"], params["max_depth"])
+        if key not in best or score > best[key][1]:
+            best[key] = (params, score, std)
+    keys = sorted(best, key=lambda k: (k[0], k[1] is None, k[1] or 0))
+
+    # Refit in parallel; time sequentially so measurements do not compete for cores.
+    forests = Parallel(n_jobs=n_jobs)(delayed(fit_forest)(best[key][0], X, y, seed) for key in keys)
+    rows = probe_inputs(X.shape[1], n_rows=1000)
+    report = []
+    for key, forest in zip(keys, forests):
+        params, score, std = best[key]
+        compiled = CompiledForest.from_sklearn(forest)
+        n_trees = len(compiled.roots)
+        single_s = time_per_call(lambda: compiled.predict(rows[0]), iterations)
+        batch_s = time_per_call(lambda: compiled.predict(rows), max(iterations // 100, 3))
+        array_bytes = sum(getattr(compiled, name).nbytes
+                          for name in ("feature", "threshold", "children", "value", "roots"))
+        report.append({
+            "params": params,
+            "cv_accuracy": round(float(score), 4),
+            "cv_std": round(float(std), 4),
+            "trees": n_trees,
+            "nodes": int(len(compiled.feature)),
+            "nodes_per_tree": round(len(compiled.feature) / n_trees, 1),
+            "max_depth_reached": compiled.max_depth,
+            "array_kb": round(array_bytes / 1024, 1),
+            "kb_per_tree": round(array_bytes / 1024 / n_trees, 2),
+            "single_row_us": round(single_s * 1e6, 1),
+            "us_per_tree": round(single_s * 1e6 / n_trees, 2),
+            "batch_1000_ms": round(batch_s * 1e3, 2),
+        })
+    return report
+
+
+def parse_depths(values):
+    return [None if value.lower() == "none" else int(value) for value in values]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the pre-therapy and therapy models into a model store")
+    parser.add_argument("--questionnaire-csv", default="refined_mcq_dataset.csv")
+    parser.add_argument("--therapy-csv", default="models/refined_therapy_dataset.csv")
+    parser.add_argument("--version", default=time.strftime("%Y.%m.%d"))
+    parser.add_argument("--store", help="Output store directory (default models/store-<version>); "
+                                        "pass models/store to publish to the running service")
+    parser.add_argument("--n-estimators", type=int, nargs="+", default=[25, 50, 100, 200])
+    parser.add_argument("--max-depth", nargs="+", default=["4", "8", "none"])
+    parser.add_argument("--min-samples-leaf", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--max-features", nargs="+", default=["sqrt", "log2"])
+    parser.add_argument("--cv", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Parallel fits; -1 uses every core")
+    parser.add_argument("--latency-iterations", type=int, default=500)
+    parser.add_argument("--strict-encoding", action="store_true",
+                        help="Fail if the training data has values the service's encoder can never produce")
+    args = parser.parse_args()
+    store_dir = args.store or f"models/store-{args.version}"
+
+    encoder = QuestionnaireEncoder()
+    X, labels, feature_names = load_questionnaire(args.questionnaire_csv, encoder)
+    label_encoder = LabelEncoder().fit(labels)
+    y = label_encoder.transform(labels)
+    print(f"{len(X)} questionnaires, {len(label_encoder.classes_)} conditions")
+
+    violations = encoder.domain_violations(X)
+    for i, count in sorted(violations.items()):
+        print(f"warning: {feature_names[i]} ({EXPECTED_TYPES[i]}) has {count} values outside what "
+              f"/predict_pre_therapy encodes for that answer")
+    if violations and args.strict_encoding:
+        raise SystemExit("Training data is not in the service's feature encoding")
+
+    grid = {
+        "n_estimators": args.n_estimators,
+        "max_depth": parse_depths(args.max_depth),
+        "min_samples_leaf": args.min_samples_leaf,
+        "max_features": args.max_features,
+    }
+    # Candidates x folds are fitted in parallel, one single-threaded forest per job.
+    search = GridSearchCV(
+        RandomForestClassifier(class_weight="balanced", random_state=args.seed, n_jobs=1),
+        grid, cv=cv_splitter(y, args.cv, args.seed), n_jobs=args.n_jobs, scoring="accuracy",
+    )
+    started = time.perf_counter()
+    search.fit(X, y)
+    print(f"Grid search over {len(search.cv_results_['params'])} candidates x {args.cv} folds in "
+          f"{time.perf_counter() - started:.1f}s; best {search.best_params_} "
+          f"accuracy {search.best_score_:.3f}")
+
+    therapy_X, therapy_labels = load_therapy(args.therapy_csv, label_encoder)
+    therapy_label_encoder = LabelEncoder().fit(therapy_labels)
+    therapy_y = therapy_label_encoder.transform(therapy_labels)
+    therapy_model = DecisionTreeClassifier(random_state=args.seed)
+    therapy_scores = cross_val_score(therapy_model, therapy_X, therapy_y,
+                                     cv=cv_splitter(therapy_y, args.cv, args.seed), n_jobs=args.n_jobs)
+    therapy_model.fit(therapy_X, therapy_y)
+    print(f"Therapy tree CV accuracy {therapy_scores.mean():.3f} +/- {therapy_scores.std():.3f}")
+
+    report = size_latency_report(search, X, y, args.seed, args.n_jobs, args.latency_iterations)
+    print(f"{'trees':>5s} {'depth':>5s} {'cv acc':>7s} {'nodes':>7s} {'nodes/tree':>10s} {'KB':>8s} "
+          f"{'KB/tree':>7s} {'1 row us':>9s} {'us/tree':>7s} {'1000 rows ms':>12s}")
+    for row in report:
+        depth = row["params"]["max_depth"]
+        print(f"{row['trees']:5d} {str(depth):>5s} {row['cv_accuracy']:7.3f} {row['nodes']:7d} "
+              f"{row['nodes_per_tree']:10.1f} {row['array_kb']:8.1f} {row['kb_per_tree']:7.2f} "
+              f"{row['single_row_us']:9.1f} {row['us_per_tree']:7.2f} {row['batch_1000_ms']:12.2f}")
+
+    entries = save_model_set(store_dir, args.version, search.best_estimator_, label_encoder,
+                             therapy_model, therapy_label_encoder)
+    ModelSet.from_store(store_dir, strict_versions=True).validate(encoder)
+    with open(os.path.join(store_dir, f"training_report-{args.version}.json"), "w") as f:
+        json.dump({
+            "version": args.version,
+            "best_params": search.best_params_,
+            "cv_accuracy": search.best_score_,
+            "therapy_cv_accuracy": float(therapy_scores.mean()),
+            "encoding_violations": {feature_names[i]: count for i, count in violations.items()},
+            "size_latency": report,
+            "artifacts": {name: entry["sha256"] for name, entry in entries.items()},
+        }, f, indent=2)
+    print(f"Wrote {len(entries)} models as version {args.version} to {store_dir}")
+
+
+if __name__ == "__main__":
+    main()
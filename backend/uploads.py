@@ -0,0 +1,141 @@
+"""Reading image uploads from Flask requests with a size cap and minimal copying.
+
+Three encodings are accepted, chosen by ``Content-Type``:
+
+* ``multipart/form-data`` with an ``image`` file part (what the mobile app sends);
+* ``application/octet-stream`` or ``image/*`` raw bodies, read straight from
+  the WSGI stream into one preallocated buffer;
+* ``application/json`` with a base64 ``image`` field, kept for older clients.
+
+The declared ``Content-Length`` is checked against the cap before any body
+bytes are read, so oversized uploads are refused without being buffered.
+"""
+import base64
+import binascii
+import io
+
+from image_preprocessing import ImageTooLarge, InvalidImage
+
+# Room for multipart boundaries and part headers on top of the image itself.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UnsupportedMediaType(ValueError):
+    status_code = 415
+
+
+class LengthRequired(ValueError):
+    status_code = 411
+
+
+def _check_declared_length(request, limit):
+    if request.content_length is None:
+        raise LengthRequired("Content-Length header is required for image uploads")
+    if request.content_length > limit:
+        raise ImageTooLarge(f"Upload is {request.content_length} bytes, limit is {limit}")
+
+
+def read_stream_exact(stream, length):
+    """Read exactly ``length`` bytes from ``stream`` into a single bytearray."""
+    buf = bytearray(length)
+    view = memoryview(buf)
+    received = 0
+    # gunicorn sets wsgi.input_terminated, so werkzeug hands over its raw Body, which only has read()
+    readinto = getattr(stream, "readinto", None)
+    while received < length:
+        if readinto is not None:
+            count = readinto(view[received:])
+        else:
+            chunk = stream.read(length - received)
+            count = len(chunk)
+            view[received:received + count] = chunk
+        if not count:
+            raise InvalidImage(f"Upload ended after {received} of {length} bytes")
+        received += count
+    return buf
+
+
+def _file_buffer(file_storage, max_bytes):
+    stream = file_storage.stream
+    if isinstance(stream, io.BytesIO):
+        # Small parts are parsed into memory; expose them without copying.
+        buf = stream.getbuffer()
+    else:
+        stream.seek(0, io.SEEK_END)
+        size = stream.tell()
+        if size > max_bytes:
+            raise ImageTooLarge(f"Image is {size} bytes, limit is {max_bytes}")
+        stream.seek(0)
+        buf = read_stream_exact(stream, size)
+    if len(buf) > max_bytes:
+        raise ImageTooLarge(f"Image is {len(buf)} bytes, limit is {max_bytes}")
+    return buf
+
+
+def _decode_base64(encoded, max_bytes):
+    if not isinstance(encoded, str):
+        raise InvalidImage("'image' must be a base64 string")
+    if len(encoded) * 3 // 4 > max_bytes:
+        raise ImageTooLarge(f"Image exceeds {max_bytes} bytes")
+    try:
+        return base64.b64decode(encoded)
+    except (binascii.Error, ValueError):
+        raise InvalidImage("'image' is not valid base64")
+
+
+def read_image_upload(request, max_bytes, field="image"):
+    """Return the encoded image bytes of a single-image upload as a bytes-like object."""
+    mimetype = request.mimetype
+    if mimetype == "multipart/form-data":
+        _check_declared_length(request, max_bytes + MULTIPART_OVERHEAD_BYTES)
+        if field not in request.files:
+            raise InvalidImage(f"Missing '{field}' file in multipart payload")
+        return _file_buffer(request.files[field], max_bytes)
+    if mimetype == "application/octet-stream" or mimetype.startswith("image/"):
+        _check_declared_length(request, max_bytes)
+        return read_stream_exact(request.stream, request.content_length)
+    if mimetype == "application/json":
+        # base64 inflates by a third; the JSON envelope adds a little more.
+        _check_declared_length(request, max_bytes * 4 // 3 + MULTIPART_OVERHEAD_BYTES)
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or field not in data:
+            raise InvalidImage(f"Missing '{field}' key in JSON payload")
+        return _decode_base64(data[field], max_bytes)
+    raise UnsupportedMediaType(
+        f"Unsupported Content-Type '{mimetype}', expected multipart/form-data, "
+        "application/octet-stream, image/* or application/json"
+    )
+
+
+def read_image_uploads(request, max_bytes, max_images, field="images"):
+    """Return a list of encoded image buffers from a multi-image upload.
+
+    Accepts multipart/form-data with repeated ``images`` file parts, or JSON
+    with an ``images`` list of base64 strings.  ``max_bytes`` applies to each
+    image.
+    """
+    mimetype = request.mimetype
+    if mimetype == "multipart/form-data":
+        _check_declared_length(request, max_images * (max_bytes + MULTIPART_OVERHEAD_BYTES))
+        files = request.files.getlist(field)
+        encoded = None
+    elif mimetype == "application/json":
+        _check_declared_length(request, max_images * (max_bytes * 4 // 3 + MULTIPART_OVERHEAD_BYTES))
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get(field), list):
+            raise InvalidImage(f"'{field}' must be a list of base64 strings")
+        files = None
+        encoded = data[field]
+    else:
+        raise UnsupportedMediaType(
+            f"Unsupported Content-Type '{mimetype}', expected multipart/form-data or application/json"
+        )
+
+    count = len(files) if files is not None else len(encoded)
+    if count == 0:
+        raise InvalidImage(f"No '{field}' provided")
+    if count > max_images:
+        raise ImageTooLarge(f"Got {count} images, limit is {max_images} per request")
+    if files is not None:
+        return [_file_buffer(f, max_bytes) for f in files]
+    return [_decode_base64(item, max_bytes) for item in encoded]
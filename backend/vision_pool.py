@@ -0,0 +1,231 @@
+"""Process pool for CPU-bound vision inference with admission control.
+
+TensorFlow inference inside a request thread holds the worker's cores and,
+under load, starves the cheap model routes served by the same process.
+``VisionPool`` moves emotion analysis into dedicated worker processes that
+each build an ``EmotionAnalyzer`` once at start-up.
+
+Admission is checked before work is queued:
+
+* each route has its own in-flight limit; exceeding it raises ``Overloaded``
+  with status 429;
+* the pool as a whole accepts ``workers + max_queue`` outstanding tasks;
+  beyond that ``Overloaded`` carries status 503.
+
+Rejections are immediate, so a saturated vision pool never holds request
+threads that the light endpoints need.  With ``workers=0`` the same
+interface runs inference in the calling thread.
+
+A worker process that dies (a TensorFlow crash, the OOM killer) breaks the
+whole ``ProcessPoolExecutor``.  The request that finds it broken gets
+``Overloaded`` with status 503 and the executor is replaced.  The new
+workers are started and build their models in the background, so the
+requests after the crash do not pay for it inline.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from emotion import PIPELINE_STAGES, EmotionAnalyzer
+from metrics import LATENCY_MS_BUCKETS, Histogram
+
+logger = logging.getLogger(__name__)
+
+_worker_analyzer = None
+
+
+class Overloaded(Exception):
+    def __init__(self, message, status_code, retry_after=1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _init_worker(analyzer_options):
+    global _worker_analyzer
+    _worker_analyzer = EmotionAnalyzer(**analyzer_options)
+
+
+def _ping():
+    return _worker_analyzer is not None
+
+
+def _analyze_encoded(buf):
+    timings = {}
+    dominant_emotion, emotion_scores = _worker_analyzer.analyze_encoded(buf, timings)
+    return dominant_emotion, emotion_scores, timings
+
+
+def _analyze_encoded_batch(buffers):
+    timings = {}
+    results = _worker_analyzer.analyze_encoded_batch(buffers, timings)
+    return results, timings
+
+
+class VisionPool:
+    def __init__(self, workers=2, max_queue=16, route_limits=None, timeout=30.0, **analyzer_options):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.route_limits = dict(route_limits or {})
+        self.timeout = timeout
+        self.analyzer_options = analyzer_options
+        self.max_image_bytes = analyzer_options.get("max_image_bytes")
+        self.stage_ms = {stage: Histogram(LATENCY_MS_BUCKETS) for stage in PIPELINE_STAGES}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._in_flight = {route: 0 for route in self.route_limits}
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected_route": 0, "rejected_queue": 0,
+                          "pool_restarts": 0}
+        self._executor = None
+        self._local_analyzer = None
+        self._start()
+
+    def _new_executor(self):
+        # spawn, not fork: TensorFlow and gRPC do not survive fork().
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.analyzer_options,),
+        )
+
+    def _start(self):
+        if self.workers > 0:
+            self._executor = self._new_executor()
+        else:
+            self._local_analyzer = EmotionAnalyzer(**self.analyzer_options)
+
+    def _restart(self, broken):
+        """Replace ``broken`` with a new executor, unless another request already has."""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            executor = self._executor = self._new_executor()
+            self._counters["pool_restarts"] += 1
+        logger.error("A vision worker process died, restarted the vision pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+        threading.Thread(target=self._warm_up_restarted, args=(executor,), name="vision-pool-warm-up",
+                         daemon=True).start()
+
+    def _warm_up_restarted(self, executor):
+        try:
+            self._warm(executor)
+        except Exception as e:
+            # The next request finds the pool broken again and restarts it
+            logger.error(f"Warming up the restarted vision pool failed: {str(e)}")
+
+    def _warm(self, executor):
+        # Each new process runs the initializer, building its models, before its first task
+        futures = [executor.submit(_ping) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+        logger.info(f"Vision pool ready with {self.workers} worker processes")
+
+    def warm_up(self):
+        """Start every worker process now so the first requests do not pay the model build."""
+        if self._executor is not None:
+            self._warm(self._executor)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _admit(self, route):
+        with self._lock:
+            limit = self.route_limits.get(route)
+            if limit is not None and self._in_flight.get(route, 0) >= limit:
+                self._counters["rejected_route"] += 1
+                raise Overloaded(f"Too many concurrent '{route}' requests", 429)
+            if self._pending >= max(self.workers, 1) + self.max_queue:
+                self._counters["rejected_queue"] += 1
+                raise Overloaded("Vision workers are saturated, try again shortly", 503)
+            self._pending += 1
+            self._in_flight[route] = self._in_flight.get(route, 0) + 1
+            self._counters["submitted"] += 1
+
+    def _release(self, route, failed):
+        with self._lock:
+            self._pending -= 1
+            self._in_flight[route] -= 1
+            self._counters["failed" if failed else "completed"] += 1
+
+    def _observe(self, timings):
+        for stage, elapsed_ms in timings.items():
+            self.stage_ms[stage].observe(elapsed_ms)
+
+    def _run(self, route, fn, *args):
+        self._admit(route)
+        if self._executor is None:
+            failed = True
+            try:
+                result = fn(*args)
+                failed = False
+                return result
+            finally:
+                self._release(route, failed)
+
+        executor = self._executor
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._release(route, True)
+            self._restart(executor)
+            raise Overloaded("Vision workers are restarting, try again shortly", 503, retry_after=5)
+        # Release on completion rather than when the caller stops waiting, so
+        # timed-out work still counts against the pool until it really ends.
+        future.add_done_callback(lambda f: self._release(route, f.cancelled() or f.exception() is not None))
+        try:
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise Overloaded("A vision worker crashed, try again shortly", 503, retry_after=5)
+
+    def analyze_encoded(self, route, buf):
+        """Return ``(dominant_emotion, emotion_scores, timings)`` for one encoded image."""
+        if self._executor is None:
+            fn = self._local_analyze_encoded
+        else:
+            fn = _analyze_encoded
+            buf = bytes(buf)
+        dominant_emotion, emotion_scores, timings = self._run(route, fn, buf)
+        self._observe(timings)
+        return dominant_emotion, emotion_scores, timings
+
+    def analyze_encoded_batch(self, route, buffers):
+        """Return ``(results, timings)``; see ``EmotionAnalyzer.analyze_encoded_batch``."""
+        if self._executor is None:
+            fn = self._local_analyze_encoded_batch
+        else:
+            fn = _analyze_encoded_batch
+            buffers = [bytes(buf) for buf in buffers]
+        results, timings = self._run(route, fn, buffers)
+        self._observe(timings)
+        return results, timings
+
+    def _local_analyze_encoded(self, buf):
+        timings = {}
+        dominant_emotion, emotion_scores = self._local_analyzer.analyze_encoded(buf, timings)
+        return dominant_emotion, emotion_scores, timings
+
+    def _local_analyze_encoded_batch(self, buffers):
+        timings = {}
+        return self._local_analyzer.analyze_encoded_batch(buffers, timings), timings
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+            in_flight = dict(self._in_flight)
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": max(0, pending - max(self.workers, 1)),
+            "pending": pending,
+            "in_flight": in_flight,
+            "route_limits": self.route_limits,
+            "detector_backend": self.analyzer_options.get("detector_backend"),
+            "stage_ms": {stage: histogram.snapshot() for stage, histogram in self.stage_ms.items()},
+        }
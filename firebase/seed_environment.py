@@ -1,9 +1,29 @@
+"""Sync the ``environments`` collection with ``env_data`` below.
+
+Each document stores a SHA-256 of its canonical JSON content in
+``_contentHash``.  A run reads every existing hash in one projection query,
+then writes only the environments that are new or changed and deletes the
+ones no longer listed here, through a ``BulkWriter`` that commits batches
+in parallel.  An unchanged catalog costs one query and no writes.
+
+    python seed_environment.py --dry-run      # print the diff, write nothing
+    python seed_environment.py                # apply it
+    python seed_environment.py --emulator localhost:8080   # against the Firestore emulator
+
+Run from ``backend/`` (or pass ``--credentials``) so the default key path resolves.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
 import firebase_admin
 from firebase_admin import credentials, firestore
 
-cred = credentials.Certificate('../firebase/mental-health-app-68c4b-firebase-adminsdk-fbsvc-18a9b4b239.json')
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+HASH_FIELD = '_contentHash'
+DEFAULT_CREDENTIALS = '../firebase/mental-health-app-68c4b-firebase-adminsdk-fbsvc-18a9b4b239.json'
+DEFAULT_PROJECT = 'mental-health-app-68c4b'
 
 env_data = {
     'forest': {
@@ -196,6 +216,108 @@ env_data = {
    
 }
 
-for env_id, details in env_data.items():
-    db.collection('environments').document(env_id).set(details)
-print("Environments seeded to Firestore")
\ No newline at end of file
+
+def content_hash(details):
+    canonical = json.dumps(details, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def read_hashes(collection):
+    """``{env_id: stored hash or None}`` for every document, in one query that returns only the hash field."""
+    return {doc.id: (doc.to_dict() or {}).get(HASH_FIELD) for doc in collection.select([HASH_FIELD]).stream()}
+
+
+def plan_sync(desired, existing, delete_removed=True):
+    hashes = {env_id: content_hash(details) for env_id, details in desired.items()}
+    return {
+        'create': sorted(env_id for env_id in desired if env_id not in existing),
+        'update': sorted(env_id for env_id in desired if env_id in existing and existing[env_id] != hashes[env_id]),
+        'delete': sorted(env_id for env_id in existing if env_id not in desired) if delete_removed else [],
+        'unchanged': sorted(env_id for env_id in desired if existing.get(env_id) == hashes[env_id]),
+        'hashes': hashes,
+    }
+
+
+def changed_fields(old, new):
+    old = {key: value for key, value in old.items() if key != HASH_FIELD}
+    return sorted(key for key in old.keys() | new.keys() if old.get(key) != new.get(key))
+
+
+def print_report(db, collection, plan, desired):
+    print(f"{len(plan['create'])} to create, {len(plan['update'])} to update, "
+          f"{len(plan['delete'])} to delete, {len(plan['unchanged'])} unchanged")
+    for env_id in plan['create']:
+        print(f"  + {env_id}")
+    if plan['update']:
+        # Full documents only for the changed ones, fetched in one batched read
+        refs = [collection.document(env_id) for env_id in plan['update']]
+        current = {snapshot.id: snapshot.to_dict() or {} for snapshot in db.get_all(refs)}
+        for env_id in plan['update']:
+            print(f"  ~ {env_id}: {', '.join(changed_fields(current.get(env_id, {}), desired[env_id])) or 'hash only'}")
+    for env_id in plan['delete']:
+        print(f"  - {env_id}")
+
+
+def apply_plan(db, collection, plan, desired, max_attempts=5, max_ops_per_second=500):
+    """Write the plan with a parallel BulkWriter; returns the env IDs whose writes finally failed."""
+    from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions, SendMode
+
+    failed = []
+
+    def on_error(failure, bulk_writer):
+        env_id = failure.operation.reference.id
+        if failure.attempts < max_attempts:
+            return True
+        print(f"  ! {env_id}: {failure.message}")
+        failed.append(env_id)
+        return False
+
+    writer = db.bulk_writer(BulkWriterOptions(initial_ops_per_second=max_ops_per_second,
+                                              max_ops_per_second=max_ops_per_second, mode=SendMode.parallel))
+    writer.on_write_error(on_error)
+    for env_id in plan['create'] + plan['update']:
+        writer.set(collection.document(env_id), {**desired[env_id], HASH_FIELD: plan['hashes'][env_id]})
+    for env_id in plan['delete']:
+        writer.delete(collection.document(env_id))
+    writer.close()
+    return failed
+
+
+def connect(args):
+    if args.emulator:
+        # The Firestore client talks to the emulator, with no credentials, when this is set
+        os.environ['FIRESTORE_EMULATOR_HOST'] = args.emulator
+        firebase_admin.initialize_app(options={'projectId': args.project})
+    else:
+        firebase_admin.initialize_app(credentials.Certificate(args.credentials), {'projectId': args.project})
+    return firestore.client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync Firestore environments with env_data, writing only changes")
+    parser.add_argument('--dry-run', action='store_true', help="Print the diff without writing")
+    parser.add_argument('--keep-removed', action='store_true',
+                        help="Do not delete documents that are no longer in env_data")
+    parser.add_argument('--collection', default='environments')
+    parser.add_argument('--credentials', default=DEFAULT_CREDENTIALS)
+    parser.add_argument('--project', default=DEFAULT_PROJECT)
+    parser.add_argument('--emulator', metavar='HOST:PORT', help="Sync against the Firestore emulator")
+    parser.add_argument('--max-ops-per-second', type=int, default=500)
+    args = parser.parse_args()
+
+    db = connect(args)
+    collection = db.collection(args.collection)
+    started = time.perf_counter()
+    plan = plan_sync(env_data, read_hashes(collection), delete_removed=not args.keep_removed)
+    print_report(db, collection, plan, env_data)
+    if args.dry_run:
+        return
+    failed = apply_plan(db, collection, plan, env_data, max_ops_per_second=args.max_ops_per_second)
+    writes = len(plan['create']) + len(plan['update']) + len(plan['delete'])
+    print(f"Synced {args.collection}: {writes - len(failed)} writes in {time.perf_counter() - started:.2f}s")
+    if failed:
+        raise SystemExit(f"{len(failed)} writes failed: {', '.join(sorted(failed))}")
+
+
+if __name__ == '__main__':
+    main()